@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Benchmark the available JSON decoding backends, with and without field projection and line
+prefiltering, for each of the report aggregators. Lines are read into memory first, so that 
+only decoding and aggregation are timed.
+
+Sample usage:
+python benchmarks/bench_decode.py -r 20 sample/sample-tweets-500.jsonl
+"""
+import os, sys, time
+from optparse import OptionParser
+import logging as log
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jsonltools.engine import iter_lines
+from jsonltools.decoding import Decoder, available_backends
+from jsonltools.aggregators import REPORTS
+from prettytable import PrettyTable
+
+# --------------------------------------------------------------
+
+def run( lines, names, backend, prefilter, repeats ):
+	start = time.perf_counter()
+	for i in range(repeats):
+		aggregators = [ REPORTS[name]() for name in names ]
+		decode = Decoder( aggregators, backend = backend, prefilter = prefilter )
+		for l in lines:
+			tweet = decode(l)
+			if tweet is None:
+				continue
+			for agg in aggregators:
+				agg.apply( tweet )
+	return time.perf_counter() - start
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] json_file")
+	parser.add_option("-r", "--repeats", action="store", type="int", dest="repeats", help="number of passes over the data for each measurement", default=10)
+	(options, args) = parser.parse_args()	
+	if( len(args) != 1 ):
+		parser.error( "Must specify one JSONL file" )
+	log.basicConfig(level=20, format='%(message)s')
+
+	lines = [ l.strip() for l in iter_lines(args[0]) if len(l.strip()) > 0 ]
+	num_bytes = sum( len(l) for l in lines )
+	log.info("Loaded %d lines (%.1f MB) from %s" % ( len(lines), num_bytes/1e6, args[0] ) )
+	
+	tab = PrettyTable( ["Report", "Backend", "Prefilter", "Lines/sec", "MB/sec", "Speedup"] )
+	for col in ["Lines/sec", "MB/sec", "Speedup"]:
+		tab.align[col] = "r"
+	for name in REPORTS:
+		# baseline is the standard json module without prefiltering
+		baseline = None
+		for backend in ["json"] + [ b for b in available_backends() if b != "json" ]:
+			for prefilter in ( False, True ):
+				if prefilter and REPORTS[name].prefilter is None:
+					continue
+				elapsed = run( lines, [name], backend, prefilter, options.repeats )
+				if baseline is None:
+					baseline = elapsed
+				total = len(lines) * options.repeats
+				tab.add_row( [ name, backend, "yes" if prefilter else "no", "%.0f" % (total/elapsed), 
+					"%.1f" % (num_bytes*options.repeats/elapsed/1e6), "%.2fx" % (baseline/elapsed) ] )
+	log.info(tab)
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
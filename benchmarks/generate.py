@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Generate a reproducible synthetic JSONL file of tweets or user profiles, with the same structure
+as data retrieved from the Twitter API, for benchmarking the tools at scale. Hashtags, mentions and
+authors follow Zipf distributions, a proportion of tweets are retweets with a nested original tweet,
+and a proportion of lines can be deliberately malformed.
+
+Sample usage:
+python benchmarks/generate.py -n 1000000 -o bench-tweets.jsonl
+python benchmarks/generate.py -n 100000 --users -o bench-users.jsonl.gz
+"""
+import random, string, itertools, time, gzip
+from functools import lru_cache
+from optparse import OptionParser
+import logging as log
+try:
+	import orjson
+	def dumps( obj ):
+		return orjson.dumps( obj )
+except ImportError:
+	import json
+	def dumps( obj ):
+		return json.dumps( obj, separators=(",", ":") ).encode("utf-8")
+
+DAYS = [ "Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun" ]
+MONTHS = [ "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec" ]
+LANGS = [ "en", "es", "fr", "und", "de", "pt", "ja", "ar", "it", "ga" ]
+LANG_WEIGHTS = [ 70, 8, 5, 5, 3, 3, 2, 2, 1, 1 ]
+WORDS = [ "the", "vote", "today", "senate", "house", "bill", "great", "news", "state", "people", "health", "care",
+	"jobs", "tax", "reform", "support", "families", "rally", "debate", "election", "watch", "live", "thank", "you" ]
+
+# --------------------------------------------------------------
+
+def twitter_date( epoch ):
+	t = time.gmtime( epoch )
+	return "%s %s %02d %02d:%02d:%02d +0000 %d" % ( DAYS[t.tm_wday], MONTHS[t.tm_mon-1], t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_year )
+
+def zipf_weights( n, s ):
+	""" Cumulative weights for ranks 1..n of a Zipf distribution with exponent s. """
+	return list( itertools.accumulate( 1.0 / (k ** s) for k in range(1, n + 1) ) )
+
+@lru_cache(maxsize=1 << 18)
+def make_user( rank ):
+	""" A user profile, which is the same every time a user appears, as it depends only on the rank. """
+	r = random.Random( rank )
+	screen_name = "user%d_%s" % ( rank, "".join( r.choices( string.ascii_lowercase, k=4 ) ) )
+	return {
+		"id" : 10000000 + rank, "id_str" : str(10000000 + rank), "screen_name" : screen_name,
+		"name" : "User %d %s" % ( rank, screen_name[-4:].title() ), "location" : r.choice( [ "Dublin, Ireland", "Washington, DC", "", "Ohio" ] ),
+		"description" : " ".join( r.choices( WORDS, k=r.randint(0, 20) ) ), "url" : "https://t.co/%08d" % rank,
+		"protected" : False, "verified" : r.random() < 0.05, "followers_count" : int( 1e6 / (rank ** 0.8) ),
+		"friends_count" : r.randint(0, 5000), "listed_count" : r.randint(0, 500), "favourites_count" : r.randint(0, 20000),
+		"statuses_count" : r.randint(10, 100000), "created_at" : twitter_date( 1200000000 + r.randint(0, 250000000) ),
+		"utc_offset" : -18000, "time_zone" : "Eastern Time (US & Canada)", "geo_enabled" : r.random() < 0.3, "lang" : "en",
+		"contributors_enabled" : False, "is_translator" : False, "profile_background_color" : "C0DEED",
+		"profile_background_image_url" : "http://abs.twimg.com/images/themes/theme1/bg.png",
+		"profile_background_image_url_https" : "https://abs.twimg.com/images/themes/theme1/bg.png",
+		"profile_background_tile" : False, "profile_link_color" : "0084B4", "profile_sidebar_border_color" : "C0DEED",
+		"profile_sidebar_fill_color" : "DDEEF6", "profile_text_color" : "333333", "profile_use_background_image" : True,
+		"profile_image_url" : "http://pbs.twimg.com/profile_images/%d/photo_normal.jpg" % rank,
+		"profile_image_url_https" : "https://pbs.twimg.com/profile_images/%d/photo_normal.jpg" % rank,
+		"profile_banner_url" : "https://pbs.twimg.com/profile_banners/%d/1466000000" % rank,
+		"default_profile" : False, "default_profile_image" : False, "following" : None, "follow_request_sent" : None, "notifications" : None,
+	}
+
+class Generator:
+	def __init__( self, options ):
+		self.rand = random.Random( options.seed )
+		self.options = options
+		rand = self.rand
+		self.num_users = options.num_users
+		self.user_weights = zipf_weights( self.num_users, options.author_zipf )
+		self.mention_weights = zipf_weights( self.num_users, options.mention_zipf )
+		self.tags = [ "".join( rand.choices( string.ascii_lowercase, k=rand.randint(3, 14) ) ) for j in range(options.num_hashtags) ]
+		self.tag_weights = zipf_weights( len(self.tags), options.hashtag_zipf )
+		self.next_id = 700000000000000000
+		self.epoch = 1464739200
+
+	def tweet( self, nested = False ):
+		rand, options = self.rand, self.options
+		self.next_id += rand.randint(1, 5000000)
+		self.epoch += rand.random() < options.burst and 0 or rand.randint(0, 2)
+		author = make_user( rand.choices( range(1, self.num_users + 1), cum_weights=self.user_weights )[0] )
+		num_tags = min( int( rand.expovariate( 1.0 / options.hashtags_per_tweet ) ), 10 )
+		tags = rand.choices( self.tags, cum_weights=self.tag_weights, k=num_tags )
+		num_mentions = min( int( rand.expovariate( 1.0 / options.mentions_per_tweet ) ), 10 )
+		mentioned = [ make_user(rank) for rank in rand.choices( range(1, self.num_users + 1), cum_weights=self.mention_weights, k=num_mentions ) ]
+		words = rand.choices( WORDS, k=rand.randint(3, 18) )
+		text = " ".join( [ "@" + u["screen_name"] for u in mentioned ] + words + [ "#" + t for t in tags ] )
+		has_url = rand.random() < 0.45
+		tweet = {
+			"created_at" : twitter_date( self.epoch ), "id" : self.next_id, "id_str" : str(self.next_id), "text" : text[:140],
+			"source" : "<a href=\"http://twitter.com/download/iphone\" rel=\"nofollow\">Twitter for iPhone</a>", "truncated" : False,
+			"in_reply_to_status_id" : None, "in_reply_to_status_id_str" : None, "in_reply_to_user_id" : None,
+			"in_reply_to_user_id_str" : None, "in_reply_to_screen_name" : None, "user" : author,
+			"geo" : None, "coordinates" : None, "place" : None, "contributors" : None, "is_quote_status" : False,
+			"retweet_count" : rand.randint(0, 500), "favorite_count" : rand.randint(0, 1000),
+			"entities" : {
+				"hashtags" : [ { "text" : t, "indices" : [0, len(t) + 1] } for t in tags ],
+				"symbols" : [], "user_mentions" : [ { "screen_name" : u["screen_name"], "name" : u["name"], "id" : u["id"],
+					"id_str" : u["id_str"], "indices" : [0, len(u["screen_name"]) + 1] } for u in mentioned ],
+				"urls" : [ { "url" : "https://t.co/abcdefgh", "expanded_url" : "http://example.com/%d" % self.next_id,
+					"display_url" : "example.com/%d" % self.next_id, "indices" : [117, 140] } ] if has_url else [],
+			},
+			"favorited" : False, "retweeted" : False, "possibly_sensitive" : False, "filter_level" : "low",
+			"lang" : rand.choices( LANGS, weights=LANG_WEIGHTS )[0], "timestamp_ms" : str( self.epoch * 1000 ),
+		}
+		if rand.random() < options.reply_rate and len(mentioned) > 0:
+			tweet["in_reply_to_user_id"] = mentioned[0]["id"]
+			tweet["in_reply_to_user_id_str"] = mentioned[0]["id_str"]
+			tweet["in_reply_to_screen_name"] = mentioned[0]["screen_name"]
+			tweet["in_reply_to_status_id"] = self.next_id - rand.randint(1, 10**9)
+		if rand.random() < options.geo_rate:
+			point = [ rand.uniform(-90, 90), rand.uniform(-180, 180) ]
+			tweet["geo"] = { "type" : "Point", "coordinates" : point }
+			tweet["coordinates"] = { "type" : "Point", "coordinates" : point[::-1] }
+		if not nested and rand.random() < options.retweet_rate:
+			original = self.tweet( nested = True )
+			tweet["retweeted_status"] = original
+			tweet["text"] = ( "RT @%s: %s" % ( original["user"]["screen_name"], original["text"] ) )[:140]
+			tweet["entities"]["hashtags"] = original["entities"]["hashtags"]
+			tweet["entities"]["user_mentions"] = [ { "screen_name" : original["user"]["screen_name"], "name" : original["user"]["name"],
+				"id" : original["user"]["id"], "id_str" : original["user"]["id_str"], "indices" : [3, 10] } ] + original["entities"]["user_mentions"]
+		return tweet
+
+	def line( self, users = False ):
+		if users:
+			obj = make_user( self.rand.randint(1, self.num_users) )
+		else:
+			obj = self.tweet()
+		l = dumps( obj )
+		if self.rand.random() < self.options.malformed_rate:
+			# truncate the line, as happens when a collector is interrupted
+			l = l[: self.rand.randint(1, len(l) - 1) ]
+		return l
+
+# --------------------------------------------------------------
+
+def option_parser():
+	parser = OptionParser(usage="usage: %prog [options]")
+	parser.add_option("-n", "--lines", action="store", type="int", dest="num_lines", help="number of lines to generate", default=1000000)
+	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path, compressed with gzip if it ends with .gz", default="bench-tweets.jsonl")
+	parser.add_option("--users", action="store_true", dest="users", help="generate user profiles rather than tweets")
+	parser.add_option("--seed", action="store", type="int", dest="seed", help="random seed", default=1)
+	parser.add_option("--num-users", action="store", type="int", dest="num_users", help="number of distinct users", default=100000)
+	parser.add_option("--num-hashtags", action="store", type="int", dest="num_hashtags", help="number of distinct hashtags", default=50000)
+	parser.add_option("--hashtag-zipf", action="store", type="float", dest="hashtag_zipf", help="Zipf exponent for hashtag frequencies", default=1.1)
+	parser.add_option("--mention-zipf", action="store", type="float", dest="mention_zipf", help="Zipf exponent for mentioned users", default=1.2)
+	parser.add_option("--author-zipf", action="store", type="float", dest="author_zipf", help="Zipf exponent for tweet authors", default=0.9)
+	parser.add_option("--hashtags-per-tweet", action="store", type="float", dest="hashtags_per_tweet", help="mean number of hashtags per tweet", default=0.8)
+	parser.add_option("--mentions-per-tweet", action="store", type="float", dest="mentions_per_tweet", help="mean number of mentions per tweet", default=0.9)
+	parser.add_option("--retweet-rate", action="store", type="float", dest="retweet_rate", help="proportion of tweets which are retweets", default=0.35)
+	parser.add_option("--reply-rate", action="store", type="float", dest="reply_rate", help="proportion of tweets which are replies", default=0.06)
+	parser.add_option("--geo-rate", action="store", type="float", dest="geo_rate", help="proportion of tweets which are geotagged", default=0.01)
+	parser.add_option("--burst", action="store", type="float", dest="burst", help="probability that a tweet has the same timestamp as the previous one", default=0.5)
+	parser.add_option("--malformed-rate", action="store", type="float", dest="malformed_rate", help="proportion of lines which are malformed", default=0.0005)
+	return parser
+
+def main():
+	(options, args) = option_parser().parse_args()
+	log.basicConfig(level=20, format='%(message)s')
+
+	gen = Generator( options )
+	log.info("Writing %d synthetic %s to %s ..." % ( options.num_lines, "users" if options.users else "tweets", options.out_path ) )
+	opener = gzip.open if options.out_path.endswith(".gz") else open
+	with opener( options.out_path, "wb" ) as fout:
+		for i in range(options.num_lines):
+			fout.write( gen.line( options.users ) )
+			fout.write( b"\n" )
+			if (i+1) % 100000 == 0:
+				log.info("Generated %d lines" % (i+1) )
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
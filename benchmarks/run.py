@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Benchmark the main path of every tool on a synthetic (or existing) tweet file. Each tool is run
+as a separate process to measure its end-to-end time, lines/sec, MB/sec and peak memory usage.
+The read, decode, aggregate and output phases are then timed in-process, by running the same
+pipeline one stage at a time. Results are saved as JSON, and can be compared against the
+results from a previous version to find regressions.
+
+Sample usage:
+python benchmarks/run.py -n 1000000 -o results.json
+python benchmarks/run.py --tweets bench-tweets.jsonl --users bench-users.jsonl -t stats,cooccur --baseline old-results.json
+"""
+import os, sys, time, json, shutil, tempfile, subprocess, platform
+from optparse import OptionParser
+import logging as log
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+from jsonltools.engine import iter_lines, process_lines
+from jsonltools.decoding import Decoder, available_backends
+from jsonltools.aggregators import REPORTS
+from generate import Generator, option_parser
+
+# tool name -> script, extra arguments ({out} is replaced by an output path), reports used, input
+TOOLS = {
+	"stats" : ( "jsonl-tweet-stats.py", [], ["stats"], "tweets" ),
+	"stats-timeseries" : ( "jsonl-tweet-stats.py", ["--timeseries", "{out}.csv"], ["stats"], "tweets" ),
+	"authors" : ( "jsonl-tweet-authors.py", [], ["authors"], "tweets" ),
+	"mentions" : ( "jsonl-tweet-mentions.py", [], ["mentions"], "tweets" ),
+	"hashtags" : ( "jsonl-tweet-hashtags.py", [], ["hashtags"], "tweets" ),
+	"cooccur" : ( "jsonl-hashtag-cooccur.py", ["-o", "{out}.csv"], ["cooccur"], "tweets" ),
+	"cooccur-graph" : ( "jsonl-hashtag-cooccur.py", ["-o", "{out}.npz", "-n", "10", "--neighbours-out", "{out}-neighbours.csv"], ["cooccur"], "tweets" ),
+	"network" : ( "jsonl-tweet-network.py", ["-o", "{out}.csv"], None, "tweets" ),
+	"report" : ( "jsonl-tweet-report.py", ["-o", "{out}.csv"], list(REPORTS), "tweets" ),
+	"tweet-export" : ( "jsonl-tweet-export.py", ["-o", "{out}.csv"], None, "tweets" ),
+	"user-export" : ( "jsonl-user-export.py", ["-o", "{out}.csv"], None, "users" ),
+	"index" : ( "jsonl-tweet-index.py", [], None, "tweets" ),
+}
+PHASES = [ "read", "decode", "aggregate", "output" ]
+
+# --------------------------------------------------------------
+
+# A forked child inherits the peak RSS of its parent on Linux, which would include the memory used
+# by the benchmark itself, so each tool is started from a small launcher process which reports the
+# exit status and peak RSS of the tool alone.
+LAUNCHER = """
+import os, sys, subprocess
+proc = subprocess.Popen( sys.argv[1:], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL )
+pid, status, usage = os.wait4( proc.pid, 0 )
+print( os.WEXITSTATUS( status ) if os.WIFEXITED( status ) else -1, usage.ru_maxrss )
+"""
+
+def run_tool( script, args ):
+	""" Run a tool in a child process, returning its wall time in seconds and peak RSS in MB. """
+	cmd = [ sys.executable, os.path.join( ROOT_DIR, script ) ] + args
+	start = time.perf_counter()
+	output = subprocess.check_output( [ sys.executable, "-c", LAUNCHER ] + cmd )
+	elapsed = time.perf_counter() - start
+	returncode, maxrss = [ int(x) for x in output.split() ]
+	if returncode != 0:
+		raise RuntimeError("%s exited with status %d" % ( " ".join(cmd), returncode ) )
+	# ru_maxrss is in KB on Linux, and bytes on macOS
+	scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+	return elapsed, maxrss / scale
+
+def timed( f, *args ):
+	start = time.perf_counter()
+	result = f( *args )
+	return time.perf_counter() - start, result
+
+def read_all( path ):
+	num_lines, num_bytes = 0, 0
+	for l in iter_lines( path ):
+		num_bytes += len(l)
+		if len(l.strip()) > 0:
+			num_lines += 1
+	return num_lines, num_bytes
+
+def decode_all( path, decode ):
+	for l in iter_lines( path ):
+		l = l.strip()
+		if len(l) == 0:
+			continue
+		try:
+			decode(l)
+		except Exception:
+			pass
+
+def measure_phases( path, reports, out_prefix ):
+	""" Time each phase of the pipeline in-process. Each measurement includes all of the earlier
+	phases, so the time for a phase is the difference from the previous measurement. """
+	read_time, counts = timed( read_all, path )
+	if reports is None:
+		# export tools decode the complete tweet with the standard json module
+		decode_time = timed( decode_all, path, json.loads )[0]
+		return { "read" : read_time, "decode" : max( decode_time - read_time, 0 ) }
+	aggregators = [ REPORTS[name]() for name in reports ]
+	decode_time = timed( decode_all, path, Decoder( aggregators ) )[0]
+	aggregate_time = timed( process_lines, iter_lines(path), aggregators )[0]
+	start = time.perf_counter()
+	for agg in aggregators:
+		if hasattr( agg, "write" ):
+			agg.write( out_prefix + ".csv" )
+		agg.report()
+	output_time = time.perf_counter() - start
+	return { "read" : read_time, "decode" : max( decode_time - read_time, 0 ),
+		"aggregate" : max( aggregate_time - decode_time, 0 ), "output" : output_time }
+
+def benchmark( name, path, work_dir, repeats ):
+	script, args, reports, kind = TOOLS[name]
+	out_prefix = os.path.join( work_dir, name )
+	args = [ a.replace( "{out}", out_prefix ) for a in args ] + [ path ]
+	# keep the fastest of the repeated runs, and the largest peak memory usage
+	elapsed, peak_rss = None, 0
+	for i in range(repeats):
+		t, rss = run_tool( script, args )
+		elapsed = t if elapsed is None else min( elapsed, t )
+		peak_rss = max( peak_rss, rss )
+	log.disable( log.CRITICAL )
+	try:
+		phases = measure_phases( path, reports, out_prefix )
+	finally:
+		log.disable( log.NOTSET )
+	if reports is None:
+		# the remainder of the run is spent on extracting and writing rows, plus process startup
+		phases["output"] = max( elapsed - phases["read"] - phases["decode"], 0 )
+	return { "script" : script, "seconds" : elapsed, "peak_rss_mb" : peak_rss, "phases" : phases }
+
+# --------------------------------------------------------------
+
+def generate( path, num_lines, users, seed ):
+	options = option_parser().parse_args( [ "-n", str(num_lines), "--seed", str(seed) ] )[0]
+	gen = Generator( options )
+	with open( path, "wb" ) as fout:
+		for i in range(num_lines):
+			fout.write( gen.line( users ) )
+			fout.write( b"\n" )
+
+def data_info( path ):
+	num_lines, num_bytes = read_all( path )
+	return { "path" : os.path.abspath(path), "lines" : num_lines, "bytes" : num_bytes }
+
+def git_version():
+	try:
+		return subprocess.check_output( [ "git", "-C", ROOT_DIR, "describe", "--always", "--dirty" ], stderr=subprocess.DEVNULL ).decode().strip()
+	except Exception:
+		return None
+
+def compare( results, baseline_path ):
+	""" Log the change in lines/sec for each tool relative to a previous set of results. """
+	from prettytable import PrettyTable
+	with open( baseline_path, "r" ) as fin:
+		baseline = json.load( fin )
+	tab = PrettyTable( ["Tool", "Baseline lines/sec", "Lines/sec", "Change", "Baseline RSS (MB)", "RSS (MB)"] )
+	for col in tab.field_names[1:]:
+		tab.align[col] = "r"
+	for name, result in results["tools"].items():
+		if not name in baseline["tools"]:
+			continue
+		old = baseline["tools"][name]
+		change = 100.0 * ( result["lines_per_sec"] / old["lines_per_sec"] - 1 )
+		tab.add_row( [ name, "%.0f" % old["lines_per_sec"], "%.0f" % result["lines_per_sec"], "%+.1f%%" % change,
+			"%.1f" % old["peak_rss_mb"], "%.1f" % result["peak_rss_mb"] ] )
+	log.info("Compared with %s (version %s):" % ( baseline_path, baseline.get("version") ) )
+	log.info(tab)
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options]")
+	parser.add_option("-n", "--lines", action="store", type="int", dest="num_lines", help="number of synthetic tweets to generate, if no input files are specified", default=100000)
+	parser.add_option("--tweets", action="store", type="string", dest="tweets_path", help="existing JSONL file of tweets to use instead of synthetic data", default=None)
+	parser.add_option("--users", action="store", type="string", dest="users_path", help="existing JSONL file of users to use instead of synthetic data", default=None)
+	parser.add_option("-t", "--tools", action="store", type="string", dest="tools", help="comma-separated list of tools to run, from: %s" % ", ".join(TOOLS), default=",".join(TOOLS))
+	parser.add_option("-r", "--repeats", action="store", type="int", dest="repeats", help="number of runs of each tool, of which the fastest is kept", default=1)
+	parser.add_option("--seed", action="store", type="int", dest="seed", help="random seed for synthetic data", default=1)
+	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path for JSON results", default="bench-results.json")
+	parser.add_option("--baseline", action="store", type="string", dest="baseline_path", help="JSON results from a previous run to compare against", default=None)
+	(options, args) = parser.parse_args()
+	log.basicConfig(level=20, format='%(message)s')
+	names = [ x.strip() for x in options.tools.split(",") if len(x.strip()) > 0 ]
+	for name in names:
+		if not name in TOOLS:
+			parser.error( "Unknown tool '%s'" % name )
+
+	work_dir = tempfile.mkdtemp( prefix="jsonl-bench-" )
+	try:
+		paths = { "tweets" : options.tweets_path, "users" : options.users_path }
+		for kind in paths:
+			if paths[kind] is None:
+				paths[kind] = os.path.join( work_dir, "synthetic-%s.jsonl" % kind )
+				num_lines = options.num_lines if kind == "tweets" else max( options.num_lines // 10, 1 )
+				log.info("Generating %d synthetic %s ..." % ( num_lines, kind ) )
+				generate( paths[kind], num_lines, kind == "users", options.seed )
+		data = { kind : data_info( paths[kind] ) for kind in paths }
+		results = { "version" : git_version(), "timestamp" : time.strftime( "%Y-%m-%dT%H:%M:%SZ", time.gmtime() ),
+			"python" : platform.python_version(), "platform" : platform.platform(), "cpus" : os.cpu_count(),
+			"backends" : available_backends(), "data" : data, "tools" : {} }
+		for name in names:
+			kind = TOOLS[name][3]
+			# do not remove an index which existed before the benchmark
+			indexed = os.path.exists( paths[kind] + ".idx" )
+			log.info("Running %s on %s ..." % ( name, paths[kind] ) )
+			result = benchmark( name, paths[kind], work_dir, options.repeats )
+			result["lines_per_sec"] = data[kind]["lines"] / result["seconds"]
+			result["mb_per_sec"] = data[kind]["bytes"] / result["seconds"] / 1e6
+			results["tools"][name] = result
+			log.info("%s: %.2f sec, %.0f lines/sec, %.1f MB/sec, peak RSS %.1f MB (%s)" % ( name, result["seconds"],
+				result["lines_per_sec"], result["mb_per_sec"], result["peak_rss_mb"],
+				", ".join( "%s %.2f sec" % ( phase, result["phases"][phase] ) for phase in PHASES if phase in result["phases"] ) ) )
+			if name == "index" and not indexed:
+				for suffix in ( ".idx", ".idx.posts" ):
+					if os.path.exists( paths[kind] + suffix ):
+						os.remove( paths[kind] + suffix )
+	finally:
+		shutil.rmtree( work_dir, ignore_errors=True )
+
+	log.info("Writing results to %s" % options.out_path )
+	with open( options.out_path, "w" ) as fout:
+		json.dump( results, fout, indent=2, sort_keys=True )
+	if not options.baseline_path is None:
+		compare( results, options.baseline_path )
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
@@ -3,18 +3,25 @@
 Generate a list of hashtag cooccurrence frequencies for one or more JSONL files, where each line contains a JSON-formatted tweet 
 as retrieved from the Twitter API.
 
+The cooccurrences can also be written as a sparse matrix over hashtag ids, either in the .npz format
+used by scipy.sparse or as a binary edge list, together with a vocabulary file of the hashtags.
+
 Sample usage:
 python jsonl-hashtag-cooccur.py sample/sample-tweets-500.jsonl -o hashtag-cooccurrences.csv
+python jsonl-hashtag-cooccur.py sample/sample-tweets-500.jsonl -o hashtag-cooccurrences.npz -n 10
+python jsonl-hashtag-cooccur.py big-*.jsonl.gz -m 1024 --checkpoint checkpoints --resume
 """
-import sys, fileinput, itertools, operator, codecs
-from collections import defaultdict
 from optparse import OptionParser
 import logging as log
-try:
-	import ujson as json 
-except:
-	import json
-from prettytable import PrettyTable
+from jsonltools.engine import process_file
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.aggregators import CooccurrenceCounter
+from jsonltools.state import save_state, merge_states
+from jsonltools.pairs import memory_to_pairs
+from jsonltools.graph import GRAPH_FORMATS, write_neighbours
+from jsonltools.checkpoint import add_checkpoint_options, check_checkpoint_options, checkpointer_from_options, selection_settings
 
 # --------------------------------------------------------------
 
@@ -22,78 +29,86 @@ def main():
 	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
 	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top pairs to display", default=10)
 	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path", default="hashtag-cooccurrences.csv")
+	parser.add_option("-f", "--format", action="store", type="choice", choices=GRAPH_FORMATS, dest="format", help="output format, one of %s (default is based on the output path extension, otherwise csv)" % ", ".join(GRAPH_FORMATS), default=None)
+	parser.add_option("-n", "--neighbours", action="store", type="int", dest="neighbours", help="also write this number of top neighbours of each hashtag, with PMI and Jaccard weights (requires NumPy)", default=0)
+	parser.add_option("--neighbours-out", action="store", type="string", dest="neighbours_path", help="output path for top neighbours", default="hashtag-neighbours.csv")
+	parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="number of worker processes to use for each file (default is 1)", default=1)
+	parser.add_option("--save-state", action="store", type="string", dest="state_path", help="save the aggregate state for all input files to the specified path", default=None)
+	parser.add_option("--merge-state", action="store_true", dest="merge_state", help="treat the input files as saved state files, and report on their merged totals")
+	parser.add_option("-m", "--memory", action="store", type="float", dest="memory", help="approximate memory budget in MB for pair counts, beyond which counts are spilled to disk", default=None)
+	parser.add_option("-a", "--approx", action="store", type="int", dest="approx", help="only track approximate counts for this number of the most frequent pairs", default=0)
+	parser.add_option("--spill-dir", action="store", type="string", dest="spill_dir", help="directory for temporary spill files (default is the system temporary directory)", default=None)
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_metrics_options( parser )
+	add_checkpoint_options( parser )
 	(options, args) = parser.parse_args()	
 	if( len(args) < 1 ):
 		parser.error( "Must specify at least one JSONL file" )
+	check_checkpoint_options( parser, options, args )
+	if options.merge_state and not options.checkpoint_dir is None:
+		parser.error( "Checkpoints cannot be made when merging state files" )
 	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+
+	if options.merge_state:
+		try:
+			counter = merge_states( args, ["cooccur"] )["cooccur"]
+		except ( ValueError, OSError ) as e:
+			parser.error( str(e) )
+		log.info("Total of %d unique pairs of hashtags" % counter.num_pairs() )
+		with metrics.stage("output"):
+			write_output( counter, options )
+		metrics.finish()
+		return
 
 	# Count pairs of hashtags in the same tweet
-	pair_counts = defaultdict(int)
-	for tweets_path in args:
+	max_pairs = None if options.memory is None else memory_to_pairs( options.memory )
+	counter = CooccurrenceCounter( max_pairs, options.approx, options.spill_dir )
+	settings = { "tool" : "cooccur", "approx" : options.approx, "selection" : selection_settings( options ) }
+	checkpointer = checkpointer_from_options( options, args, settings, lambda directory : counter.checkpoint_state( directory ) )
+	first_file, offset = 0, 0
+	if not checkpointer is None and options.resume:
+		try:
+			checkpoint = checkpointer.load()
+		except ValueError as e:
+			parser.error( str(e) )
+		if not checkpoint is None:
+			first_file, offset, state = checkpoint
+			counter = CooccurrenceCounter.from_checkpoint( state )
+			log.info("Resuming from checkpoint at byte %d of file %d with %d tweets processed" % ( offset, first_file + 1, counter.num_tweets ) )
+	for file_index, tweets_path in enumerate( args ):
+		if file_index < first_file:
+			continue
 		log.info("Loading tweets from %s ..." % tweets_path)
-		# Process every line as JSON data
-		hashtags = {}
-		num_tweets, num_failed, line_number = 0, 0, 0
-		num_multiple = 0
-		for l in fileinput.input(tweets_path):
-			l = l.strip()
-			if len(l) == 0:
-				continue
-			try:
-				line_number += 1
-				tweet = json.loads(l)
-				tweet_tags = set()
-				# find the tags
-				if "entities" in tweet:
-					if "hashtags" in tweet["entities"] and len(tweet["entities"]["hashtags"]) > 0:
-						for tag in tweet["entities"]["hashtags"]:
-							tweet_tags.add( "#" + tag["text"].lower().strip() )
-				# do not count duplicates
-				tweet_tags = list(tweet_tags)
-				# process the pairs
-				if len(tweet_tags) > 1:
-					num_multiple += 1
-					for p in itertools.combinations(tweet_tags, 2):
-						if p[0] < p[1]:
-							pair = frozenset( [p[0],p[1]] )
-						else:
-							pair = frozenset( [p[1],p[0]] )
-						pair_counts[pair] += 1
-				num_tweets += 1
-				if line_number % 50000 == 0:
-					log.info("Processed %d lines" % line_number)
-			except Exception as e:
-				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
-				num_failed += 1
-		fileinput.close()
+		num_tweets, num_multiple = counter.num_tweets, counter.num_multiple
+		if checkpointer is None:
+			process_file( tweets_path, [counter], options.workers, selection, metrics, dedupe )
+		else:
+			checkpointer.process_file( file_index, tweets_path, [counter], options.workers, selection, metrics,
+				offset if file_index == first_file else 0 )
+		num_tweets, num_multiple = counter.num_tweets - num_tweets, counter.num_multiple - num_multiple
 		log.info("Processed %d tweets from file" % num_tweets )
 		log.info("%d/%d tweets in file contained more than one hashtag" % ( num_multiple, num_tweets ) )
-	log.info("Total of %d unique pairs of hashtags" % len(pair_counts) )
-
-	# Output pairs
-	log.info("Writing pairs to %s ..." % options.out_path )
-	fout = codecs.open( options.out_path, "w", encoding="utf-8", errors="ignore" )
-	fout.write("Hashtag1\tHastag2\tCount\n")
-	for p in pair_counts:
-		pair = list(p)
-		pair.sort()
-		fout.write( "%s\t%s\t%d\n" % ( pair[0], pair[1], pair_counts[p] )  )
-	fout.close()
+	log.info("Total of %d unique pairs of hashtags" % counter.num_pairs() )
+	with metrics.stage("output"):
+		if not options.state_path is None:
+			save_state( options.state_path, { "cooccur" : counter } )
+		# Output pairs and display top counts
+		write_output( counter, options )
+	if not checkpointer is None:
+		checkpointer.finish()
+	metrics.finish()
 
-	# Display top counts
-	sx = sorted(pair_counts.items(), key=operator.itemgetter(1), reverse=True)
-	log.info("Top %d co-occurring hashtag pairs:" % min( len(sx), options.top ) )
-	tab = PrettyTable( ["Hashtag1", "Hashtag2", "Count"] )
-	tab.align["Hashtag1"] = "l"
-	tab.align["Hashtag2"] = "l"
-	tab.align["Count"] = "r"
-	for i, p in enumerate(sx):
-		if i > options.top:
-			break
-		pair = list(p[0])
-		pair.sort()
-		tab.add_row( [pair[0], pair[1], p[1]] )
-	log.info(tab)		
+def write_output( counter, options ):
+	graph = counter.write( options.out_path, options.format )
+	counter.report( options.top, graph )
+	if options.neighbours > 0:
+		if graph is None:
+			graph = counter.graph()
+		write_neighbours( graph, options.neighbours_path, options.neighbours, ( "Hashtag", "Neighbour" ) )
 
 # --------------------------------------------------------------
 
@@ -1,37 +1,35 @@
 #!/usr/bin/env python
 """
-A very simple script to export tweets from a JSONL file in CSV format.
+A very simple script to export tweets from a JSONL file in CSV format, or in a columnar
+NumPy (.npz) or Parquet format.
 
 Sample usage:
 python jsonl-tweet-export.py sample/sample-tweets-500.jsonl -o sample/sample-tweets.csv
+python jsonl-tweet-export.py sample/sample-tweets-500.jsonl -o sample/sample-tweets.parquet
+python jsonl-tweet-export.py big-*.jsonl.gz -o tweets.csv --checkpoint checkpoints --resume
 """
-import sys, fileinput, codecs, re
-from datetime import datetime
+import time
 from optparse import OptionParser
 import logging as log
 try:
 	import ujson as json 
 except:
 	import json
-from prettytable import PrettyTable
+from jsonltools.engine import iter_lines
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.columnar import FORMATS, format_for_path, open_writer
+from jsonltools.csvwriter import CsvWriter
+from jsonltools.timeparse import twitter_epoch, format_twitter_date
+from jsonltools.normalise import screen_name, clean_field
+from jsonltools.checkpoint import add_checkpoint_options, check_checkpoint_options, checkpointer_from_options, selection_settings
 
 # --------------------------------------------------------------
 
-def parse_twitter_date( s, ignore_time_zones = True ):
-	# hack for cases where timezone is not supported by Python strptime 
-	if ignore_time_zones:
-		parts = s.split(" ")
-		smodified =" ".join( parts[0:4] + [ parts[-1] ] )
-		return  datetime.strptime(smodified,'%a %b %d %H:%M:%S %Y')
-	return datetime.strptime(s,'%a %b %d %H:%M:%S %z %Y')
-
 def fmt_id( x ):
 	return '"%s"' % x
 
-def norm( s, sep ):
-	s = s.replace(sep, " ")
-	return re.sub("\s+", " ", s )
-
 # --------------------------------------------------------------
 
 def main():
@@ -39,43 +37,116 @@ def main():
 	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top authors to display", default=10)
 	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path for CSV file", default="tweets.csv")
 	parser.add_option("-s", action="store", type="string", dest="separator", help="separator character for output file (default is comma)", default=",")
+	parser.add_option("-f", "--format", action="store", type="choice", choices=FORMATS, dest="format", help="output format, one of %s (default is based on the output path extension, otherwise csv)" % ", ".join(FORMATS), default=None)
+	parser.add_option("-q", "--quote", action="store_true", dest="quote", help="use standard CSV quoting for text values, rather than replacing separators and whitespace")
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_metrics_options( parser )
+	add_checkpoint_options( parser )
 	(options, args) = parser.parse_args()	
 	if( len(args) < 1 ):
 		parser.error( "Must specify at least one JSONL file" )
+	check_checkpoint_options( parser, options, args )
 	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+	clock, stages = time.perf_counter, metrics.stages
 	sep = options.separator
 
 	log.info("Tweets will be written to %s ..." % options.out_path )
 	header = ["Tweet_ID", "Created_At", "Author_Screen_Name", "Author_Id", "Text" ]
 
-	fout = codecs.open( options.out_path, "w", encoding="utf-8", errors="ignore" )
-	fout.write("%s\n" % sep.join(header) )
+	# columnar formats store typed values, rather than formatted strings
+	fmt = options.format or format_for_path( options.out_path )
+	if fmt != "csv" and not options.checkpoint_dir is None:
+		parser.error( "Checkpoints can only be made when exporting to CSV" )
+	# a checkpoint records the size of the output file, which is truncated to that size on resuming
+	settings = { "tool" : "export", "out_path" : options.out_path, "separator" : sep, "quote" : options.quote,
+		"selection" : selection_settings( options ) }
+	checkpointer = checkpointer_from_options( options, args, settings, lambda directory : ( { "bytes" : writer.sync(), "rows" : writer.num_rows }, [] ) )
+	checkpoint = None
+	if not checkpointer is None and options.resume:
+		try:
+			checkpoint = checkpointer.load()
+		except ValueError as e:
+			parser.error( str(e) )
+	first_file, offset = 0, 0
+	if fmt == "csv" and not checkpoint is None:
+		first_file, offset, state = checkpoint
+		log.info("Resuming from checkpoint at byte %d of file %d with %d rows written" % ( offset, first_file + 1, state["rows"] ) )
+		writer = CsvWriter( options.out_path, sep, options.quote, offset = state["bytes"] )
+		writer.num_rows = state["rows"]
+	elif fmt == "csv":
+		writer = CsvWriter( options.out_path, sep, options.quote )
+		writer.write( header )
+	else:
+		columns = list( zip( header, [ "int64", "timestamp", "category", "int64", "string" ] ) )
+		writer = open_writer( options.out_path, columns, fmt )
 
-	for tweets_path in args:
+	for file_index, tweets_path in enumerate( args ):
+		if file_index < first_file:
+			continue
 		log.info("Loading tweets from %s ..." % tweets_path)
 		# Process every line as JSON data
-		num_tweets, num_failed, line_number = 0, 0, 0
-		for l in fileinput.input(tweets_path):
+		num_tweets, num_failed, num_duplicates, line_number = 0, 0, 0, 0
+		if checkpointer is None:
+			metrics.start_file( tweets_path, selection )
+			lines = iter_lines( tweets_path, selection )
+		else:
+			# every line has to be read to keep track of the offset, so the index is not used for the selection
+			file_offset = offset if file_index == first_file else 0
+			metrics.start_file( tweets_path, selection, sized = file_offset == 0 )
+			lines = checkpointer.lines( file_index, tweets_path, file_offset )
+		for l in metrics.timed_lines( lines ):
 			l = l.strip()
 			if len(l) == 0:
 				continue
 			try:
 				line_number += 1
+				if line_number % 1000 == 0:
+					metrics.progress()
+				start = clock()
+				if not selection is None and not selection.candidate(l):
+					stages["decode"] += clock() - start
+					continue
 				tweet = json.loads(l)
-				sdate = parse_twitter_date(tweet["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
-				values = [ fmt_id(tweet["id"]), sdate, norm(tweet["user"]["screen_name"], sep).lower(), fmt_id(tweet["user"]["id"]), norm(tweet["text"], sep) ]
-				fout.write("%s\n" % sep.join(values) )
+				if not selection is None and not selection.accepts(tweet):
+					continue
+				if not dedupe is None and dedupe.add( tweet["id"] ):
+					num_duplicates += 1
+					continue
+				decoded = clock()
+				stages["decode"] += decoded - start
+				if fmt == "csv":
+					sdate = format_twitter_date(tweet["created_at"])
+					if options.quote:
+						writer.write( ( str(tweet["id"]), sdate, screen_name[tweet["user"]["screen_name"]], str(tweet["user"]["id"]), tweet["text"] ) )
+					else:
+						writer.write( ( fmt_id(tweet["id"]), sdate, clean_field(screen_name[tweet["user"]["screen_name"]], sep), fmt_id(tweet["user"]["id"]), clean_field(tweet["text"], sep) ) )
+				else:
+					# parse the timestamp per row, so that a bad value only loses its own row
+					writer.write( ( tweet["id"], twitter_epoch(tweet["created_at"]), screen_name[tweet["user"]["screen_name"]], tweet["user"]["id"], tweet["text"] ) )
+				stages["output"] += clock() - decoded
 				num_tweets += 1
-				if line_number % 50000 == 0:
-					log.info("Processed %d lines" % line_number)
 			except Exception as e:
 				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
+				metrics.failure( e )
 				num_failed += 1
-		fileinput.close()
 		log.info("Wrote %d tweets" % num_tweets )
-		fout.flush()
+		if not dedupe is None:
+			log.info("Skipped %d duplicate tweets" % num_duplicates )
+			metrics.num_duplicates += num_duplicates
+		if fmt == "csv":
+			writer.flush()
+		if not checkpointer is None:
+			checkpointer.end_file( file_index )
 
-	fout.close()
+	with metrics.stage("output"):
+		writer.close()
+	if not checkpointer is None:
+		checkpointer.finish()
+	metrics.finish()
 
 # --------------------------------------------------------------
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Filter one or more JSONL files, where each line contains a JSON-formatted tweet as retrieved from the Twitter API,
+writing the lines of the selected tweets unchanged to a new JSONL file, or to stdout using '-'. Output files
+ending in .gz are compressed.
+
+Lines are checked for the language codes, user ids, hashtags and keywords being selected before they are
+decoded, so that only the candidate lines are decoded, and a selective filter runs at close to the speed
+at which the file can be read.
+
+Sample usage:
+python jsonl-tweet-filter.py sample/sample-tweets-500.jsonl --lang en -o english.jsonl
+python jsonl-tweet-filter.py sample/sample-tweets-500.jsonl --hashtags brexit,euref -o - | python jsonl-tweet-hashtags.py -
+"""
+import sys, gzip, time
+from optparse import OptionParser
+import logging as log
+from jsonltools.engine import iter_lines
+from jsonltools.decoding import Decoder
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+
+# --------------------------------------------------------------
+
+def open_output( path ):
+	if path == "-":
+		return sys.stdout.buffer
+	if path.lower().endswith(".gz"):
+		return gzip.open( path, "wb", compresslevel=6 )
+	return open( path, "wb", buffering=1 << 20 )
+
+# --------------------------------------------------------------
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
+	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path for the selected tweets, or '-' for stdout (default)", default="-")
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_metrics_options( parser )
+	(options, args) = parser.parse_args()
+	if( len(args) < 1 ):
+		parser.error( "Must specify at least one JSONL file" )
+	selection = selection_from_options( parser, options )
+	if selection is None:
+		parser.error( "Must specify at least one selection option" )
+	# the selected tweets may be written to stdout, so progress is logged to stderr
+	log.basicConfig(level=20, format='%(message)s', stream=sys.stderr)
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+	clock, stages = time.perf_counter, metrics.stages
+
+	decode = Decoder( [], fields = selection.fields + ( () if dedupe is None else ( "id", ) ), prefilter = False )
+	fout = open_output( options.out_path )
+	num_selected = 0
+	for tweets_path in args:
+		log.info("Loading tweets from %s ..." % tweets_path)
+		num_tweets, num_failed, num_duplicates, line_number = 0, 0, 0, 0
+		metrics.start_file( tweets_path, selection )
+		for l in metrics.timed_lines( iter_lines(tweets_path, selection) ):
+			l = l.strip()
+			if len(l) == 0:
+				continue
+			line_number += 1
+			if line_number % 1000 == 0:
+				metrics.progress()
+			start = clock()
+			try:
+				if not selection.candidate(l):
+					continue
+				tweet = decode(l)
+				if not selection.accepts(tweet):
+					continue
+				if not dedupe is None and "id" in tweet and dedupe.add( tweet["id"] ):
+					num_duplicates += 1
+					continue
+			except Exception as e:
+				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
+				metrics.failure( e )
+				num_failed += 1
+				continue
+			finally:
+				stages["decode"] += clock() - start
+			start = clock()
+			fout.write( l )
+			fout.write( b"\n" )
+			stages["output"] += clock() - start
+			num_tweets += 1
+		log.info("Selected %d tweets from %d lines" % ( num_tweets, line_number ) )
+		if not dedupe is None:
+			log.info("Skipped %d duplicate tweets" % num_duplicates )
+			metrics.num_duplicates += num_duplicates
+		num_selected += num_tweets
+
+	with metrics.stage("output"):
+		if options.out_path == "-":
+			fout.flush()
+		else:
+			fout.close()
+	log.info("Wrote %d tweets to %s" % ( num_selected, "stdout" if options.out_path == "-" else options.out_path ) )
+	metrics.finish()
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
@@ -6,66 +6,70 @@ as retrieved from the Twitter API.
 Sample usage:
 python jsonl-tweet-hashtags.py sample/sample-tweets-500.jsonl
 """
-import sys, fileinput, operator
 from optparse import OptionParser
-from collections import defaultdict
 import logging as log
-try:
-	import ujson as json 
-except:
-	import json
-from prettytable import PrettyTable
+from jsonltools.engine import process_file
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.cache import add_cache_options, check_cache_options
+from jsonltools.follow import add_follow_options, check_follow_options, follow
+from jsonltools.aggregators import HashtagCounter
+from jsonltools.state import save_state, merge_states
 
 # --------------------------------------------------------------
 
 def main():
 	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
 	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top hashtags to display", default=10)
+	parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="number of worker processes to use for each file (default is 1)", default=1)
+	parser.add_option("--save-state", action="store", type="string", dest="state_path", help="save the aggregate state for all input files to the specified path", default=None)
+	parser.add_option("--merge-state", action="store_true", dest="merge_state", help="treat the input files as saved state files, and report on their merged totals")
+	parser.add_option("-a", "--approx", action="store_true", dest="approx", help="use bounded-memory approximate counting")
+	parser.add_option("-e", "--error", action="store", type="float", dest="error", help="error bound for approximate counting, as a fraction of the total count (default is 0.001)", default=0.001)
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_cache_options( parser )
+	add_metrics_options( parser )
+	add_follow_options( parser )
 	(options, args) = parser.parse_args()	
 	if( len(args) < 1 ):
 		parser.error( "Must specify at least one JSONL file" )
 	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	check_follow_options( parser, options, args )
+	check_cache_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
 
+	if options.merge_state:
+		try:
+			counter = merge_states( args, ["hashtags"] )["hashtags"]
+		except ( ValueError, OSError ) as e:
+			parser.error( str(e) )
+		with metrics.stage("output"):
+			counter.report( options.top )
+		metrics.finish()
+		return
+
+	if options.follow:
+		follow( args[0], HashtagCounter( options.approx, options.error ), "hashtags", options, selection, metrics, dedupe )
+		metrics.finish()
+		return
+
+	total = HashtagCounter( options.approx, options.error )
 	for tweets_path in args:
 		log.info("Loading tweets from %s ..." % tweets_path)
-		
-		# Process every line as JSON data
-		hashtags = {}
-		num_tweets, num_failed, line_number, has_hashtags = 0, 0, 0, 0
-		counts = defaultdict(int)
-		for l in fileinput.input(tweets_path):
-			l = l.strip()
-			if len(l) == 0:
-				continue
-			try:
-				line_number += 1
-				tweet = json.loads(l)
-				if "entities" in tweet:
-					if "hashtags" in tweet["entities"] and len(tweet["entities"]["hashtags"]) > 0:
-						has_hashtags += 1
-						for tag in tweet["entities"]["hashtags"]:
-							text = "#" + tag["text"].lower().strip()
-							counts[text] += 1
-				num_tweets += 1
-				if line_number % 50000 == 0:
-					log.info("Processed %d lines" % line_number)
-			except Exception as e:
-				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
-				num_failed += 1
-		fileinput.close()
-		log.info("Found %d/%d tweets containing at least one hashtag. File has %d distinct hashtags" % ( has_hashtags, num_tweets, len(counts) ) )
-
-		# Display the top hashtags for this file
-		sx = sorted(counts.items(), key=operator.itemgetter(1), reverse=True)
-		log.info("Top %d hashtags appearing in tweets:" % min( len(sx), options.top ) )
-		tab = PrettyTable( ["Hashtag", "Count"] )
-		tab.align["Hashtag"] = "l"
-		tab.align["Count"] = "r"
-		for i, pair in enumerate(sx):
-			if i > options.top:
-				break
-			tab.add_row( pair )
-		log.info(tab)
+		counter = HashtagCounter( options.approx, options.error )
+		process_file( tweets_path, [counter], options.workers, selection, metrics, dedupe, options.cache )
+		with metrics.stage("output"):
+			counter.report( options.top )
+		if not options.state_path is None:
+			total.merge( counter )
+	if not options.state_path is None:
+		with metrics.stage("output"):
+			save_state( options.state_path, { "hashtags" : total } )
+	metrics.finish()
 
 # --------------------------------------------------------------
 
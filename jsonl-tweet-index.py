@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Build a persistent index for one or more JSONL files, where each line contains a JSON-formatted tweet 
+as retrieved from the Twitter API. The index is written alongside each file (with the extension .idx),
+and allows the other tools to seek directly to the tweets selected by the --since, --until and --ids options.
+
+Sample usage:
+python jsonl-tweet-index.py sample/sample-tweets-500.jsonl
+python jsonl-tweet-hashtags.py --since "2016-06-25 14:00" --until "2016-06-25 16:00" sample/sample-tweets-500.jsonl
+"""
+from optparse import OptionParser
+import logging as log
+from jsonltools.compression import detect_compression
+from jsonltools.index import build_index, index_path
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+
+# --------------------------------------------------------------
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
+	parser.add_option("-p", "--postings", action="store_true", dest="postings", help="also build hashtag and user posting lists")
+	add_metrics_options( parser )
+	(options, args) = parser.parse_args()	
+	if( len(args) < 1 ):
+		parser.error( "Must specify at least one JSONL file" )
+	log.basicConfig(level=20, format='%(message)s')
+	metrics = metrics_from_options( options )
+
+	for tweets_path in args:
+		if tweets_path == "-" or not detect_compression( tweets_path ) is None:
+			log.error("Skipping %s, since only uncompressed files can be indexed" % tweets_path )
+			continue
+		log.info("Indexing tweets from %s ..." % tweets_path)
+		num_tweets = build_index( tweets_path, options.postings, metrics )
+		log.info("Wrote index of %d tweets to %s" % ( num_tweets, index_path(tweets_path) ) )
+	metrics.finish()
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
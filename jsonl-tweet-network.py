@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Extract a directed network of users from one or more JSONL files, where each line contains a JSON-formatted tweet 
+as retrieved from the Twitter API. Edges are weighted by the number of times that one user mentioned, retweeted 
+or replied to another. The network can be written as a tab-separated edge list, as GraphML, or as sparse matrices 
+in the .npz format used by scipy.sparse or as binary edge lists.
+
+Sample usage:
+python jsonl-tweet-network.py sample/sample-tweets-500.jsonl -o network.csv
+python jsonl-tweet-network.py -e mention,retweet sample/sample-tweets-500.jsonl -o network.graphml
+"""
+from optparse import OptionParser
+import logging as log
+from jsonltools.engine import process_file
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.network import NetworkCounter, EDGE_TYPES, NETWORK_FORMATS, parse_edge_types
+from jsonltools.state import save_state, merge_states
+from jsonltools.pairs import memory_to_pairs
+
+# --------------------------------------------------------------
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
+	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top edges of each type to display", default=10)
+	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path", default="network.csv")
+	parser.add_option("-f", "--format", action="store", type="choice", choices=NETWORK_FORMATS, dest="format", help="output format, one of %s (default is based on the output path extension, otherwise csv)" % ", ".join(NETWORK_FORMATS), default=None)
+	parser.add_option("-e", "--edges", action="store", type="string", dest="edge_types", help="comma-separated list of edge types to extract (default is all of %s)" % ",".join(EDGE_TYPES), default=",".join(EDGE_TYPES))
+	parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="number of worker processes to use for each file (default is 1)", default=1)
+	parser.add_option("--save-state", action="store", type="string", dest="state_path", help="save the aggregate state for all input files to the specified path", default=None)
+	parser.add_option("--merge-state", action="store_true", dest="merge_state", help="treat the input files as saved state files, and report on their merged totals")
+	parser.add_option("-m", "--memory", action="store", type="float", dest="memory", help="approximate memory budget in MB for edge counts, beyond which counts are spilled to disk", default=None)
+	parser.add_option("--spill-dir", action="store", type="string", dest="spill_dir", help="directory for temporary spill files (default is the system temporary directory)", default=None)
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_metrics_options( parser )
+	(options, args) = parser.parse_args()	
+	if( len(args) < 1 ):
+		parser.error( "Must specify at least one JSONL file" )
+	try:
+		edge_types = parse_edge_types( options.edge_types )
+	except ValueError as e:
+		parser.error( str(e) )
+	if len(edge_types) == 0:
+		parser.error( "At least one edge type must be specified" )
+	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+
+	if options.merge_state:
+		try:
+			counter = merge_states( args, ["network"] )["network"]
+		except ( ValueError, OSError ) as e:
+			parser.error( str(e) )
+		with metrics.stage("output"):
+			counter.report( options.top, counter.write( options.out_path, options.format ) )
+		metrics.finish()
+		return
+
+	# Count the edges between users
+	max_pairs = None if options.memory is None else memory_to_pairs( options.memory )
+	counter = NetworkCounter( edge_types, max_pairs, options.spill_dir )
+	for tweets_path in args:
+		log.info("Loading tweets from %s ..." % tweets_path)
+		process_file( tweets_path, [counter], options.workers, selection, metrics, dedupe )
+	with metrics.stage("output"):
+		if not options.state_path is None:
+			save_state( options.state_path, { "network" : counter } )
+		# Output edges and display top counts
+		counter.report( options.top, counter.write( options.out_path, options.format ) )
+	metrics.finish()
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Generate any combination of the stats, authors, mentions, hashtags and cooccur reports for one or more 
+JSONL files in a single pass, where each line contains a JSON-formatted tweet as retrieved from the Twitter API.
+Every tweet is only decoded once, regardless of the number of reports requested.
+
+Sample usage:
+python jsonl-tweet-report.py -r stats,hashtags,cooccur sample/sample-tweets-500.jsonl
+"""
+from optparse import OptionParser
+import logging as log
+from jsonltools.engine import process_file
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.aggregators import REPORTS
+from jsonltools.state import save_state, merge_states
+
+# --------------------------------------------------------------
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
+	parser.add_option("-r", "--reports", action="store", type="string", dest="reports", help="comma-separated list of reports to generate (default is all of %s)" % ",".join(REPORTS), default=",".join(REPORTS))
+	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top items to display in each report", default=10)
+	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path for hashtag cooccurrences, in csv, npz or edges format based on the extension", default="hashtag-cooccurrences.csv")
+	parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="number of worker processes to use for each file (default is 1)", default=1)
+	parser.add_option("--save-state", action="store", type="string", dest="state_path", help="save the aggregate state for all input files to the specified path", default=None)
+	parser.add_option("--merge-state", action="store_true", dest="merge_state", help="treat the input files as saved state files, and report on their merged totals")
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_metrics_options( parser )
+	(options, args) = parser.parse_args()	
+	if( len(args) < 1 ):
+		parser.error( "Must specify at least one JSONL file" )
+	names = [ name.strip() for name in options.reports.split(",") if len(name.strip()) > 0 ]
+	for name in names:
+		if not name in REPORTS:
+			parser.error( "Unknown report '%s'" % name )
+	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+
+	if options.merge_state:
+		try:
+			merged = merge_states( args, names )
+		except ( ValueError, OSError ) as e:
+			parser.error( str(e) )
+		with metrics.stage("output"):
+			for name in names:
+				log.info("-- %s report for all state files" % name )
+				if name == "cooccur":
+					merged[name].report( options.top, merged[name].write( options.out_path ) )
+				else:
+					merged[name].report( options.top )
+		metrics.finish()
+		return
+
+	# reports which accumulate across all files are only created once
+	totals = { name : REPORTS[name]() for name in names }
+	for tweets_path in args:
+		log.info("Loading tweets from %s ..." % tweets_path)
+		counters = { name : REPORTS[name]() if REPORTS[name].per_file else totals[name] for name in names }
+		process_file( tweets_path, list(counters.values()), options.workers, selection, metrics, dedupe )
+		with metrics.stage("output"):
+			for name in names:
+				if REPORTS[name].per_file:
+					log.info("-- %s report for %s" % ( name, tweets_path ) )
+					counters[name].report( options.top )
+					if not options.state_path is None:
+						totals[name].merge( counters[name] )
+
+	with metrics.stage("output"):
+		for name in names:
+			if not REPORTS[name].per_file:
+				log.info("-- %s report for all files" % name )
+				if name == "cooccur":
+					totals[name].report( options.top, totals[name].write( options.out_path ) )
+				else:
+					totals[name].report( options.top )
+		if not options.state_path is None:
+			save_state( options.state_path, totals )
+	metrics.finish()
+
+# --------------------------------------------------------------
+
+if __name__ == "__main__":
+	main()
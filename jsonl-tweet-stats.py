@@ -3,102 +3,79 @@
 Provide summary statistics for a JSONL file, where each line contains a JSON-formatted tweet 
 as retrieved from the Twitter API.
 
+Tweets can also be counted in time bins, giving time series of the volume of tweets, retweets, replies,
+languages and top hashtags, and any bursts of activity in them are reported.
+
 Sample usage:
 python jsonl-tweet-stats.py sample/sample-tweets-500.jsonl
+python jsonl-tweet-stats.py --timeseries volume.csv --interval 15m sample/sample-tweets-500.jsonl
 """
-import sys, fileinput, operator
 from optparse import OptionParser
-from collections import defaultdict
 import logging as log
-try:
-	import ujson as json 
-except:
-	import json
-
-# --------------------------------------------------------------
-
-class TweetCounter:
-	def __init__( self ):
-		self.num_retweets = 0
-		self.num_replies = 0
-		self.has_hashtags = 0
-		self.has_urls = 0
-		self.has_mentions = 0
-		self.num_geo = 0
-		self.lang_counts = defaultdict(int)
-
-	def apply( self, tweet ):
-		retweeted = tweet.get("retweeted_status",None) is not None
-		if retweeted:
-			self.num_retweets += 1
-		if not tweet["in_reply_to_user_id"] is None:
-			self.num_replies += 1
-		if not tweet["geo"] is None:
-			self.num_geo += 1
-		ents = tweet.get("entities",[])
-		if len(ents["hashtags"]) > 0:
-			self.has_hashtags += 1
-		if len(ents["urls"]) > 0:
-			self.has_urls += 1
-		if len(ents["user_mentions"]) > 0:
-			self.has_mentions += 1
-		# counts of specific items
-		if "lang" in tweet:
-			self.lang_counts[tweet["lang"]] += 1
-
-# --------------------------------------------------------------
-
-def per( x, total ):
-	if total == 0:
-		return "0%"
-	return "%.2f%%" % ( (100.0*x)/total )
-
-def counts_to_str( counts, top = -1 ):
-	sx = sorted(counts.items(), key=operator.itemgetter(1), reverse=True)
-	if top > 0:
-		sx = sx[0:min(top,len(sx))]
-	slist = [ "%s (%d)" % ( p[0], p[1] ) for p in sx ]
-	return ", ".join( slist )
+from jsonltools.engine import process_file
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.dedupe import add_dedupe_options, dedupe_from_options
+from jsonltools.cache import add_cache_options, check_cache_options
+from jsonltools.aggregators import TweetCounter
+from jsonltools.state import save_state, merge_states
+from jsonltools.timeseries import add_timeseries_options, timeseries_from_options
 
 # --------------------------------------------------------------
 
 def main():
 	parser = OptionParser(usage="usage: %prog [options] json_file1 json_file2 ...")
+	parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="number of worker processes to use for each file (default is 1)", default=1)
+	parser.add_option("--save-state", action="store", type="string", dest="state_path", help="save the aggregate state for all input files to the specified path", default=None)
+	parser.add_option("--merge-state", action="store_true", dest="merge_state", help="treat the input files as saved state files, and report on their merged totals")
+	add_selection_options( parser )
+	add_dedupe_options( parser )
+	add_cache_options( parser )
+	add_metrics_options( parser )
+	add_timeseries_options( parser )
 	(options, args) = parser.parse_args()	
 	if( len(args) < 1 ):
 		parser.error( "Must specify at least one JSONL file" )
 	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	check_cache_options( parser, options )
+	dedupe = dedupe_from_options( parser, options )
+	metrics = metrics_from_options( options )
+	series = timeseries_from_options( parser, options )
+
+	if options.merge_state:
+		try:
+			merged = merge_states( args, ["stats"] if series is None else ["stats", "timeseries"] )
+		except ( ValueError, OSError ) as e:
+			parser.error( str(e) )
+		with metrics.stage("output"):
+			merged["stats"].report()
+			if not series is None:
+				write_series( merged["timeseries"], options )
+		metrics.finish()
+		return
 
+	total = TweetCounter()
 	for tweets_path in args:
 		log.info("Loading tweets from %s ..." % tweets_path)
-
-		# Process every line as JSON data
-		num_tweets, num_failed, line_number = 0, 0, 0
 		counter = TweetCounter()
-		for l in fileinput.input(tweets_path):
-			l = l.strip()
-			if len(l) == 0:
-				continue
-			try:
-				line_number += 1
-				tweet = json.loads(l)
-				counter.apply( tweet )
-				num_tweets += 1
-				if line_number % 50000 == 0:
-					log.info("Processed %d lines" % line_number)
-			except Exception as e:
-				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
-				num_failed += 1
-		fileinput.close()
-
+		# the time series is counted in the same pass, and accumulates across all files
+		process_file( tweets_path, [counter] if series is None else [counter, series], options.workers, selection, metrics, dedupe, options.cache )
 		# Display basic stats for this file
-		log.info("Total: %d tweets, %d failed" % (num_tweets,num_failed))
-		log.info("Retweets: %d (%s)" % (counter.num_retweets, per(counter.num_retweets,num_tweets) ) )
-		log.info("Replies: %d (%s)" % (counter.num_replies, per(counter.num_replies,num_tweets) ) )
-		log.info("Geotagged Tweets: %d (%s)" % (counter.num_geo, per(counter.num_geo,num_tweets) ) )
-		log.info("Tweets with URL: %d (%s)" % (counter.has_urls, per(counter.has_urls,num_tweets) ) )
-		log.info("Tweets with Mentions: %d (%s)" % (counter.has_mentions, per(counter.has_mentions,num_tweets) ) )
-		log.info("Top Languages: %s" % counts_to_str( counter.lang_counts, 10 ) )
+		with metrics.stage("output"):
+			counter.report()
+		if not options.state_path is None:
+			total.merge( counter )
+	with metrics.stage("output"):
+		if not series is None:
+			write_series( series, options )
+		if not options.state_path is None:
+			save_state( options.state_path, { "stats" : total } if series is None else { "stats" : total, "timeseries" : series } )
+	metrics.finish()
+
+def write_series( series, options ):
+	series.write( options.timeseries_path, options.series_hashtags )
+	series.report( options.series_hashtags, options.burst_window, options.burst_threshold )
 
 # --------------------------------------------------------------
 
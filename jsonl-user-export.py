@@ -1,37 +1,56 @@
 #!/usr/bin/env python
 """
-A very simple script to export user metadata from a JSONL file in CSV format.
+A very simple script to export user metadata from a JSONL file in CSV format, or in a columnar
+NumPy (.npz) or Parquet format.
+
+Profiles can also be added to a persistent store, which keeps the latest snapshot of each user, and users
+who appear many times can be exported just once, with their latest profile.
 
 Sample usage:
 python jsonl-user-export.py sample/sample-users-50.jsonl -o sample/sample-users.csv
+python jsonl-user-export.py sample/sample-users-50.jsonl -o sample/sample-users.npz
+python jsonl-user-export.py --store users.store -u sample/sample-users-50.jsonl -o sample/sample-users.csv
 """
-import sys, fileinput, codecs, re
-from datetime import datetime
+import os, time, shutil, tempfile
 from optparse import OptionParser
 import logging as log
 try:
 	import ujson as json 
 except:
 	import json
+from jsonltools.engine import iter_lines
+from jsonltools.selection import add_selection_options, selection_from_options
+from jsonltools.metrics import add_metrics_options, metrics_from_options
+from jsonltools.columnar import FORMATS, format_for_path, open_writer
+from jsonltools.csvwriter import CsvWriter
+from jsonltools.timeparse import twitter_epoch, format_twitter_date
+from jsonltools.profiles import ProfileStore, ProfileWriter
+from jsonltools.normalise import screen_name, clean_field
 
 # --------------------------------------------------------------
 
-def parse_twitter_date( s, ignore_time_zones = True ):
-	# hack for cases where timezone is not supported by Python strptime 
-	if ignore_time_zones:
-		parts = s.split(" ")
-		smodified =" ".join( parts[0:4] + [ parts[-1] ] )
-		return  datetime.strptime(smodified,'%a %b %d %H:%M:%S %Y')
-	return datetime.strptime(s,'%a %b %d %H:%M:%S %z %Y')
-
 def fmt_id( x ):
 	return '"%s"' % x
 
 def norm( s, sep ):
 	if s is None or len(s) == 0:
 		return ""
-	s = s.replace(sep, " ")
-	return re.sub("\s+", " ", s ).strip()
+	return clean_field( s, sep ).strip()
+
+def user_row( user, fmt, quote, sep ):
+	""" Return the exported fields of a user profile as a row for the output format. """
+	if fmt == "csv" and quote:
+		return ( str(user["id"]), screen_name[user["screen_name"]], user["name"], user["followers_count"], user["friends_count"],
+			user["statuses_count"], format_twitter_date(user["created_at"]), user["lang"], user["location"], user["description"] )
+	if fmt == "csv":
+		values = [ fmt_id(user["id"]), norm(screen_name[user["screen_name"]],sep), norm(user["name"],sep) ]
+		sdate = format_twitter_date(user["created_at"])
+		values += [ str(user["followers_count"]), str(user["friends_count"]), str(user["statuses_count"]), sdate ]
+		values += [ norm(user["lang"],sep), norm(user["location"],sep), norm(user["description"],sep) ]
+		return values
+	# parse the timestamp per row, so that a bad value only loses its own row
+	return ( user["id"], screen_name[user["screen_name"]], user["name"], user["followers_count"], user["friends_count"], 
+		user["statuses_count"], twitter_epoch(user["created_at"]), user["lang"], user["location"], user["description"] )
 
 # --------------------------------------------------------------
 
@@ -40,45 +59,112 @@ def main():
 	parser.add_option("-t", "--top", action="store", type="int", dest="top", help="number of top authors to display", default=10)
 	parser.add_option("-o", action="store", type="string", dest="out_path", help="output path for CSV file", default="users.csv")
 	parser.add_option("-s", action="store", type="string", dest="separator", help="separator character for output file (default is comma)", default=",")
+	parser.add_option("-f", "--format", action="store", type="choice", choices=FORMATS, dest="format", help="output format, one of %s (default is based on the output path extension, otherwise csv)" % ", ".join(FORMATS), default=None)
+	parser.add_option("-q", "--quote", action="store_true", dest="quote", help="use standard CSV quoting for text values, rather than replacing separators and whitespace")
+	parser.add_option("--store", action="store", type="string", dest="store_path", help="add the user profiles to a profile store at this path, which keeps the latest snapshot of each user", default=None)
+	parser.add_option("-u", "--unique", action="store_true", dest="unique", help="only export the latest profile of each user, or of each user in the profile store if --store is given")
+	parser.add_option("--tweets", action="store_true", dest="tweets", help="the input files contain tweets, and the profiles of their authors are used")
+	add_selection_options( parser )
+	add_metrics_options( parser )
 	(options, args) = parser.parse_args()	
-	if( len(args) < 1 ):
+	# an existing store can be exported without any new input files
+	if( len(args) < 1 and not ( options.unique and not options.store_path is None ) ):
 		parser.error( "Must specify at least one JSONL file" )
 	log.basicConfig(level=20, format='%(message)s')
+	selection = selection_from_options( parser, options )
+	metrics = metrics_from_options( options )
+	clock, stages = time.perf_counter, metrics.stages
 	sep = options.separator
 
-	log.info("Tweets will be written to %s ..." % options.out_path )
+	log.info("Users will be written to %s ..." % options.out_path )
 	header = ["User_ID", "Screen_Name", "Name", "Followers_count", "Friends_Count", "Tweets_Count", "Created_At", "Language", "Location", "Description" ]
 
-	fout = codecs.open( options.out_path, "w", encoding="utf-8", errors="ignore" )
-	fout.write("%s\n" % sep.join(header) )
+	# columnar formats store typed values, rather than formatted strings
+	fmt = options.format or format_for_path( options.out_path )
+	if fmt == "csv":
+		writer = CsvWriter( options.out_path, sep, options.quote )
+		writer.write( header )
+	else:
+		kinds = [ "int64", "category", "string", "int64", "int64", "int64", "timestamp", "category", "string", "string" ]
+		writer = open_writer( options.out_path, list( zip( header, kinds ) ), fmt )
+
+	# profiles are collected in a temporary store if they only need to be made unique
+	store, temp_dir = None, None
+	if options.unique or not options.store_path is None:
+		store_path = options.store_path
+		if store_path is None:
+			temp_dir = tempfile.mkdtemp( prefix="jsonl-users-" )
+			store_path = os.path.join( temp_dir, "users.store" )
+		store = ProfileWriter( store_path )
 
 	for users_path in args:
 		log.info("Loading user metadata from %s ..." % users_path)
 		# Process every line as JSON data
 		num_users, num_failed, line_number = 0, 0, 0
-		for l in fileinput.input(users_path):
+		metrics.start_file( users_path, selection )
+		for l in metrics.timed_lines( iter_lines(users_path, selection) ):
 			l = l.strip()
 			if len(l) == 0:
 				continue
 			try:
 				line_number += 1
+				if line_number % 1000 == 0:
+					metrics.progress()
+				start = clock()
+				if not selection is None and not selection.candidate(l):
+					stages["decode"] += clock() - start
+					continue
 				user = json.loads(l)
-				values = [ fmt_id(user["id"]), norm(user["screen_name"],sep).lower(), norm(user["name"],sep) ]
-				sdate = parse_twitter_date(user["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
-				values += [ str(user["followers_count"]), str(user["friends_count"]), str(user["statuses_count"]), sdate ]
-				values += [ norm(user["lang"],sep), norm(user["location"],sep), norm(user["description"],sep) ]
-				fout.write("%s\n" % sep.join(values) )
+				if not selection is None and not selection.accepts(user):
+					continue
+				# the profile of a tweet's author was seen when the tweet was created
+				seen = None
+				if options.tweets:
+					if not "user" in user:
+						continue
+					seen, user = twitter_epoch(user["created_at"]), user["user"]
+				decoded = clock()
+				stages["decode"] += decoded - start
+				if not store is None:
+					store.add( user, seen )
+				if not options.unique:
+					writer.write( user_row( user, fmt, options.quote, sep ) )
+				stages["output"] += clock() - decoded
 				num_users += 1
-				if line_number % 50000 == 0:
-					log.info("Processed %d lines" % line_number)
 			except Exception as e:
-				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
+				log.error("Failed to parse user on line %d: %s" % ( line_number, e ) )
+				metrics.failure( e )
 				num_failed += 1
-		fileinput.close()
-		log.info("Wrote %d users" % num_users )
-		fout.flush()
+		if options.unique:
+			log.info("Read %d user profiles" % num_users )
+		else:
+			log.info("Wrote %d users" % num_users )
+		if fmt == "csv":
+			writer.flush()
 
-	fout.close()
+	with metrics.stage("output"):
+		if not store is None:
+			store.close()
+			if options.unique:
+				write_unique( writer, store.path, fmt, options.quote, sep, metrics )
+			if not temp_dir is None:
+				shutil.rmtree( temp_dir, ignore_errors=True )
+		writer.close()
+	metrics.finish()
+
+def write_unique( writer, store_path, fmt, quote, sep, metrics ):
+	""" Export the latest profile of every user in a profile store. """
+	log.info("Writing the latest profile of each user in %s ..." % store_path )
+	num_users = 0
+	with ProfileStore( store_path ) as profiles:
+		for user in profiles:
+			try:
+				writer.write( user_row( user, fmt, quote, sep ) )
+				num_users += 1
+			except Exception as e:
+				log.error("Failed to export user %s: %s" % ( user.get("id"), e ) )
+				metrics.failure( e )
+	log.info("Wrote %d users" % num_users )
 
 # --------------------------------------------------------------
 
@@ -0,0 +1,3 @@
+"""
+Shared code used by the jsonl-*.py command line tools.
+"""
@@ -0,0 +1,493 @@
+"""
+Aggregators which implement the per-tweet logic of the individual jsonl-*.py tools. Each
+one is driven by jsonltools.engine.process_file(), and can be combined with any of the others
+in a single pass over the data.
+"""
+import itertools, codecs, heapq, math
+from array import array
+from collections import defaultdict
+import logging as log
+from jsonltools.engine import Aggregator
+from jsonltools.decoding import field_pattern
+from jsonltools.pairs import PairCounter, pack_pair, unpack_pair
+from jsonltools.sketches import SpaceSaving, HyperLogLog
+from jsonltools.normalise import hashtag
+from jsonltools.cache import IS_OBJECT, IS_RETWEET, HAS_REPLY_FIELD, IS_REPLY, HAS_GEO_FIELD, IS_GEO, HAS_ENTITIES, first_counts
+
+# --------------------------------------------------------------
+
+def per( x, total ):
+	if total == 0:
+		return "0%"
+	return "%.2f%%" % ( (100.0*x)/total )
+
+def counts_to_str( counts, top = -1 ):
+	if top > 0:
+		sx = top_items( counts, top )
+	else:
+		sx = sorted(counts.items(), key=rank)
+	slist = [ "%s (%d)" % ( p[0], p[1] ) for p in sx ]
+	return ", ".join( slist )
+
+def merge_counts( counts, other ):
+	for key, value in other.items():
+		counts[key] += value
+
+def rank( item ):
+	# ties are broken by key, so that the order does not depend on the order in which the items were
+	# counted, which differs between a single run and one merged from saved state or a checkpoint
+	return ( -item[1], item[0] )
+
+def top_items( counts, top ):
+	return heapq.nsmallest( top, counts.items(), key=rank )
+
+def user_table( counts, users, top, profiles = None ):
+	""" Create a table of the users with the highest counts. If a ProfileStore is given, the latest
+	names and follower counts of the users are looked up in it. """
+	from prettytable import PrettyTable
+	sx = top_items( counts, top + 1 )
+	columns = ["Screen Name", "User ID", "Full Name", "Count"]
+	if not profiles is None:
+		columns.append( "Followers" )
+	tab = PrettyTable( columns )
+	tab.align["Screen Name"] = "l"
+	tab.align["User ID"] = "l"
+	tab.align["Full Name"] = "l"
+	tab.align["Count"] = "r"
+	if not profiles is None:
+		tab.align["Followers"] = "r"
+	for pair in sx:
+		if profiles is None:
+			screen_name, name = users.get( pair[0], ( "", "" ) )
+			tab.add_row( [ screen_name, str(pair[0]), name, pair[1] ] )
+			continue
+		profile = profiles.get( pair[0] )
+		if profile is None:
+			screen_name, name = users.get( pair[0], ( "", "" ) )
+			tab.add_row( [ screen_name, str(pair[0]), name, pair[1], "" ] )
+		else:
+			tab.add_row( [ profile["screen_name"], str(pair[0]), profile["name"], pair[1], profile["followers_count"] ] )
+	return len(sx), tab
+
+# --------------------------------------------------------------
+
+class KeyCounter(Aggregator):
+	""" Base class for aggregators which count occurrences of keys such as user ids or hashtags.
+	If approx is True, a Space-Saving sketch keeps approximate counts for the most frequent keys, 
+	and a HyperLogLog sketch estimates the number of distinct keys, so memory use is bounded by
+	the error parameter rather than the number of keys. The display fields of each key are kept,
+	even when a ProfileStore is used for the report, for the keys which are missing from it. """
+	# optional function called with every key counted and its number of occurrences, such as SlidingWindows.add()
+	on_count = None
+
+	def __init__( self, approx = False, error = 0.001 ):
+		super().__init__()
+		self.approx, self.error = approx, error
+		# only the fields needed for display are kept for each key
+		self.display = {}
+		if approx:
+			self.counts = SpaceSaving.for_error( error )
+			self.distinct = HyperLogLog.for_error( error )
+		else:
+			self.counts = defaultdict(int)
+			self.distinct = None
+
+	def spawn( self ):
+		return self.__class__( self.approx, self.error )
+
+	def count( self, key, display = None, n = 1 ):
+		if self.approx:
+			self.distinct.add( key )
+			evicted = self.counts.add( key, n )
+			if not evicted is None:
+				self.display.pop( evicted, None )
+		else:
+			self.counts[key] += n
+		if not self.on_count is None:
+			self.on_count( key, n )
+		if not display is None and not key in self.display:
+			self.display[key] = display
+
+	def merge( self, other ):
+		super().merge( other )
+		if self.approx:
+			self.counts.merge( other.counts )
+			self.distinct.merge( other.distinct )
+			display = {}
+			for key in self.counts.counts:
+				display[key] = self.display.get( key ) or other.display.get( key )
+			self.display = display
+		else:
+			for key, fields in other.display.items():
+				self.display.setdefault( key, fields )
+			merge_counts( self.counts, other.counts )
+
+	def num_distinct( self ):
+		if self.approx:
+			return len(self.distinct)
+		return len(self.counts)
+
+	def log_error( self ):
+		if self.approx:
+			log.info("Counts are approximate, and overestimate by at most %d" % int( math.ceil( self.error * self.counts.total ) ) )
+
+# --------------------------------------------------------------
+
+class TweetCounter(Aggregator):
+	fields = ( "retweeted_status?", "in_reply_to_user_id", "geo?", "entities.hashtags", "entities.urls", "entities.user_mentions", "lang" )
+	batched = True
+
+	def __init__( self ):
+		super().__init__()
+		self.num_retweets = 0
+		self.num_replies = 0
+		self.has_hashtags = 0
+		self.has_urls = 0
+		self.has_mentions = 0
+		self.num_geo = 0
+		self.lang_counts = defaultdict(int)
+
+	def apply( self, tweet ):
+		retweeted = tweet.get("retweeted_status",None) is not None
+		if retweeted:
+			self.num_retweets += 1
+		if not tweet["in_reply_to_user_id"] is None:
+			self.num_replies += 1
+		if not tweet["geo"] is None:
+			self.num_geo += 1
+		ents = tweet.get("entities",[])
+		if len(ents["hashtags"]) > 0:
+			self.has_hashtags += 1
+		if len(ents["urls"]) > 0:
+			self.has_urls += 1
+		if len(ents["user_mentions"]) > 0:
+			self.has_mentions += 1
+		# counts of specific items
+		if "lang" in tweet:
+			self.lang_counts[tweet["lang"]] += 1
+
+	def apply_batch( self, batch ):
+		# rows are checked for each field in the order that apply() reads them, so that retweets
+		# are counted even when a later field is missing, as they are by apply()
+		ok = batch.has( IS_OBJECT )
+		self.num_retweets += int( ( ok & batch.has( IS_RETWEET ) ).sum() )
+		ok &= batch.has( HAS_REPLY_FIELD )
+		self.num_replies += int( ( ok & batch.has( IS_REPLY ) ).sum() )
+		ok &= batch.has( HAS_GEO_FIELD )
+		self.num_geo += int( ( ok & batch.has( IS_GEO ) ).sum() )
+		ok &= batch.has( HAS_ENTITIES )
+		self.has_hashtags += int( ( ok & ( batch.list_lengths("hashtags.offsets") > 0 ) ).sum() )
+		self.has_urls += int( ( ok & ( batch.list_lengths("urls.offsets") > 0 ) ).sum() )
+		self.has_mentions += int( ( ok & ( batch.list_lengths("mentions.offsets") > 0 ) ).sum() )
+		langs = batch.column("lang")[ok]
+		codes, first, counts = first_counts( langs[langs >= 0] )
+		for code, count in zip( codes.tolist(), counts.tolist() ):
+			self.lang_counts[batch.strings[code]] += count
+		num_ok = int( ok.sum() )
+		self.num_tweets += num_ok
+		self.num_failed += len(batch) - num_ok
+
+	def merge( self, other ):
+		super().merge( other )
+		self.num_retweets += other.num_retweets
+		self.num_replies += other.num_replies
+		self.has_hashtags += other.has_hashtags
+		self.has_urls += other.has_urls
+		self.has_mentions += other.has_mentions
+		self.num_geo += other.num_geo
+		merge_counts( self.lang_counts, other.lang_counts )
+
+	def report( self, top = 10 ):
+		num_tweets = self.num_tweets
+		log.info("Total: %d tweets, %d failed" % (num_tweets,self.num_failed))
+		log.info("Retweets: %d (%s)" % (self.num_retweets, per(self.num_retweets,num_tweets) ) )
+		log.info("Replies: %d (%s)" % (self.num_replies, per(self.num_replies,num_tweets) ) )
+		log.info("Geotagged Tweets: %d (%s)" % (self.num_geo, per(self.num_geo,num_tweets) ) )
+		log.info("Tweets with URL: %d (%s)" % (self.has_urls, per(self.has_urls,num_tweets) ) )
+		log.info("Tweets with Mentions: %d (%s)" % (self.has_mentions, per(self.has_mentions,num_tweets) ) )
+		log.info("Top Languages: %s" % counts_to_str( self.lang_counts, top ) )
+
+# --------------------------------------------------------------
+
+class AuthorCounter(KeyCounter):
+	fields = ( "user.id", "user.screen_name", "user.name" )
+
+	def apply( self, tweet ):
+		if "user" in tweet:
+			user = tweet["user"]
+			user_id = user["id"]
+			if user_id in self.display:
+				self.count( user_id )
+			else:
+				self.count( user_id, ( user["screen_name"], user["name"] ) )
+
+	def report( self, top = 10, profiles = None ):
+		approx = "approximately " if self.approx else ""
+		log.info("Found %d tweets by %s%d distinct authors" % ( self.num_tweets, approx, self.num_distinct() ) )
+		num_authors, tab = user_table( self.counts, self.display, top, profiles )
+		log.info("Top %d authors by tweet count:" % min( num_authors, top ) )
+		self.log_error()
+		log.info(tab)
+
+# --------------------------------------------------------------
+
+class MentionCounter(KeyCounter):
+	fields = ( "entities.user_mentions", )
+	prefilter = field_pattern( "user_mentions" )
+	batched = True
+
+	def __init__( self, approx = False, error = 0.001 ):
+		super().__init__( approx, error )
+		self.has_mentions = 0
+
+	def apply( self, tweet ):
+		if "entities" in tweet:
+			if "user_mentions" in tweet["entities"] and len(tweet["entities"]["user_mentions"]) > 0:
+				self.has_mentions += 1
+				for user in tweet["entities"]["user_mentions"]:
+					user_id = user["id"]
+					if user_id in self.display:
+						self.count( user_id )
+					else:
+						self.count( user_id, ( user["screen_name"], user["name"] ) )
+
+	def apply_batch( self, batch ):
+		# apply() never fails, whichever fields are missing
+		self.num_tweets += len(batch)
+		self.has_mentions += int( ( batch.list_lengths("mentions.offsets") > 0 ).sum() )
+		rows, ids, screen_names, names = batch.lists( "mentions.offsets", "mentions.id", "mentions.screen_name", "mentions.name" )
+		keys, first, counts = first_counts( ids )
+		strings = batch.strings
+		screen_names, names = screen_names[first].tolist(), names[first].tolist()
+		for i, ( user_id, count ) in enumerate( zip( keys.tolist(), counts.tolist() ) ):
+			if user_id in self.display:
+				self.count( user_id, n = count )
+			else:
+				self.count( user_id, ( strings[screen_names[i]], strings[names[i]] ), count )
+
+	def merge( self, other ):
+		super().merge( other )
+		self.has_mentions += other.has_mentions
+
+	def report( self, top = 10, profiles = None ):
+		approx = "approximately " if self.approx else ""
+		log.info("Found %d/%d tweets containing at least one user mention. %s%d distinct users were mentioned." % ( self.has_mentions, self.num_tweets, approx.capitalize(), self.num_distinct() ) )
+		num_users, tab = user_table( self.counts, self.display, top, profiles )
+		log.info("Top %d users by mentions:" % min( num_users, top ) )
+		self.log_error()
+		log.info(tab)
+
+# --------------------------------------------------------------
+
+class HashtagCounter(KeyCounter):
+	fields = ( "entities.hashtags", )
+	prefilter = field_pattern( "hashtags" )
+	batched = True
+
+	def __init__( self, approx = False, error = 0.001 ):
+		super().__init__( approx, error )
+		self.has_hashtags = 0
+
+	def apply( self, tweet ):
+		if "entities" in tweet:
+			if "hashtags" in tweet["entities"] and len(tweet["entities"]["hashtags"]) > 0:
+				self.has_hashtags += 1
+				for tag in tweet["entities"]["hashtags"]:
+					self.count( hashtag[tag["text"]] )
+
+	def apply_batch( self, batch ):
+		# apply() never fails, whichever fields are missing
+		self.num_tweets += len(batch)
+		self.has_hashtags += int( ( batch.list_lengths("hashtags.offsets") > 0 ).sum() )
+		rows, codes = batch.lists( "hashtags.offsets", "hashtags.text" )
+		codes, first, counts = first_counts( codes )
+		strings = batch.strings
+		for code, count in zip( codes.tolist(), counts.tolist() ):
+			self.count( hashtag[strings[code]], n = count )
+
+	def merge( self, other ):
+		super().merge( other )
+		self.has_hashtags += other.has_hashtags
+
+	def report( self, top = 10 ):
+		from prettytable import PrettyTable
+		approx = "approximately " if self.approx else ""
+		log.info("Found %d/%d tweets containing at least one hashtag. File has %s%d distinct hashtags" % ( self.has_hashtags, self.num_tweets, approx, self.num_distinct() ) )
+		sx = top_items( self.counts, top + 1 )
+		log.info("Top %d hashtags appearing in tweets:" % min( len(sx), top ) )
+		self.log_error()
+		tab = PrettyTable( ["Hashtag", "Count"] )
+		tab.align["Hashtag"] = "l"
+		tab.align["Count"] = "r"
+		for pair in sx:
+			tab.add_row( pair )
+		log.info(tab)
+
+# --------------------------------------------------------------
+
+class CooccurrenceCounter(Aggregator):
+	""" Counts pairs of hashtags appearing in the same tweet. Hashtags are interned to integer
+	ids, and each pair is packed into a single integer key. Exact counts spill to disk once
+	max_pairs pairs are held in memory, while approx > 0 only tracks the counts of that many
+	of the most frequent pairs. The number of tweets containing each hashtag is also counted, so
+	that association weights can be computed for the pairs. """
+	# pair counts accumulate across all input files
+	per_file = False
+	fields = ( "entities.hashtags", )
+	prefilter = field_pattern( "hashtags" )
+
+	def __init__( self, max_pairs = None, approx = 0, spill_dir = None ):
+		super().__init__()
+		self.max_pairs, self.approx, self.spill_dir = max_pairs, approx, spill_dir
+		self.num_multiple = 0
+		self.tag_ids = {}
+		self.tags = []
+		self.tag_counts = array("Q")
+		if approx > 0:
+			self.pairs = SpaceSaving( approx )
+		else:
+			self.pairs = PairCounter( max_pairs, spill_dir )
+
+	def spawn( self ):
+		return CooccurrenceCounter( self.max_pairs, self.approx, self.spill_dir )
+
+	def intern( self, tag ):
+		tag_id = self.tag_ids.get( tag )
+		if tag_id is None:
+			tag_id = self.tag_ids[tag] = len(self.tags)
+			self.tags.append( tag )
+			if not self.tag_counts is None:
+				self.tag_counts.append( 0 )
+		return tag_id
+
+	def apply( self, tweet ):
+		tweet_tags = set()
+		# find the tags
+		if "entities" in tweet:
+			if "hashtags" in tweet["entities"] and len(tweet["entities"]["hashtags"]) > 0:
+				for tag in tweet["entities"]["hashtags"]:
+					tweet_tags.add( self.intern( hashtag[tag["text"]] ) )
+		tag_counts = self.tag_counts
+		if not tag_counts is None:
+			for tag_id in tweet_tags:
+				tag_counts[tag_id] += 1
+		# process the pairs, without counting duplicates
+		if len(tweet_tags) > 1:
+			self.num_multiple += 1
+			add = self.pairs.add
+			for a, b in itertools.combinations(sorted(tweet_tags), 2):
+				add( pack_pair( a, b ) )
+
+	def merge( self, other ):
+		super().merge( other )
+		self.num_multiple += other.num_multiple
+		# map the other counter's hashtag ids onto our own
+		mapping = [ self.intern( tag ) for tag in other.tags ]
+		if self.tag_counts is None or other.tag_counts is None:
+			self.tag_counts = None
+		else:
+			for tag_id, count in zip( mapping, other.tag_counts ):
+				self.tag_counts[tag_id] += count
+		def remap( key ):
+			a, b = unpack_pair( key )
+			a, b = mapping[a], mapping[b]
+			return pack_pair( a, b ) if a < b else pack_pair( b, a )
+		if self.approx > 0:
+			self.pairs.merge( other.pairs.map_keys( remap ) )
+			return
+		add = self.pairs.add
+		for key, count in other.pairs.items():
+			add( remap( key ), count )
+
+	def checkpoint_state( self, directory ):
+		""" Return a snapshot of the counter for a checkpoint, together with the paths of the files in
+		the checkpoint directory which it refers to. Exact pair counts are kept as runs linked into the
+		directory, rather than being pickled. """
+		state = dict( self.__dict__ )
+		# the ids are rebuilt from the list of hashtags
+		del state["tag_ids"]
+		paths = []
+		if self.approx == 0:
+			paths = state["pairs"] = self.pairs.checkpoint( directory )
+		return state, paths
+
+	@classmethod
+	def from_checkpoint( cls, state ):
+		""" Restore a counter from a snapshot made by checkpoint_state(). """
+		counter = cls.__new__( cls )
+		counter.__dict__.update( state )
+		counter.tag_ids = { tag : tag_id for tag_id, tag in enumerate( counter.tags ) }
+		if counter.approx == 0:
+			counter.pairs = PairCounter.from_checkpoint( state["pairs"], counter.max_pairs, counter.spill_dir )
+		return counter
+
+	def __setstate__( self, state ):
+		# state files saved before hashtag counts were kept cannot provide association weights
+		state.setdefault( "tag_counts", None )
+		self.__dict__.update( state )
+
+	def num_pairs( self ):
+		return len(self.pairs)
+
+	def graph( self ):
+		""" Return the pair counts as a symmetric SparseGraph over the hashtag ids. Requires NumPy. """
+		from jsonltools.graph import SparseGraph, packed_edges
+		sources, targets, weights = packed_edges( self.pairs.items() )
+		return SparseGraph.from_edges( sources, targets, weights, self.tags, self.tag_counts, self.num_tweets, symmetric = True )
+
+	def iter_pairs( self, pairs ):
+		""" Yield (hashtag1,hashtag2,count) tuples for a sequence of packed pairs, with the hashtags in alphabetical order. """
+		tags = self.tags
+		for key, count in pairs:
+			a, b = unpack_pair( key )
+			tag1, tag2 = tags[a], tags[b]
+			if tag2 < tag1:
+				tag1, tag2 = tag2, tag1
+			yield tag1, tag2, count
+
+	def write( self, out_path, fmt = None ):
+		""" Write the pairs to a tab-separated file, or as a sparse matrix in one of the binary formats
+		of jsonltools.graph, in which case the SparseGraph is returned. """
+		log.info("Writing pairs to %s ..." % out_path )
+		if self.approx > 0:
+			log.info("Only the %d most frequent pairs were tracked, so counts are approximate" % len(self.pairs) )
+		if fmt is None:
+			from jsonltools.graph import graph_format_for_path
+			fmt = graph_format_for_path( out_path )
+		if fmt != "csv":
+			graph = self.graph()
+			graph.save( out_path, fmt )
+			return graph
+		fout = codecs.open( out_path, "w", encoding="utf-8", errors="ignore" )
+		fout.write("Hashtag1\tHastag2\tCount\n")
+		for tag1, tag2, count in self.iter_pairs( self.pairs.items() ):
+			fout.write( "%s\t%s\t%d\n" % ( tag1, tag2, count )  )
+		fout.close()
+		return None
+
+	def report( self, top = 10, graph = None ):
+		""" Display the most frequent pairs, which are selected from the graph if one has been built. """
+		from prettytable import PrettyTable
+		if graph is None:
+			sx = top_items( self.pairs, top + 1 )
+		else:
+			sx = [ ( pack_pair( a, b ), count ) for a, b, count in graph.top_edges( top + 1 ) ]
+		log.info("Top %d co-occurring hashtag pairs:" % min( len(sx), top ) )
+		tab = PrettyTable( ["Hashtag1", "Hashtag2", "Count"] )
+		tab.align["Hashtag1"] = "l"
+		tab.align["Hashtag2"] = "l"
+		tab.align["Count"] = "r"
+		for row in self.iter_pairs( sx ):
+			tab.add_row( list(row) )
+		log.info(tab)
+
+# --------------------------------------------------------------
+
+# names used to select reports on the command line
+REPORTS = {
+	"stats" : TweetCounter,
+	"authors" : AuthorCounter,
+	"mentions" : MentionCounter,
+	"hashtags" : HashtagCounter,
+	"cooccur" : CooccurrenceCounter,
+}
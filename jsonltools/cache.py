@@ -0,0 +1,480 @@
+"""
+Binary columnar cache of the decoded fields of a JSONL file, so that repeated analyses of the
+same file do not have to decode its JSON again. On the first pass over a file with the cache
+enabled, the fields used by the report tools are collected from every decoded line, and written
+to a sidecar file (the file path plus .cache), keyed by the size and modification time of the
+file. Later passes read the sidecar through mmap, with each column as a zero-copy NumPy view,
+and rebuild lightweight tweets containing only the fields that the aggregators declare. Where
+every aggregator supports it, whole blocks of rows are instead passed to apply_batch() as a
+TweetBatch of columns, so that counts are updated with NumPy operations rather than per tweet.
+
+The cached fields are CACHE_FIELDS. Hashtags are kept as their text, user mentions as their id,
+screen name and name, and URLs as their expanded URL. Strings are dictionary-encoded in a single
+vocabulary, and the lists of each tweet are stored as offsets into flat arrays:
+
+	header: magic, number of rows, number of failed lines, size and modification time of the file
+	directory: length and JSON object holding a list of (column name, dtype, byte offset, number
+		of values) for the columns, and the number of failed lines by type of error
+	columns: 8-byte aligned arrays
+
+Lines which could not be decoded are only stored as counts, and are reported as failures by
+every aggregator when the cache is read. Rebuilt tweets share their hashtag objects, so they
+must not be modified. NumPy is required.
+"""
+import os, mmap, json, struct, time
+from array import array
+from collections import Counter
+import logging as log
+from jsonltools.metrics import Metrics
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+MAGIC = b"JLCOL001"
+# magic, number of rows, number of failed lines, size and modification time of the cached file
+HEADER = struct.Struct("<8sQQQd")
+CACHE_SUFFIX = ".cache"
+# the fields which can be rebuilt from the cache, in the notation of Aggregator.fields
+CACHE_FIELDS = frozenset( ( "id", "created_at", "lang", "retweeted_status?", "in_reply_to_user_id", "geo?",
+	"user.id", "user.screen_name", "user.name", "entities.hashtags", "entities.user_mentions", "entities.urls" ) )
+# number of rows converted from NumPy views to Python values at a time
+BLOCK_SIZE = 1 << 16
+
+# bits of the flags column, recording which fields of each decoded line were present
+IS_OBJECT = 1
+HAS_ID = 2
+HAS_USER = 4
+IS_RETWEET = 8
+HAS_REPLY_FIELD = 16
+IS_REPLY = 32
+HAS_GEO_FIELD = 64
+IS_GEO = 128
+HAS_ENTITIES = 256
+
+# name -> ( array typecode, NumPy dtype ) for every column
+COLUMNS = {
+	"flags" : ( "H", "<u2" ),
+	"id" : ( "q", "<i8" ),
+	"created_at" : ( "i", "<i4" ),
+	"lang" : ( "i", "<i4" ),
+	"in_reply_to_user_id" : ( "q", "<i8" ),
+	"user.id" : ( "q", "<i8" ),
+	"user.screen_name" : ( "i", "<i4" ),
+	"user.name" : ( "i", "<i4" ),
+	"hashtags.offsets" : ( "q", "<i8" ),
+	"hashtags.text" : ( "i", "<i4" ),
+	"mentions.offsets" : ( "q", "<i8" ),
+	"mentions.id" : ( "q", "<i8" ),
+	"mentions.screen_name" : ( "i", "<i4" ),
+	"mentions.name" : ( "i", "<i4" ),
+	"urls.offsets" : ( "q", "<i8" ),
+	"urls.expanded_url" : ( "i", "<i4" ),
+	"vocab.offsets" : ( "q", "<i8" ),
+	"vocab.data" : ( "B", "u1" ),
+}
+
+# --------------------------------------------------------------
+
+def cache_path( path ):
+	return path + CACHE_SUFFIX
+
+def file_signature( path ):
+	st = os.stat( path )
+	return st.st_size, st.st_mtime
+
+def can_cache( aggregators, fields = () ):
+	""" Check whether every field needed by the aggregators, plus any extra fields, can be rebuilt from a cache. """
+	for agg in aggregators:
+		if agg.fields is None or not CACHE_FIELDS.issuperset( agg.fields ):
+			return False
+	return CACHE_FIELDS.issuperset( fields )
+
+# --------------------------------------------------------------
+
+class CacheWriter:
+	""" Collects the cached fields of each decoded line of a file, fed by process_lines(), and
+	writes them to the cache sidecar file of the file when saved. """
+	def __init__( self, path ):
+		self.path = path
+		self.size, self.mtime = file_signature( path )
+		# lines which could not be decoded, by type of error
+		self.failures = Counter()
+		self.columns = { name : array( code ) for name, ( code, dtype ) in COLUMNS.items() }
+		for name in ( "hashtags.offsets", "mentions.offsets", "urls.offsets" ):
+			self.columns[name].append( 0 )
+		self.vocab = {}
+
+	def __len__( self ):
+		return len(self.columns["flags"])
+
+	def failure( self, e ):
+		self.failures[type(e).__name__] += 1
+
+	def code( self, s ):
+		""" Dictionary-encode a string, where None is encoded as -1. """
+		if s is None:
+			return -1
+		code = self.vocab.get( s )
+		if code is None:
+			code = self.vocab[s] = len(self.vocab)
+		return code
+
+	def add( self, tweet ):
+		code = self.code
+		if not isinstance( tweet, dict ):
+			self.add_row( 0, 0, -1, -1, 0, 0, -1, -1, (), (), () )
+			return
+		flags = IS_OBJECT
+		if "id" in tweet:
+			flags |= HAS_ID
+		user_id, screen_name, name = 0, -1, -1
+		if "user" in tweet:
+			flags |= HAS_USER
+			user = tweet["user"]
+			user_id, screen_name, name = user["id"], code( user.get("screen_name") ), code( user.get("name") )
+		if not tweet.get("retweeted_status") is None:
+			flags |= IS_RETWEET
+		if "in_reply_to_user_id" in tweet:
+			flags |= HAS_REPLY_FIELD
+			if not tweet["in_reply_to_user_id"] is None:
+				flags |= IS_REPLY
+		if "geo" in tweet:
+			flags |= HAS_GEO_FIELD
+			if not tweet["geo"] is None:
+				flags |= IS_GEO
+		hashtags, mentions, urls = (), (), ()
+		if "entities" in tweet:
+			flags |= HAS_ENTITIES
+			entities = tweet["entities"]
+			hashtags = [ code( tag["text"] ) for tag in entities.get("hashtags", []) ]
+			mentions = [ ( mention["id"], code( mention.get("screen_name") ), code( mention.get("name") ) ) for mention in entities.get("user_mentions", []) ]
+			urls = [ code( url.get("expanded_url") ) for url in entities.get("urls", []) ]
+		# nothing is added until every field has been read
+		self.add_row( flags, tweet.get("id") or 0, code( tweet.get("created_at") ), code( tweet.get("lang") ),
+			tweet.get("in_reply_to_user_id") or 0, user_id, screen_name, name, hashtags, mentions, urls )
+
+	def add_row( self, flags, tweet_id, created_at, lang, reply_to, user_id, screen_name, name, hashtags, mentions, urls ):
+		columns = self.columns
+		columns["flags"].append( flags )
+		columns["id"].append( tweet_id )
+		columns["created_at"].append( created_at )
+		columns["lang"].append( lang )
+		columns["in_reply_to_user_id"].append( reply_to )
+		columns["user.id"].append( user_id )
+		columns["user.screen_name"].append( screen_name )
+		columns["user.name"].append( name )
+		columns["hashtags.text"].extend( hashtags )
+		columns["hashtags.offsets"].append( len(columns["hashtags.text"]) )
+		for mention_id, mention_screen_name, mention_name in mentions:
+			columns["mentions.id"].append( mention_id )
+			columns["mentions.screen_name"].append( mention_screen_name )
+			columns["mentions.name"].append( mention_name )
+		columns["mentions.offsets"].append( len(columns["mentions.id"]) )
+		columns["urls.expanded_url"].extend( urls )
+		columns["urls.offsets"].append( len(columns["urls.expanded_url"]) )
+
+	def save( self ):
+		""" Write the cache sidecar file, replacing any previous one atomically. """
+		columns = self.columns
+		offsets, data = columns["vocab.offsets"], columns["vocab.data"]
+		offsets.append( 0 )
+		for s in self.vocab:
+			data.frombytes( s.encode("utf-8", "surrogatepass") )
+			offsets.append( len(data) )
+		self.vocab = {}
+		# column positions are known once the length of the directory is fixed
+		names = list(COLUMNS)
+		directory = [ [ name, COLUMNS[name][1], 0, len(columns[name]) ] for name in names ]
+		while True:
+			encoded = json.dumps( { "columns" : directory, "failures" : self.failures } ).encode("utf-8")
+			pos = HEADER.size + 8 + len(encoded)
+			changed = False
+			for entry in directory:
+				pos += -pos % 8
+				if entry[2] != pos:
+					entry[2], changed = pos, True
+				pos += entry[3] * columns[entry[0]].itemsize
+			if not changed:
+				break
+		tmp_path = cache_path( self.path ) + ".tmp"
+		with open( tmp_path, "wb" ) as fout:
+			fout.write( HEADER.pack( MAGIC, len(self), sum( self.failures.values() ), self.size, self.mtime ) )
+			fout.write( struct.pack( "<Q", len(encoded) ) )
+			fout.write( encoded )
+			for name, dtype, offset, count in directory:
+				fout.write( b"\0" * ( offset - fout.tell() ) )
+				columns[name].tofile( fout )
+		os.replace( tmp_path, cache_path( self.path ) )
+
+# --------------------------------------------------------------
+
+class TweetCache:
+	""" Memory-mapped view of a cache sidecar file, with each column as a NumPy array. """
+	def __init__( self, path ):
+		self.path = path
+		self.fin = open( cache_path(path), "rb" )
+		if os.fstat( self.fin.fileno() ).st_size < HEADER.size:
+			self.fin.close()
+			raise ValueError("%s is not a supported cache file" % cache_path(path))
+		self.mm = mmap.mmap( self.fin.fileno(), 0, access=mmap.ACCESS_READ )
+		magic, self.num_rows, self.num_failed, self.size, self.mtime = HEADER.unpack_from( self.mm, 0 )
+		if magic != MAGIC:
+			self.close()
+			raise ValueError("%s is not a supported cache file" % cache_path(path))
+		length = struct.unpack_from( "<Q", self.mm, HEADER.size )[0]
+		start = HEADER.size + 8
+		directory = json.loads( self.mm[start:start + length].decode("utf-8") )
+		self.failures = Counter( directory["failures"] )
+		self.columns = {}
+		for name, dtype, offset, count in directory["columns"]:
+			self.columns[name] = np.frombuffer( self.mm, dtype=dtype, count=count, offset=offset )
+		self.strings = None
+
+	def __len__( self ):
+		return self.num_rows
+
+	def is_current( self ):
+		""" Check that the cached file has not changed since the cache was built. """
+		size, mtime = file_signature( self.path )
+		return size == self.size and mtime == self.mtime
+
+	def vocab( self ):
+		""" Decode the string vocabulary, which is shared by all of the string columns. None is added
+		as the last entry, so that the code -1 of a missing or null string looks up None. """
+		if self.strings is None:
+			raw = self.columns["vocab.data"].tobytes()
+			offsets = self.columns["vocab.offsets"].tolist()
+			self.strings = [ raw[offsets[i]:offsets[i+1]].decode("utf-8", "surrogatepass") for i in range(len(offsets)-1) ]
+			self.strings.append( None )
+		return self.strings
+
+	def batches( self, block_size = BLOCK_SIZE ):
+		""" Yield the rows in blocks, as TweetBatch views of the columns. """
+		for start in range( 0, self.num_rows, block_size ):
+			yield TweetBatch( self, start, min( start + block_size, self.num_rows ) )
+
+	def iter_tweets( self, fields ):
+		""" Yield a tweet for every row, containing those of the specified fields which were present. """
+		fields = set( fields )
+		want_id, want_time, want_lang = "id" in fields, "created_at" in fields, "lang" in fields
+		want_retweet, want_reply, want_geo = "retweeted_status?" in fields, "in_reply_to_user_id" in fields, "geo?" in fields
+		user_fields = [ field.split(".")[1] for field in ( "user.id", "user.screen_name", "user.name" ) if field in fields ]
+		want_hashtags, want_mentions, want_urls = "entities.hashtags" in fields, "entities.user_mentions" in fields, "entities.urls" in fields
+		want_entities = want_hashtags or want_mentions or want_urls
+		strings = self.vocab()
+		tag_objects = [ { "text" : s } for s in strings ] if want_hashtags else None
+		cols = self.columns
+		for start in range( 0, self.num_rows, BLOCK_SIZE ):
+			end = min( start + BLOCK_SIZE, self.num_rows )
+			block = lambda name : cols[name][start:end].tolist()
+			flags = block("flags")
+			ids = block("id") if want_id else None
+			times = block("created_at") if want_time else None
+			langs = block("lang") if want_lang else None
+			reply_to = block("in_reply_to_user_id") if want_reply else None
+			users = { field : block( "user." + field ) for field in user_fields }
+			if want_hashtags:
+				tag_offsets, tags = self.ragged_block( "hashtags.offsets", ( "hashtags.text", ), start, end )
+			if want_mentions:
+				mention_offsets, mention_ids, mention_names, mention_full_names = self.ragged_block( "mentions.offsets", ( "mentions.id", "mentions.screen_name", "mentions.name" ), start, end )
+			if want_urls:
+				url_offsets, urls = self.ragged_block( "urls.offsets", ( "urls.expanded_url", ), start, end )
+			for i in range( end - start ):
+				f = flags[i]
+				tweet = {}
+				if not f & IS_OBJECT:
+					yield tweet
+					continue
+				if want_id and f & HAS_ID:
+					tweet["id"] = ids[i]
+				if want_time and times[i] >= 0:
+					tweet["created_at"] = strings[times[i]]
+				if want_lang and langs[i] >= 0:
+					tweet["lang"] = strings[langs[i]]
+				if want_retweet and f & IS_RETWEET:
+					tweet["retweeted_status"] = True
+				if want_reply and f & HAS_REPLY_FIELD:
+					tweet["in_reply_to_user_id"] = reply_to[i] if f & IS_REPLY else None
+				if want_geo and f & HAS_GEO_FIELD:
+					tweet["geo"] = True if f & IS_GEO else None
+				if len(user_fields) > 0 and f & HAS_USER:
+					user = tweet["user"] = {}
+					for field in user_fields:
+						value = users[field][i]
+						user[field] = value if field == "id" else strings[value]
+				if want_entities and f & HAS_ENTITIES:
+					entities = tweet["entities"] = {}
+					if want_hashtags:
+						entities["hashtags"] = [ tag_objects[c] for c in tags[tag_offsets[i]:tag_offsets[i+1]] ]
+					if want_mentions:
+						entities["user_mentions"] = [ { "id" : mention_ids[j], "screen_name" : strings[mention_names[j]], "name" : strings[mention_full_names[j]] }
+							for j in range( mention_offsets[i], mention_offsets[i+1] ) ]
+					if want_urls:
+						entities["urls"] = [ { "expanded_url" : strings[c] } for c in urls[url_offsets[i]:url_offsets[i+1]] ]
+				yield tweet
+
+	def ragged_block( self, offsets_name, names, start, end ):
+		""" Return the offsets of the lists for a block of rows, relative to the start of the block, followed
+		by the values of each of the named columns for those lists. """
+		offsets = self.columns[offsets_name][start:end + 1]
+		first, last = int( offsets[0] ), int( offsets[-1] )
+		return [ ( offsets - first ).tolist() ] + [ self.columns[name][first:last].tolist() for name in names ]
+
+	def close( self ):
+		# the NumPy views must be released before the mmap can be closed
+		self.columns = None
+		try:
+			self.mm.close()
+		except BufferError:
+			# views are still held elsewhere, such as by the frames of an exception being raised, so
+			# the mmap is left to be closed once they are released, rather than hiding that exception
+			pass
+		self.mm = None
+		self.fin.close()
+
+class TweetBatch:
+	""" A block of rows of a cache, whose columns are read as zero-copy NumPy views. Rows are
+	numbered from 0 within the batch. """
+	def __init__( self, cache, start, end ):
+		self.cache, self.start, self.end = cache, start, end
+		self.strings = cache.vocab()
+
+	def __len__( self ):
+		return self.end - self.start
+
+	def column( self, name ):
+		return self.cache.columns[name][self.start:self.end]
+
+	def has( self, flag ):
+		""" Mask of the rows with a flag set. """
+		return ( self.column("flags") & flag ) != 0
+
+	def list_lengths( self, offsets_name ):
+		return np.diff( self.cache.columns[offsets_name][self.start:self.end + 1] )
+
+	def lists( self, offsets_name, *names ):
+		""" Return the row of every item in the lists of the rows, followed by the values of each of
+		the named columns for the items. """
+		offsets = self.cache.columns[offsets_name][self.start:self.end + 1]
+		rows = np.repeat( np.arange( len(self) ), np.diff( offsets ) )
+		first, last = int( offsets[0] ), int( offsets[-1] )
+		return [ rows ] + [ self.cache.columns[name][first:last] for name in names ]
+
+def first_counts( values ):
+	""" Return the distinct values of an array in order of their first occurrence, together
+	with the position of that occurrence and the number of occurrences of each value. """
+	keys, first, counts = np.unique( values, return_index=True, return_counts=True )
+	order = np.argsort( first, kind="stable" )
+	return keys[order], first[order], counts[order]
+
+def open_cache( path ):
+	""" Return the cache for a file, or None if it has no cache or the cache is out of date. """
+	if path == "-" or not os.path.exists( cache_path(path) ):
+		return None
+	try:
+		cache = TweetCache( path )
+	except ValueError as e:
+		log.warning("Ignoring unreadable cache for %s: %s" % ( path, e ) )
+		return None
+	if not cache.is_current():
+		log.warning("Ignoring out of date cache for %s" % path )
+		cache.close()
+		return None
+	return cache
+
+# --------------------------------------------------------------
+
+def process_cached( cache, aggregators, selection = None, metrics = None, dedupe = None ):
+	""" Apply each of the aggregators to the tweets rebuilt from a cache, in the same way as
+	process_lines() applies them to decoded lines. Returns the number of lines processed. """
+	if metrics is None:
+		metrics = Metrics()
+	fields = set()
+	for agg in aggregators:
+		fields.update( agg.fields )
+	if not selection is None:
+		fields.update( selection.fields )
+	if not dedupe is None:
+		fields.add( "id" )
+	# the errors were logged for each line when the cache was built
+	if cache.num_failed > 0:
+		log.error("Failed to parse %d tweets in %s" % ( cache.num_failed, cache.path ) )
+		metrics.failures.update( cache.failures )
+		for agg in aggregators:
+			agg.num_failed += cache.num_failed
+	if selection is None and dedupe is None and all( agg.batched for agg in aggregators ):
+		num_rows = process_batches( cache, aggregators, metrics )
+		count_lines( metrics, cache.num_failed, cache.size )
+		return num_rows + cache.num_failed
+	clock, stages = time.perf_counter, metrics.stages
+	tweets = iter( cache.iter_tweets( fields ) )
+	row = 0
+	while True:
+		start = clock()
+		tweet = next( tweets, None )
+		stages["decode"] += clock() - start
+		if tweet is None:
+			break
+		row += 1
+		if row % 1000 == 0:
+			count_lines( metrics, 1000 )
+			metrics.progress()
+		try:
+			if not selection is None and not selection.accepts( tweet ):
+				continue
+			if not dedupe is None and "id" in tweet and dedupe.add( tweet["id"] ):
+				metrics.num_duplicates += 1
+				continue
+		except Exception as e:
+			log.error("Failed to parse cached tweet %d: %s" % ( row, e ) )
+			metrics.failure( e )
+			for agg in aggregators:
+				agg.num_failed += 1
+			continue
+		start = clock()
+		for agg in aggregators:
+			try:
+				agg.apply( tweet )
+				agg.num_tweets += 1
+			except Exception as e:
+				log.error("Failed to parse cached tweet %d: %s" % ( row, e ) )
+				metrics.failure( e )
+				agg.num_failed += 1
+		stages["apply"] += clock() - start
+	count_lines( metrics, row % 1000 + cache.num_failed, cache.size )
+	return row + cache.num_failed
+
+def process_batches( cache, aggregators, metrics ):
+	""" Apply each of the aggregators to the rows of a cache a block at a time. Returns the number of rows. """
+	clock, stages = time.perf_counter, metrics.stages
+	num_failed = [ agg.num_failed for agg in aggregators ]
+	for batch in cache.batches():
+		start = clock()
+		for agg in aggregators:
+			agg.apply_batch( batch )
+		stages["apply"] += clock() - start
+		count_lines( metrics, len(batch) )
+		metrics.progress()
+	# rows lacking a field used by apply() would have raised a KeyError there
+	for agg, before in zip( aggregators, num_failed ):
+		if agg.num_failed > before:
+			log.error("Failed to parse %d cached tweets for %s, as they lack fields which it uses" % ( agg.num_failed - before, agg.__class__.__name__ ) )
+			metrics.failures["KeyError"] += agg.num_failed - before
+	return len(cache)
+
+def count_lines( metrics, n, size = 0 ):
+	""" Add lines, and the bytes of the original file which they represent, to the metrics. """
+	metrics.num_lines += n
+	metrics.file_lines += n
+	metrics.num_bytes += size
+	metrics.file_bytes += size
+
+# --------------------------------------------------------------
+
+def add_cache_options( parser ):
+	parser.add_option("--cache", action="store_true", dest="cache", help="read the decoded fields of each file from a binary cache alongside it, which is built on the first pass if it does not exist (requires NumPy)")
+
+def check_cache_options( parser, options ):
+	if options.cache and np is None:
+		parser.error( "NumPy is required for --cache" )
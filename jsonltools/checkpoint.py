@@ -0,0 +1,203 @@
+"""
+Checkpoints for long runs over large input files, so that a run which dies part of the way
+through, such as from running out of memory or a node being preempted, can be continued with
+--resume rather than started again. Every --checkpoint-interval seconds, between two lines, the
+index of the current input file and the byte offset of the next line in it are saved to a
+checkpoint directory, together with a snapshot of the state of the tool, such as its aggregates
+or the size of its output file. The checkpoint is replaced atomically, so that a run which dies
+while saving one can still be resumed from the previous checkpoint.
+
+Everything is written to a jsonl-checkpoint subdirectory of the checkpoint directory, so that
+the directory can be shared with other files, and only the files which were written for a
+checkpoint are ever removed, whether they are replaced by a later checkpoint or the run finishes.
+
+A snapshot should cost time in proportion to what has changed since the last checkpoint, rather
+than to the whole of the state, so that checkpoints do not slow the run down. For example, exact
+pair counts are spilled to a sorted run, and only the new runs are linked into the directory.
+
+For compressed files, the byte offset is a position in the decompressed data, so on resuming
+the lines before it are decompressed again, but not decoded.
+"""
+import os, time, pickle
+import logging as log
+from jsonltools.compression import detect_compression, iter_compressed_lines
+from jsonltools.engine import process_lines, process_file
+from jsonltools.metrics import Metrics
+
+# version of the checkpoint layout
+CHECKPOINT_FORMAT = 2
+CHECKPOINT_SUBDIR = "jsonl-checkpoint"
+CHECKPOINT_FILE = "checkpoint.pkl"
+# default number of seconds between checkpoints
+DEFAULT_INTERVAL = 300.0
+
+# --------------------------------------------------------------
+
+def iter_lines_from( path, offset = 0 ):
+	""" Yield the raw lines of a file, starting at a byte offset in its decompressed data. """
+	compression = detect_compression( path )
+	if compression is None:
+		with open( path, "rb" ) as fin:
+			fin.seek( offset )
+			for l in fin:
+				yield l
+		return
+	pos = 0
+	for l in iter_compressed_lines( path, compression ):
+		if pos >= offset:
+			yield l
+		pos += len(l)
+
+def file_signature( path ):
+	st = os.stat( path )
+	return st.st_size, st.st_mtime
+
+# --------------------------------------------------------------
+
+class Checkpointer:
+	""" Makes checkpoints for a run of a tool over a list of input files. The save function is called
+	with the checkpoint directory, and returns a picklable snapshot of the state of the tool, together
+	with the paths of any files in the directory which the snapshot refers to. The settings are any
+	options which must be the same when the run is resumed. """
+	def __init__( self, directory, inputs, settings, save, interval = DEFAULT_INTERVAL ):
+		# the save function is given the subdirectory which holds the checkpoint
+		self.directory = os.path.join( directory, CHECKPOINT_SUBDIR )
+		self.inputs, self.settings = list(inputs), settings
+		self.save, self.interval = save, interval
+		self.last = time.perf_counter()
+		self.num_checkpoints = 0
+		os.makedirs( self.directory, exist_ok=True )
+		# files written for the last checkpoint, which are the only ones that may be removed
+		self.paths = self.saved_paths()
+
+	def read( self ):
+		path = os.path.join( self.directory, CHECKPOINT_FILE )
+		if not os.path.exists( path ):
+			return None
+		with open( path, "rb" ) as fin:
+			checkpoint = pickle.load( fin )
+		if not isinstance(checkpoint, dict) or checkpoint.get("format") != CHECKPOINT_FORMAT:
+			raise ValueError("%s is not a supported checkpoint" % path)
+		return checkpoint
+
+	def saved_paths( self ):
+		""" Return the files written for an existing checkpoint, so that they are replaced by the next one. """
+		try:
+			checkpoint = self.read()
+		except ( ValueError, OSError, pickle.UnpicklingError ):
+			return []
+		return [] if checkpoint is None else checkpoint["paths"]
+
+	def load( self ):
+		""" Return the (file index, byte offset, state) saved by the last checkpoint, or None if
+		there is no checkpoint. Raises ValueError if the checkpoint was made by a different run. """
+		checkpoint = self.read()
+		if checkpoint is None:
+			return None
+		if checkpoint["inputs"] != self.inputs or checkpoint["settings"] != self.settings:
+			raise ValueError("The checkpoint in %s was made by a run with different input files or options" % self.directory)
+		for input_path, signature in zip( self.inputs, checkpoint["signatures"] ):
+			if file_signature( input_path ) != signature:
+				raise ValueError("Input file %s has changed since the checkpoint in %s was made" % ( input_path, self.directory ) )
+		return checkpoint["file_index"], checkpoint["offset"], checkpoint["state"]
+
+	def due( self ):
+		return time.perf_counter() - self.last >= self.interval
+
+	def checkpoint( self, file_index, offset ):
+		""" Save a checkpoint at a byte offset in an input file, where every line before it has been processed. """
+		start = time.perf_counter()
+		state, paths = self.save( self.directory )
+		checkpoint = { "format" : CHECKPOINT_FORMAT, "inputs" : self.inputs, "settings" : self.settings,
+			"file_index" : file_index, "offset" : offset, "state" : state, "paths" : list(paths),
+			"signatures" : [ file_signature( path ) for path in self.inputs[:file_index + 1] ] }
+		path = os.path.join( self.directory, CHECKPOINT_FILE )
+		with open( path + ".tmp", "wb" ) as fout:
+			pickle.dump( checkpoint, fout, protocol=pickle.HIGHEST_PROTOCOL )
+			fout.flush()
+			os.fsync( fout.fileno() )
+		os.replace( path + ".tmp", path )
+		# files which are only referred to by earlier checkpoints are no longer needed
+		self.remove( set( self.paths ) - set( paths ) )
+		self.paths = list(paths)
+		self.num_checkpoints += 1
+		self.last = time.perf_counter()
+		log.info("Saved checkpoint at byte %d of %s in %.2f sec" % ( offset, self.inputs[min( file_index, len(self.inputs) - 1 )], self.last - start ) )
+
+	def lines( self, file_index, path, offset = 0 ):
+		""" Yield the lines of an input file from a byte offset, making a checkpoint before a line whenever one is due. """
+		clock, interval = time.perf_counter, self.interval
+		n = 0
+		for l in iter_lines_from( path, offset ):
+			n += 1
+			# the caller has finished with every earlier line by the time it asks for this one
+			if n % 1000 == 0 and clock() - self.last >= interval:
+				self.checkpoint( file_index, offset )
+			yield l
+			offset += len(l)
+
+	def end_file( self, file_index ):
+		""" Make a checkpoint after the end of an input file, if one is due. """
+		if self.due():
+			self.checkpoint( file_index + 1, 0 )
+
+	def process_file( self, file_index, path, aggregators, workers = 1, selection = None, metrics = None, offset = 0 ):
+		""" Apply the aggregators to an input file from a byte offset, making checkpoints along the way.
+		Using multiple workers, a file can only be processed as a whole, so checkpoints are only made at its end. """
+		if metrics is None:
+			metrics = Metrics()
+		if workers > 1 and offset == 0:
+			num_lines = process_file( path, aggregators, workers, selection, metrics )
+		else:
+			if workers > 1:
+				log.info("The rest of %s will be processed by a single worker" % path )
+			metrics.start_file( path, selection, sized = offset == 0 )
+			# every line has to be read to keep track of the offset, so the index is not used for the selection
+			num_lines = process_lines( self.lines( file_index, path, offset ), aggregators, selection, metrics )
+		self.end_file( file_index )
+		return num_lines
+
+	def remove( self, paths ):
+		for path in paths:
+			try:
+				# never anything outside of the checkpoint subdirectory
+				os.remove( os.path.join( self.directory, os.path.basename( path ) ) )
+			except FileNotFoundError:
+				pass
+
+	def finish( self ):
+		""" Remove the files of the last checkpoint once the run is complete, and the checkpoint
+		subdirectory if nothing else has been put in it. """
+		self.remove( self.paths + [ os.path.join( self.directory, CHECKPOINT_FILE ) ] )
+		self.paths = []
+		try:
+			os.rmdir( self.directory )
+		except OSError:
+			pass
+
+# --------------------------------------------------------------
+
+def add_checkpoint_options( parser ):
+	parser.add_option("--checkpoint", action="store", type="string", dest="checkpoint_dir", help="save checkpoints to this directory, from which an interrupted run can be continued with --resume", default=None)
+	parser.add_option("--checkpoint-interval", action="store", type="float", dest="checkpoint_interval", help="seconds between checkpoints (default is %d)" % DEFAULT_INTERVAL, default=DEFAULT_INTERVAL)
+	parser.add_option("--resume", action="store_true", dest="resume", help="continue from the last checkpoint in the --checkpoint directory, if there is one")
+
+def check_checkpoint_options( parser, options, args ):
+	if options.checkpoint_dir is None:
+		if options.resume:
+			parser.error( "--resume requires a --checkpoint directory" )
+		return
+	if "-" in args:
+		parser.error( "Checkpoints cannot be made when reading from stdin" )
+	if options.dedupe:
+		parser.error( "Checkpoints cannot be combined with --dedupe" )
+
+def selection_settings( options ):
+	""" Return the selection options, which must be the same when a run is resumed. """
+	return { name : getattr( options, name ) for name in ( "since", "until", "ids", "langs", "users", "hashtags", "keywords" ) }
+
+def checkpointer_from_options( options, args, settings, save ):
+	""" Create a Checkpointer from the parsed command line options, or return None if checkpoints were not requested. """
+	if options.checkpoint_dir is None:
+		return None
+	return Checkpointer( options.checkpoint_dir, args, settings, save, options.checkpoint_interval )
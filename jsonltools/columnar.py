@@ -0,0 +1,211 @@
+"""
+Columnar output for the export tools. Rows are buffered into typed batches and written in bulk,
+either as a NumPy .npz archive or as a Parquet file. Column types are:
+
+	int64: 64-bit integers, such as tweet and user ids
+	timestamp: seconds since the epoch (UTC), or raw Twitter timestamp strings
+	category: dictionary-encoded strings, such as screen names and languages
+	string: arbitrary text, stored as UTF-8 bytes plus offsets in .npz files
+
+Each row is checked and converted to the column types as it is written, so that a bad value
+only loses its own row, rather than the batch which contains it.
+
+NumPy is required for .npz output, and pyarrow for Parquet output.
+"""
+import os, operator
+from jsonltools.timeparse import twitter_epoch, twitter_epochs
+
+FORMATS = ["csv", "npz", "parquet"]
+KINDS = ["int64", "timestamp", "category", "string"]
+
+# --------------------------------------------------------------
+
+def format_for_path( path ):
+	""" Guess the output format from the extension of a path, defaulting to CSV. """
+	ext = os.path.splitext(path)[1].lower().lstrip(".")
+	if ext in ("parquet", "pq"):
+		return "parquet"
+	if ext == "npz":
+		return "npz"
+	return "csv"
+
+def epoch_column( column ):
+	""" Convert a batch of timestamp values to a NumPy int64 array of seconds since the epoch. """
+	import numpy as np
+	if len(column) > 0 and isinstance(column[0], str):
+		return twitter_epochs( column )
+	return np.array( column, dtype=np.int64 )
+
+def to_int64( value ):
+	value = operator.index( value )
+	if value < -( 1 << 63 ) or value >= 1 << 63:
+		raise OverflowError("%d is out of range for a 64-bit integer" % value)
+	return value
+
+def to_epoch( value ):
+	return twitter_epoch( value ) if isinstance(value, str) else to_int64( value )
+
+def to_string( value ):
+	if value is None:
+		return ""
+	if not isinstance(value, str):
+		raise TypeError("Expected a string value, got %s" % type(value).__name__)
+	return value
+
+CONVERTERS = { "int64" : to_int64, "timestamp" : to_epoch, "category" : to_string, "string" : to_string }
+
+def encode_strings( values ):
+	encoded = [ ( "" if s is None else s ).encode("utf-8", "surrogatepass") for s in values ]
+	return b"".join(encoded), [ len(b) for b in encoded ]
+
+class ColumnWriter:
+	""" Base class for columnar writers. Rows are tuples with one value per column. """
+	def __init__( self, path, columns, batch_size = 65536 ):
+		for name, kind in columns:
+			if not kind in KINDS:
+				raise ValueError("Unknown column type '%s' for column %s" % ( kind, name ) )
+		self.path, self.columns, self.batch_size = path, columns, batch_size
+		self.converters = [ CONVERTERS[kind] for name, kind in columns ]
+		self.rows = []
+		self.num_rows = 0
+
+	def write( self, row ):
+		""" Add a row to the current batch, raising ValueError or TypeError if any of its values
+		cannot be converted to the type of its column, in which case the row is not added. """
+		if len(row) != len(self.converters):
+			raise ValueError("Expected %d values in row, got %d" % ( len(self.converters), len(row) ) )
+		self.rows.append( tuple( convert( value ) for convert, value in zip( self.converters, row ) ) )
+		if len(self.rows) >= self.batch_size:
+			self.flush()
+
+	def flush( self ):
+		if len(self.rows) > 0:
+			rows, self.rows = self.rows, []
+			# the batch is dropped if it cannot be written, rather than failing again on every later write
+			self.write_batch( list(zip(*rows)) )
+			self.num_rows += len(rows)
+
+	def write_batch( self, values ):
+		raise NotImplementedError
+
+	def close( self ):
+		self.flush()
+
+# --------------------------------------------------------------
+
+class NpzWriter(ColumnWriter):
+	""" Accumulates typed NumPy arrays for each column, and saves them in a single .npz archive when closed. """
+	def __init__( self, path, columns, batch_size = 65536, compress = False ):
+		import numpy
+		self.np = numpy
+		super().__init__( path, columns, batch_size )
+		self.compress = compress
+		self.parts = { name : [] for name, kind in columns }
+		self.vocabs = { name : {} for name, kind in columns if kind == "category" }
+
+	def write_batch( self, values ):
+		np = self.np
+		for ( name, kind ), column in zip( self.columns, values ):
+			if kind == "int64":
+				self.parts[name].append( np.array( column, dtype=np.int64 ) )
+			elif kind == "timestamp":
+				self.parts[name].append( epoch_column( column ) )
+			elif kind == "category":
+				vocab = self.vocabs[name]
+				codes = [ vocab.setdefault( "" if s is None else s, len(vocab) ) for s in column ]
+				self.parts[name].append( np.array( codes, dtype=np.int32 ) )
+			else:
+				data, lengths = encode_strings( column )
+				self.parts[name].append( ( np.frombuffer( data, dtype=np.uint8 ), np.array( lengths, dtype=np.int64 ) ) )
+
+	def string_arrays( self, name, parts ):
+		np = self.np
+		data = np.concatenate( [ p[0] for p in parts ] ) if len(parts) > 0 else np.zeros( 0, dtype=np.uint8 )
+		lengths = np.concatenate( [ p[1] for p in parts ] ) if len(parts) > 0 else np.zeros( 0, dtype=np.int64 )
+		offsets = np.zeros( len(lengths) + 1, dtype=np.int64 )
+		np.cumsum( lengths, out=offsets[1:] )
+		return { name + ".data" : data, name + ".offsets" : offsets }
+
+	def close( self ):
+		np = self.np
+		self.flush()
+		arrays = { "__columns__" : np.array( [ "%s:%s" % ( name, kind ) for name, kind in self.columns ] ) }
+		for name, kind in self.columns:
+			parts = self.parts[name]
+			if kind == "string":
+				arrays.update( self.string_arrays( name, parts ) )
+				continue
+			dtype = np.int32 if kind == "category" else np.int64
+			column = np.concatenate( parts ) if len(parts) > 0 else np.zeros( 0, dtype=dtype )
+			if kind == "timestamp":
+				column = column.astype("datetime64[s]")
+			if kind == "category":
+				data, lengths = encode_strings( list(self.vocabs[name]) )
+				arrays.update( self.string_arrays( name + ".vocab", [ ( np.frombuffer( data, dtype=np.uint8 ), np.array( lengths, dtype=np.int64 ) ) ] ) )
+				arrays[name + ".codes"] = column
+			else:
+				arrays[name] = column
+		save = np.savez_compressed if self.compress else np.savez
+		with open( self.path, "wb" ) as fout:
+			save( fout, **arrays )
+
+class ParquetWriter(ColumnWriter):
+	""" Writes each batch of rows as a row group in a Parquet file. """
+	def __init__( self, path, columns, batch_size = 65536 ):
+		import pyarrow, pyarrow.parquet
+		self.pa = pyarrow
+		super().__init__( path, columns, batch_size )
+		types = { "int64" : pyarrow.int64(), "timestamp" : pyarrow.timestamp("s", tz="UTC"),
+			"category" : pyarrow.dictionary( pyarrow.int32(), pyarrow.string() ), "string" : pyarrow.string() }
+		self.schema = pyarrow.schema( [ ( name, types[kind] ) for name, kind in columns ] )
+		self.writer = pyarrow.parquet.ParquetWriter( path, self.schema )
+
+	def write_batch( self, values ):
+		pa = self.pa
+		arrays = []
+		for ( name, kind ), column in zip( self.columns, values ):
+			if kind == "int64":
+				arrays.append( pa.array( column, type=pa.int64() ) )
+			elif kind == "timestamp":
+				arrays.append( pa.array( epoch_column( column ), type=pa.int64() ).cast( self.schema.field(name).type ) )
+			elif kind == "category":
+				arrays.append( pa.array( column, type=pa.string() ).dictionary_encode() )
+			else:
+				arrays.append( pa.array( column, type=pa.string() ) )
+		self.writer.write_table( pa.Table.from_arrays( arrays, schema=self.schema ) )
+
+	def close( self ):
+		self.flush()
+		self.writer.close()
+
+def open_writer( path, columns, fmt = None, batch_size = 65536 ):
+	if fmt is None:
+		fmt = format_for_path( path )
+	if fmt == "npz":
+		return NpzWriter( path, columns, batch_size )
+	if fmt == "parquet":
+		return ParquetWriter( path, columns, batch_size )
+	raise ValueError("Unsupported columnar format '%s'" % fmt)
+
+# --------------------------------------------------------------
+
+def decode_strings( data, offsets ):
+	raw = data.tobytes()
+	return [ raw[offsets[i]:offsets[i+1]].decode("utf-8", "surrogatepass") for i in range(len(offsets)-1) ]
+
+def load_npz( path ):
+	""" Read an .npz file written by NpzWriter, returning a dictionary of column name to NumPy array.
+	String and category columns are returned as object arrays. """
+	import numpy as np
+	archive = np.load( path )
+	columns = {}
+	for spec in archive["__columns__"]:
+		name, kind = str(spec).rsplit(":", 1)
+		if kind == "string":
+			columns[name] = np.array( decode_strings( archive[name + ".data"], archive[name + ".offsets"] ), dtype=object )
+		elif kind == "category":
+			vocab = np.array( decode_strings( archive[name + ".vocab.data"], archive[name + ".vocab.offsets"] ), dtype=object )
+			columns[name] = vocab[ archive[name + ".codes"] ]
+		else:
+			columns[name] = archive[name]
+	return columns
@@ -0,0 +1,151 @@
+"""
+Streaming input for compressed JSONL files. The compression format is detected from the file
+extension or its magic bytes, and the data is decompressed in a separate process or thread,
+so that decompression overlaps with JSON decoding.
+
+Where a parallel decompressor (pigz, lbzip2, pbzip2, xz, zstd) is available on the path it is
+used in a child process, which allows block-compressed formats to be decompressed on several
+cores. Otherwise gzip, bz2 and xz are handled by the standard library, and zstd by the optional
+zstandard package.
+"""
+import os, sys, bz2, gzip, lzma, shutil, subprocess, threading
+from queue import Queue, Full
+
+# size of each block of decompressed data passed between threads
+CHUNK_SIZE = 1 << 20
+# maximum number of blocks buffered ahead of the reader
+QUEUE_SIZE = 16
+
+MAGIC = [ (b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd") ]
+EXTENSIONS = { ".gz" : "gzip", ".bz2" : "bz2", ".xz" : "xz", ".lzma" : "xz", ".zst" : "zstd", ".zstd" : "zstd" }
+# external decompressors in order of preference, all of which write to stdout
+EXTERNAL = {
+	"gzip" : [ ["pigz", "-dc"] ],
+	"bz2" : [ ["lbzip2", "-dc"], ["pbzip2", "-dc"] ],
+	"xz" : [ ["xz", "-T0", "-dc"] ],
+	"zstd" : [ ["zstd", "-T0", "-dcq"] ],
+}
+# set to False to always use in-process decompression
+use_external = True
+
+# --------------------------------------------------------------
+
+def detect_compression( path ):
+	""" Return the name of the compression format used by a file, or None if it is uncompressed. """
+	ext = os.path.splitext(path)[1].lower()
+	if ext in EXTENSIONS:
+		return EXTENSIONS[ext]
+	if path == "-":
+		header = sys.stdin.buffer.peek(6)[:6]
+	else:
+		with open(path, "rb") as fin:
+			header = fin.read(6)
+	for magic, compression in MAGIC:
+		if header.startswith(magic):
+			return compression
+	return None
+
+def open_decompressed( fin, compression ):
+	""" Wrap a binary file object with an in-process decompressor. """
+	if compression == "gzip":
+		return gzip.GzipFile(fileobj=fin)
+	if compression == "bz2":
+		return bz2.BZ2File(fin)
+	if compression == "xz":
+		return lzma.LZMAFile(fin)
+	if compression == "zstd":
+		try:
+			import zstandard
+		except ImportError:
+			raise IOError("Reading zstd files requires either the zstd command or the zstandard package")
+		return zstandard.ZstdDecompressor().stream_reader(fin, read_across_frames=True)
+	raise ValueError("Unsupported compression format '%s'" % compression)
+
+def find_external( compression ):
+	if not use_external:
+		return None
+	for cmd in EXTERNAL.get(compression, []):
+		if shutil.which(cmd[0]) is not None:
+			return cmd
+	return None
+
+# --------------------------------------------------------------
+
+def split_lines( chunks ):
+	""" Yield complete lines from a sequence of arbitrary blocks of bytes. Lines do not include the terminator. """
+	remainder = b""
+	for chunk in chunks:
+		lines = (remainder + chunk).split(b"\n")
+		remainder = lines.pop()
+		for l in lines:
+			yield l
+	if len(remainder) > 0:
+		yield remainder
+
+def _put( queue, item, stop ):
+	""" Add an item to the queue, giving up if the reader has stopped. """
+	while not stop.is_set():
+		try:
+			queue.put(item, timeout=0.1)
+			return
+		except Full:
+			pass
+
+def _pump( fin, queue, stop ):
+	""" Read decompressed blocks in a background thread and pass them to the reader. """
+	try:
+		while not stop.is_set():
+			chunk = fin.read(CHUNK_SIZE)
+			if not chunk:
+				break
+			_put(queue, chunk, stop)
+	except Exception as e:
+		_put(queue, e, stop)
+	finally:
+		_put(queue, None, stop)
+
+def iter_threaded_chunks( fin ):
+	queue, stop = Queue(QUEUE_SIZE), threading.Event()
+	thread = threading.Thread(target=_pump, args=(fin, queue, stop), daemon=True)
+	thread.start()
+	try:
+		while True:
+			chunk = queue.get()
+			if chunk is None:
+				break
+			if isinstance(chunk, Exception):
+				raise chunk
+			yield chunk
+	finally:
+		stop.set()
+		thread.join()
+
+def iter_external_chunks( cmd, path ):
+	proc = subprocess.Popen(cmd + [path], stdout=subprocess.PIPE, bufsize=CHUNK_SIZE)
+	try:
+		while True:
+			chunk = proc.stdout.read(CHUNK_SIZE)
+			if not chunk:
+				break
+			yield chunk
+	finally:
+		proc.stdout.close()
+		if proc.wait() not in (0, -13):
+			raise IOError("%s failed with exit code %d on %s" % ( cmd[0], proc.returncode, path ) )
+
+def iter_compressed_lines( path, compression ):
+	""" Yield the lines of a compressed file, with decompression running concurrently. """
+	cmd = find_external( compression ) if path != "-" else None
+	if cmd is not None:
+		yield from split_lines( iter_external_chunks( cmd, path ) )
+		return
+	if path == "-":
+		fin = sys.stdin.buffer
+	else:
+		fin = open(path, "rb")
+	try:
+		with open_decompressed( fin, compression ) as dfin:
+			yield from split_lines( iter_threaded_chunks( dfin ) )
+	finally:
+		if not fin is sys.stdin.buffer:
+			fin.close()
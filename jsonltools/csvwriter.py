@@ -0,0 +1,104 @@
+"""
+Buffered CSV output for the export tools. Rows are accumulated in memory, and each large buffer
+is encoded and written to disk by a background thread, so that decoding and writing overlap. The
+queue of pending buffers is bounded, so that a slow disk holds up decoding rather than using an
+unbounded amount of memory.
+
+By default, rows are simply joined with the separator, and the caller is responsible for making
+sure that values do not contain it. Alternatively, standard CSV quoting can be used, in which
+case string values are quoted and numbers are not.
+
+An existing file can also be continued from a given size, such as the size recorded by sync() at
+a checkpoint, in which case anything written after that point is discarded.
+"""
+import os, io, csv, threading
+from queue import Queue
+
+# --------------------------------------------------------------
+
+class CsvWriter:
+	""" Writes rows of values to a delimited text file, using a background thread. """
+	def __init__( self, path, sep = ",", quote = False, buffer_size = 1 << 20, queue_size = 8, encoding = "utf-8", errors = "ignore", offset = None ):
+		self.path, self.sep, self.quote = path, sep, quote
+		self.buffer_size, self.encoding, self.errors = buffer_size, encoding, errors
+		self.num_rows = 0
+		self.error = None
+		self.new_buffer()
+		if offset is None:
+			self.fout = open( path, "wb" )
+			self.size = 0
+		else:
+			self.fout = open( path, "r+b" )
+			self.fout.truncate( offset )
+			self.fout.seek( offset )
+			self.size = offset
+		self.queue = Queue( queue_size )
+		self.thread = threading.Thread( target=self.run, name="CsvWriter" )
+		self.thread.daemon = True
+		self.thread.start()
+
+	def new_buffer( self ):
+		self.buffer = io.StringIO()
+		if self.quote:
+			self.csv = csv.writer( self.buffer, delimiter=self.sep, lineterminator="\n", quoting=csv.QUOTE_NONNUMERIC )
+
+	def run( self ):
+		while True:
+			data = self.queue.get()
+			if data is None:
+				break
+			if isinstance(data, threading.Event):
+				try:
+					self.fout.flush()
+					os.fsync( self.fout.fileno() )
+				except Exception as e:
+					self.error = self.error or e
+				data.set()
+				continue
+			# after a failure, keep taking buffers so that the main thread is not blocked
+			if self.error is None:
+				try:
+					encoded = data.encode( self.encoding, self.errors )
+					self.fout.write( encoded )
+					self.size += len(encoded)
+				except Exception as e:
+					self.error = e
+
+	def check( self ):
+		if not self.error is None:
+			raise IOError("Failed to write to %s: %s" % ( self.path, self.error ) )
+
+	def write( self, values ):
+		""" Write a row, which is a sequence of strings, or also numbers when quoting. """
+		if self.quote:
+			self.csv.writerow( values )
+		else:
+			self.buffer.write( self.sep.join( values ) )
+			self.buffer.write( "\n" )
+		self.num_rows += 1
+		if self.buffer.tell() >= self.buffer_size:
+			self.flush()
+
+	def flush( self ):
+		""" Pass the current buffer to the background thread, waiting if too many are pending. """
+		self.check()
+		if self.buffer.tell() > 0:
+			self.queue.put( self.buffer.getvalue() )
+			self.new_buffer()
+
+	def sync( self ):
+		""" Wait until every row written so far is on disk, and return the size of the file. """
+		self.flush()
+		done = threading.Event()
+		self.queue.put( done )
+		done.wait()
+		self.check()
+		return self.size
+
+	def close( self ):
+		""" Write any remaining rows, and wait for the background thread to finish. """
+		self.flush()
+		self.queue.put( None )
+		self.thread.join()
+		self.fout.close()
+		self.check()
@@ -0,0 +1,139 @@
+"""
+Projection-aware decoding of tweets. Each aggregator declares the field paths that it uses,
+and an optional byte pattern that a line must contain for the tweet to be of any interest
+to it. Lines which cannot match are counted without being passed to the aggregators, although
+they are still checked to be valid JSON, so that malformed lines are counted as failures in the
+same way as without the prefilter. When the optional simdjson package is installed, only the
+declared fields are materialised, and skipped lines are checked without materialising them.
+
+Full decoding uses the fastest available of orjson, ujson and the standard json module.
+"""
+import re
+import json
+try:
+	import orjson
+except ImportError:
+	orjson = None
+try:
+	import ujson
+except ImportError:
+	ujson = None
+try:
+	import simdjson
+except ImportError:
+	simdjson = None
+
+BACKENDS = ["orjson", "ujson", "json", "simdjson"]
+
+# --------------------------------------------------------------
+
+def available_backends():
+	modules = { "orjson" : orjson, "ujson" : ujson, "json" : json, "simdjson" : simdjson }
+	return [ name for name in BACKENDS if not modules[name] is None ]
+
+def full_loads( backend = None ):
+	""" Return the loads() function for the named backend, or for the fastest available one. """
+	if backend is None:
+		backend = available_backends()[0]
+	if backend == "orjson" and not orjson is None:
+		loads = orjson.loads
+		# orjson is stricter than the json module, eg. for unpaired surrogates in truncated text
+		def strict_loads( l ):
+			try:
+				return loads(l)
+			except orjson.JSONDecodeError:
+				return json.loads(l)
+		return strict_loads
+	if backend == "ujson" and not ujson is None:
+		return ujson.loads
+	if backend == "json":
+		return json.loads
+	raise ValueError("JSON backend '%s' is not available" % backend)
+
+def field_pattern( field ):
+	""" Return a byte pattern matching a JSON key whose value is a non-empty array of objects. """
+	return re.compile( b'"' + re.escape(field.encode()) + rb'"\s*:\s*\[\s*\{' )
+
+def validator( loads ):
+	""" Return a function which raises an exception for a line which is not valid JSON, using
+	simdjson to parse the line without materialising it where available, or otherwise the
+	specified loads() function. """
+	if simdjson is None:
+		return loads
+	parser = simdjson.Parser()
+	def validate( l ):
+		# the parsed document is discarded at once, so that the parser can be reused
+		parser.parse(l)
+	return validate
+
+# --------------------------------------------------------------
+
+class Projection:
+	""" Decode only the specified dotted field paths from each line, using simdjson. A path
+	ending in '?' only records whether the field is present and not null. """
+	def __init__( self, fields ):
+		self.parser = simdjson.Parser()
+		self.paths = []
+		for field in sorted(set(fields)):
+			presence = field.endswith("?")
+			keys = field.rstrip("?").split(".")
+			self.paths.append( ( "/" + "/".join(keys), keys, presence ) )
+
+	def __call__( self, l ):
+		doc = self.parser.parse(l)
+		if not isinstance(doc, simdjson.Object):
+			raise ValueError("Line does not contain a JSON object")
+		tweet = {}
+		for pointer, keys, presence in self.paths:
+			try:
+				value = doc.at_pointer(pointer)
+			except (KeyError, IndexError, TypeError):
+				continue
+			if presence:
+				value = None if value is None else True
+			elif isinstance(value, simdjson.Object):
+				value = value.as_dict()
+			elif isinstance(value, simdjson.Array):
+				value = value.as_list()
+			target = tweet
+			for key in keys[:-1]:
+				target = target.setdefault(key, {})
+			target[keys[-1]] = value
+		return tweet
+
+class Decoder:
+	""" Decodes lines on behalf of a set of aggregators, plus any extra fields needed by the
+	caller. Returns None for lines which were skipped, because none of the aggregators could
+	make use of them. """
+	def __init__( self, aggregators, backend = None, prefilter = True, fields = () ):
+		self.patterns = None
+		# a line can only be skipped if every aggregator declares a prefilter
+		if prefilter and len(aggregators) > 0 and all( not agg.prefilter is None for agg in aggregators ):
+			self.patterns = [ agg.prefilter for agg in aggregators ]
+		fields = list(fields)
+		for agg in aggregators:
+			if agg.fields is None:
+				fields = None
+				break
+			fields += agg.fields
+		if backend is None and not simdjson is None and not fields is None:
+			backend = "simdjson"
+		if backend == "simdjson":
+			if simdjson is None:
+				raise ValueError("JSON backend 'simdjson' is not available")
+			if fields is None:
+				raise ValueError("The simdjson backend requires every aggregator to declare its fields")
+			self.loads = Projection( fields )
+			# simdjson parses a line faster than the patterns can scan it
+			self.patterns = None
+		else:
+			self.loads = full_loads( backend )
+		self.validate = None if self.patterns is None else validator( self.loads )
+
+	def __call__( self, l ):
+		if not self.patterns is None:
+			if l[0:1] == b"{" and l[-1:] == b"}" and not any( p.search(l) for p in self.patterns ):
+				# a skipped line which is not valid JSON is still a parse failure
+				self.validate(l)
+				return None
+		return self.loads(l)
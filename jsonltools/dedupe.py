@@ -0,0 +1,283 @@
+"""
+Detection of duplicate tweets across overlapping input files, such as the output of restarted
+collectors or merged keyword streams. The ids of the tweets seen so far are held in a compact
+structure, rather than a Python set which costs over 70 bytes per id:
+
+	IdSet: an exact set of 64-bit ids, stored as sorted arrays of 8 bytes per id
+	BloomFilter: an approximate set with a configurable false positive rate, at about 10 bits
+		per id for a 1% rate, where a false positive causes a unique tweet to be skipped
+
+Both spill to memory-mapped temporary files once they exceed a memory budget. NumPy is used to
+merge and search sorted ids in bulk when it is installed.
+"""
+import os, mmap, math, heapq, bisect, tempfile
+from array import array
+import logging as log
+from jsonltools.sketches import hash64
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# number of new ids held in a Python set before they are sorted into a run
+PENDING_SIZE = 1 << 16
+# default memory budget in MB, beyond which ids are stored in memory-mapped files
+DEFAULT_MEMORY = 512
+
+# --------------------------------------------------------------
+
+class MappedArray:
+	""" An array of unsigned 64-bit integers in a temporary file, accessed through mmap. """
+	def __init__( self, values, spill_dir = None ):
+		fd, self.path = tempfile.mkstemp( prefix="dedupe-", suffix=".ids", dir=spill_dir )
+		with os.fdopen( fd, "wb" ) as fout:
+			if isinstance(values, array):
+				values.tofile( fout )
+			else:
+				fout.write( memoryview(values).cast("B") )
+		self.fin = open( self.path, "rb" )
+		self.mm = mmap.mmap( self.fin.fileno(), 0, access=mmap.ACCESS_READ ) if os.path.getsize( self.path ) > 0 else None
+		self.values = memoryview( self.mm ).cast("Q") if not self.mm is None else array("Q")
+
+	def close( self ):
+		if isinstance(self.values, memoryview):
+			self.values.release()
+		if not self.mm is None:
+			self.mm.close()
+		self.fin.close()
+		if os.path.exists( self.path ):
+			os.remove( self.path )
+
+def as_numpy( values ):
+	return np.frombuffer( values, dtype=np.uint64 ) if len(values) > 0 else np.zeros( 0, dtype=np.uint64 )
+
+def merge_sorted( a, b ):
+	""" Merge two sorted sequences of distinct ids into a new sorted array. """
+	if not np is None:
+		merged = np.concatenate( ( as_numpy(a), as_numpy(b) ) )
+		merged.sort( kind="mergesort" )
+		return merged
+	return array( "Q", heapq.merge( a, b ) )
+
+def sorted_contains( values, key ):
+	i = bisect.bisect_left( values, key )
+	return i < len(values) and values[i] == key
+
+# --------------------------------------------------------------
+
+class IdSet:
+	""" Exact set of 64-bit ids, organised as a log-structured merge of sorted runs. New ids are
+	held in a small Python set, which is sorted into a run when it is full, and runs of similar
+	size are merged, so a lookup searches at most log2(n/PENDING_SIZE) runs. Runs which are larger
+	than the memory budget are written to temporary files and accessed through mmap. """
+	def __init__( self, memory = DEFAULT_MEMORY, spill_dir = None ):
+		self.max_ids = max( PENDING_SIZE, int( memory * (1 << 20) / 8 ) )
+		self.spill_dir = spill_dir
+		self.pending = set()
+		# each run is a sorted array (or NumPy array) of ids, or a MappedArray
+		self.runs = []
+		self.num_ids = 0
+
+	def run_values( self, run ):
+		return run.values if isinstance(run, MappedArray) else run
+
+	def __contains__( self, key ):
+		if key in self.pending:
+			return True
+		for run in self.runs:
+			if sorted_contains( self.run_values(run), key ):
+				return True
+		return False
+
+	def add( self, key ):
+		""" Add an id, returning True if it had already been seen. """
+		if key in self:
+			return True
+		self.pending.add( key )
+		self.num_ids += 1
+		if len(self.pending) >= PENDING_SIZE:
+			self.flush()
+		return False
+
+	def flush( self ):
+		""" Sort the pending ids into a new run. """
+		if len(self.pending) > 0:
+			self.push( array( "Q", sorted(self.pending) ) )
+			self.pending = set()
+
+	def push( self, run ):
+		self.runs.append( run )
+		# merge runs until each is less than half the size of the one before
+		while len(self.runs) > 1 and len(self.run_values(self.runs[-2])) <= 2 * len(self.run_values(self.runs[-1])):
+			b, a = self.runs.pop(), self.runs.pop()
+			merged = merge_sorted( self.run_values(a), self.run_values(b) )
+			for run in ( a, b ):
+				if isinstance(run, MappedArray):
+					run.close()
+			if len(merged) > self.max_ids:
+				log.debug("Spilling %d ids to disk" % len(merged) )
+				merged = MappedArray( merged, self.spill_dir )
+			self.runs.append( merged )
+
+	def add_sorted( self, keys ):
+		""" Add a sorted array of distinct ids, returning an array of those which had already been seen. """
+		self.flush()
+		if np is None:
+			seen = array( "Q", [ key for key in keys if key in self ] )
+			fresh = array( "Q", [ key for key in keys if not sorted_contains( seen, key ) ] )
+		else:
+			keys = as_numpy( keys )
+			found = np.zeros( len(keys), dtype=bool )
+			for run in self.runs:
+				values = as_numpy( self.run_values(run) )
+				if len(values) == 0:
+					continue
+				pos = np.minimum( np.searchsorted( values, keys ), len(values) - 1 )
+				found |= values[pos] == keys
+			seen, fresh = array( "Q", keys[found].tobytes() ), keys[~found]
+		if len(fresh) > 0:
+			self.num_ids += len(fresh)
+			self.push( fresh if np is None else np.array( fresh ) )
+		return seen
+
+	def sorted( self ):
+		""" Return all of the ids as a new sorted array. """
+		self.flush()
+		merged = array( "Q" )
+		for run in self.runs:
+			merged = merge_sorted( merged, self.run_values(run) )
+		return merged
+
+	def __len__( self ):
+		return self.num_ids
+
+	def close( self ):
+		for run in self.runs:
+			if isinstance(run, MappedArray):
+				run.close()
+		self.runs = []
+		self.pending = set()
+
+	def __del__( self ):
+		try:
+			self.close()
+		except Exception:
+			pass
+
+# --------------------------------------------------------------
+
+class BitArray:
+	""" Fixed-size array of bits, held in memory or in a memory-mapped temporary file. """
+	def __init__( self, num_bits, memory = DEFAULT_MEMORY, spill_dir = None ):
+		num_bytes = ( num_bits + 7 ) // 8
+		self.path = None
+		if num_bytes > memory * (1 << 20):
+			fd, self.path = tempfile.mkstemp( prefix="dedupe-", suffix=".bloom", dir=spill_dir )
+			os.ftruncate( fd, num_bytes )
+			self.bits = mmap.mmap( fd, num_bytes )
+			os.close( fd )
+		else:
+			self.bits = bytearray( num_bytes )
+
+	def close( self ):
+		if not self.path is None:
+			self.bits.close()
+			os.remove( self.path )
+			self.path = None
+
+class BloomFilter:
+	""" Bloom filter for 64-bit ids with a fixed capacity and false positive rate, using double hashing. """
+	def __init__( self, capacity, error, memory = DEFAULT_MEMORY, spill_dir = None ):
+		self.capacity, self.error = capacity, error
+		self.num_bits = max( 64, int( math.ceil( -capacity * math.log( error ) / math.log( 2 ) ** 2 ) ) )
+		self.num_hashes = max( 1, int( round( self.num_bits / capacity * math.log( 2 ) ) ) )
+		self.array = BitArray( self.num_bits, memory, spill_dir )
+		self.num_ids = 0
+
+	def positions( self, key ):
+		h = hash64( key )
+		h1, h2 = h & 0xFFFFFFFF, ( h >> 32 ) | 1
+		m = self.num_bits
+		return [ ( h1 + i * h2 ) % m for i in range(self.num_hashes) ]
+
+	def __contains__( self, key ):
+		bits = self.array.bits
+		return all( bits[p >> 3] & ( 1 << ( p & 7 ) ) for p in self.positions( key ) )
+
+	def add( self, key ):
+		""" Add an id, returning True if it had probably already been seen. """
+		bits = self.array.bits
+		seen = True
+		for p in self.positions( key ):
+			mask = 1 << ( p & 7 )
+			if not bits[p >> 3] & mask:
+				seen = False
+				bits[p >> 3] |= mask
+		if not seen:
+			self.num_ids += 1
+		return seen
+
+class ScalableBloomFilter:
+	""" A sequence of Bloom filters which grows as ids are added, so the number of ids does not need
+	to be known in advance. Each new filter has twice the capacity and half the false positive rate
+	of the previous one, so the overall false positive rate stays below the specified error. """
+	def __init__( self, error = 0.001, capacity = 1 << 20, memory = DEFAULT_MEMORY, spill_dir = None ):
+		self.error, self.memory, self.spill_dir = error, memory, spill_dir
+		self.filters = [ BloomFilter( capacity, error / 2, memory, spill_dir ) ]
+
+	def __contains__( self, key ):
+		return any( key in f for f in self.filters )
+
+	def add( self, key ):
+		""" Add an id, returning True if it had probably already been seen. """
+		for f in self.filters[:-1]:
+			if key in f:
+				return True
+		current = self.filters[-1]
+		if current.num_ids >= current.capacity:
+			if key in current:
+				return True
+			current = BloomFilter( current.capacity * 2, current.error / 2, self.memory, self.spill_dir )
+			self.filters.append( current )
+		return current.add( key )
+
+	def add_sorted( self, keys ):
+		return array( "Q", [ key for key in keys if self.add( key ) ] )
+
+	def __len__( self ):
+		return sum( f.num_ids for f in self.filters )
+
+	def close( self ):
+		for f in self.filters:
+			f.array.close()
+		self.filters = []
+
+# --------------------------------------------------------------
+
+class ShardFilter:
+	""" Duplicate detection within one byte range of a file processed by a worker. Ids in the skip
+	array were already seen before the range, and any other id is skipped after its first occurrence. """
+	def __init__( self, skip, memory = DEFAULT_MEMORY, spill_dir = None ):
+		self.skip = skip
+		self.local = IdSet( memory, spill_dir )
+
+	def add( self, key ):
+		return sorted_contains( self.skip, key ) or self.local.add( key )
+
+	def close( self ):
+		self.local.close()
+
+def add_dedupe_options( parser ):
+	parser.add_option("--dedupe", action="store_true", dest="dedupe", help="skip tweets whose ids have already been seen, in any of the input files")
+	parser.add_option("--dedupe-error", action="store", type="float", dest="dedupe_error", help="use a Bloom filter for --dedupe with this false positive rate, rather than an exact set of ids", default=None)
+	parser.add_option("--dedupe-memory", action="store", type="float", dest="dedupe_memory", help="memory budget in MB for --dedupe, beyond which ids are stored in memory-mapped temporary files (default is %d)" % DEFAULT_MEMORY, default=DEFAULT_MEMORY)
+
+def dedupe_from_options( parser, options ):
+	""" Create the set of seen tweet ids for --dedupe, or None if it was not requested. """
+	if not options.dedupe:
+		return None
+	if options.dedupe_error is None:
+		return IdSet( options.dedupe_memory )
+	if options.dedupe_error <= 0 or options.dedupe_error >= 1:
+		parser.error( "The --dedupe-error rate must be between 0 and 1" )
+	return ScalableBloomFilter( options.dedupe_error, memory = options.dedupe_memory )
@@ -0,0 +1,192 @@
+"""
+Single-pass driver for the tweet tools. Each JSONL file is read and decoded once, and every
+decoded tweet is passed to one or more aggregators, so that any combination of reports
+costs a single JSON decoding pass.
+"""
+import sys, time
+import logging as log
+from jsonltools.compression import detect_compression, iter_compressed_lines
+from jsonltools.decoding import Decoder
+from jsonltools.metrics import Metrics
+
+# --------------------------------------------------------------
+
+class Aggregator:
+	""" Base class for anything that consumes decoded tweets one at a time. """
+	# should a new instance be reported for each input file?
+	per_file = True
+	# dotted paths of the tweet fields used by apply(), or None if the whole tweet is needed
+	fields = None
+	# compiled byte pattern which a line must match to have any effect other than being counted
+	prefilter = None
+	# does the aggregator implement apply_batch()?
+	batched = False
+
+	def __init__( self ):
+		self.num_tweets = 0
+		self.num_failed = 0
+
+	def spawn( self ):
+		""" Return a new empty aggregator with the same configuration as this one. """
+		return self.__class__()
+
+	def apply( self, tweet ):
+		raise NotImplementedError
+
+	def apply_batch( self, batch ):
+		""" Apply the aggregator to every row of a jsonltools.cache.TweetBatch, with the same effect
+		as apply() on the tweets rebuilt from the rows, including the counts of tweets and failures. """
+		raise NotImplementedError
+
+	def merge( self, other ):
+		self.num_tweets += other.num_tweets
+		self.num_failed += other.num_failed
+
+	def report( self, top = 10 ):
+		raise NotImplementedError
+
+# --------------------------------------------------------------
+
+def iter_lines( path, selection = None ):
+	""" Yield the raw lines of a JSONL file as bytes, where '-' denotes stdin. Compressed
+	files are decompressed on the fly. If a selection is given and the file has an index,
+	only the candidate lines for the selection are read. """
+	if not selection is None:
+		lines = selection.select_lines( path )
+		if not lines is None:
+			yield from lines
+			return
+	compression = detect_compression( path )
+	if not compression is None:
+		yield from iter_compressed_lines( path, compression )
+		return
+	if path == "-":
+		for l in sys.stdin.buffer:
+			yield l
+		return
+	with open(path, "rb") as fin:
+		for l in fin:
+			yield l
+
+def process_lines( lines, aggregators, selection = None, metrics = None, dedupe = None, cache = None ):
+	""" Decode every tweet in the sequence of lines once, and apply each of the aggregators to it,
+	skipping any tweets not accepted by the selection, and any tweets whose ids have already been
+	added to the dedupe set, if given. Lines which the selection rules out from their raw bytes are
+	not decoded. Every decoded line is also added to the CacheWriter, if given.
+	Returns the number of non-empty lines that were processed. Timings, parse failures and duplicates
+	are recorded in the metrics, if given. """
+	if metrics is None:
+		metrics = Metrics()
+	if selection is None and dedupe is None and cache is None:
+		decode = Decoder( aggregators )
+	else:
+		# lines cannot be skipped before the selection and the id have been checked
+		fields = ( () if selection is None else selection.fields ) + ( () if dedupe is None else ( "id", ) )
+		if not cache is None:
+			from jsonltools.cache import CACHE_FIELDS
+			fields += tuple( CACHE_FIELDS )
+		decode = Decoder( aggregators, fields = fields, prefilter = False )
+	# every line is needed for the cache, so lines can only be skipped before decoding without one
+	candidate = None if selection is None or not cache is None else selection.candidate
+	clock, stages = time.perf_counter, metrics.stages
+	line_number = 0
+	for l in metrics.timed_lines( lines ):
+		l = l.strip()
+		if len(l) == 0:
+			continue
+		line_number += 1
+		if line_number % 1000 == 0:
+			metrics.progress()
+		start = clock()
+		if not candidate is None and not candidate(l):
+			stages["decode"] += clock() - start
+			continue
+		added = False
+		try:
+			tweet = decode(l)
+			if not cache is None:
+				cache.add( tweet )
+				added = True
+			if not tweet is None and not selection is None and not selection.accepts( tweet ):
+				continue
+			# tweets without ids, such as deletion notices, are never duplicates
+			if not dedupe is None and not tweet is None and "id" in tweet and dedupe.add( tweet["id"] ):
+				metrics.num_duplicates += 1
+				continue
+		except Exception as e:
+			log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
+			metrics.failure( e )
+			if not cache is None and not added:
+				cache.failure( e )
+			for agg in aggregators:
+				agg.num_failed += 1
+			continue
+		finally:
+			stages["decode"] += clock() - start
+		if tweet is None:
+			for agg in aggregators:
+				agg.num_tweets += 1
+			continue
+		start = clock()
+		for agg in aggregators:
+			try:
+				agg.apply( tweet )
+				agg.num_tweets += 1
+			except Exception as e:
+				log.error("Failed to parse tweet on line %d: %s" % ( line_number, e ) )
+				metrics.failure( e )
+				agg.num_failed += 1
+		stages["apply"] += clock() - start
+	return line_number
+
+def process_file( path, aggregators, workers = 1, selection = None, metrics = None, dedupe = None, cache = False ):
+	""" Apply the aggregators to every tweet in the specified file, optionally splitting
+	the file across a number of worker processes, and optionally skipping duplicate tweets.
+	If cache is True, the tweets are read from the columnar cache of the file, which is
+	built by this pass if the file does not have an up-to-date cache. """
+	if metrics is None:
+		metrics = Metrics()
+	metrics.start_file( path, selection )
+	num_duplicates = metrics.num_duplicates
+	if cache and path != "-":
+		num_lines = _process_cached( path, aggregators, workers, selection, metrics, dedupe )
+	else:
+		num_lines = _process_file( path, aggregators, workers, selection, metrics, dedupe )
+	if not dedupe is None:
+		log.info("Skipped %d duplicate tweets in %s" % ( metrics.num_duplicates - num_duplicates, path ) )
+	return num_lines
+
+def _process_cached( path, aggregators, workers, selection, metrics, dedupe ):
+	from jsonltools.cache import CacheWriter, open_cache, process_cached, can_cache, cache_path
+	if not can_cache( aggregators, () if selection is None else selection.fields ):
+		log.info("The reports use fields which are not cached, so %s will be decoded" % path )
+		return _process_file( path, aggregators, workers, selection, metrics, dedupe )
+	if workers > 1:
+		log.info("Cached tweets are processed by a single worker")
+	tweet_cache = open_cache( path )
+	if not tweet_cache is None:
+		log.info("Reading %d cached tweets from %s" % ( len(tweet_cache), cache_path(path) ) )
+		try:
+			return process_cached( tweet_cache, aggregators, selection, metrics, dedupe )
+		finally:
+			tweet_cache.close()
+	# every line is needed for the cache, so the index is not used for the selection
+	writer = CacheWriter( path )
+	num_lines = process_lines( iter_lines(path), aggregators, selection, metrics, dedupe, writer )
+	with metrics.stage("output"):
+		writer.save()
+	log.info("Wrote cache of %d tweets to %s" % ( len(writer), cache_path(path) ) )
+	return num_lines
+
+def _process_file( path, aggregators, workers, selection, metrics, dedupe ):
+	if not selection is None:
+		if workers > 1:
+			log.info("Selected tweets are processed by a single worker")
+		return process_lines( iter_lines( path, selection ), aggregators, selection, metrics, dedupe )
+	if workers > 1 and path != "-":
+		if not detect_compression( path ) is None:
+			log.info("Compressed files cannot be split, so %s will be processed by a single worker" % path )
+			return process_lines( iter_lines(path), aggregators, metrics = metrics, dedupe = dedupe )
+		from jsonltools.parallel import process_file_parallel
+		return process_file_parallel( path, aggregators, workers, metrics, dedupe )
+	return process_lines( iter_lines(path), aggregators, metrics = metrics, dedupe = dedupe )
@@ -0,0 +1,109 @@
+"""
+Live processing of tweets as they are collected, either by following a growing JSONL file in the
+same way as 'tail -f', or by reading tweets piped to stdin. Counts are kept incrementally, so the
+cost of each refresh is proportional to the new data only, and the top keys in a set of sliding
+time windows are logged periodically.
+"""
+import os, sys, time
+import logging as log
+from jsonltools.engine import process_lines
+from jsonltools.windows import WindowedCounter, parse_windows, DEFAULT_WINDOWS
+
+# --------------------------------------------------------------
+
+class Refresher:
+	""" Calls a function whenever it is ticked, at most once per interval in seconds. """
+	def __init__( self, interval, callback ):
+		self.interval, self.callback = interval, callback
+		self.last = time.perf_counter()
+
+	def tick( self ):
+		now = time.perf_counter()
+		if now - self.last >= self.interval:
+			self.callback()
+			# the interval starts after the callback, in case it is slow
+			self.last = time.perf_counter()
+
+def ticking( lines, refresher ):
+	""" Yield each of the lines, ticking the refresher after each one has been processed. """
+	for l in lines:
+		yield l
+		refresher.tick()
+
+def follow_lines( path, poll = 1.0, idle = None ):
+	""" Yield the complete lines of a file, and then continue to yield new lines as they are appended,
+	without finishing. When there is no new data, idle() is called before waiting for poll seconds.
+	If the file is truncated or replaced, such as by log rotation, reading restarts from the
+	beginning of the new file. """
+	fin = open( path, "rb" )
+	partial = b""
+	try:
+		while True:
+			for l in fin:
+				# a line without a newline has not been completely written yet
+				if not l.endswith(b"\n"):
+					partial += l
+					continue
+				if len(partial) > 0:
+					l, partial = partial + l, b""
+				yield l
+			if not idle is None:
+				idle()
+			time.sleep( poll )
+			try:
+				st = os.stat( path )
+			except OSError:
+				# the file is being replaced
+				continue
+			if st.st_ino != os.fstat( fin.fileno() ).st_ino:
+				log.info("%s has been replaced, reading from the beginning of the new file" % path )
+				fin.close()
+				fin = open( path, "rb" )
+				partial = b""
+			elif st.st_size < fin.tell():
+				log.info("%s has been truncated, reading from the beginning" % path )
+				fin.seek( 0 )
+				partial = b""
+	finally:
+		fin.close()
+
+# --------------------------------------------------------------
+
+def follow( path, counter, title, options, selection = None, metrics = None, dedupe = None ):
+	""" Apply a KeyCounter to a followed file or to stdin ('-'), logging the top keys in each sliding
+	window periodically, until the input ends or the user interrupts. """
+	windowed = WindowedCounter( counter, parse_windows( options.windows ), title )
+	refresher = Refresher( options.refresh, lambda: windowed.report_windows( options.top ) )
+	if path == "-":
+		log.info("Reading tweets from stdin ...")
+		lines = sys.stdin.buffer
+	else:
+		log.info("Following tweets in %s ..." % path)
+		lines = follow_lines( path, options.poll, refresher.tick )
+	if not metrics is None:
+		# a growing file has no fixed size to estimate the remaining time from
+		metrics.start_file( path, sized = False )
+	try:
+		process_lines( ticking( lines, refresher ), [windowed], selection, metrics, dedupe )
+	except KeyboardInterrupt:
+		log.info("Stopped reading from %s" % path)
+	windowed.report_windows( options.top )
+	windowed.report( options.top )
+
+def add_follow_options( parser ):
+	parser.add_option("--follow", action="store_true", dest="follow", help="keep reading the input file as it grows, like tail -f, or read tweets piped to stdin with '-', and report the top items in sliding time windows")
+	parser.add_option("--windows", action="store", type="string", dest="windows", help="comma-separated sliding window lengths for --follow, in s, m, h or d (default is %s)" % DEFAULT_WINDOWS, default=DEFAULT_WINDOWS)
+	parser.add_option("--refresh", action="store", type="float", dest="refresh", help="seconds between reports of the sliding windows for --follow (default is 60)", default=60.0)
+	parser.add_option("--poll", action="store", type="float", dest="poll", help="seconds to wait for new data in a followed file (default is 1)", default=1.0)
+
+def check_follow_options( parser, options, args ):
+	""" Check that the options for --follow are valid, if it was given. """
+	if not options.follow:
+		return
+	if len(args) != 1:
+		parser.error( "Only one file can be followed" )
+	try:
+		if len( parse_windows( options.windows ) ) == 0:
+			parser.error( "At least one window length must be specified" )
+	except ValueError as e:
+		parser.error( str(e) )
@@ -0,0 +1,248 @@
+"""
+Sparse matrix representation of weighted graphs over interned integer ids, such as hashtag
+cooccurrences. Edges are held as a CSR (compressed sparse row) matrix of NumPy arrays, so that
+top-k selection and edge weights are computed with whole-array operations, and the matrix can
+be written in binary formats which load much faster than a text edge list:
+
+	npz: the CSR arrays, in the layout used by scipy.sparse.save_npz(), so that the file can
+		be read with scipy.sparse.load_npz()
+	edges: a flat binary edge list of (uint32 source, uint32 target, uint64 weight) records,
+		which can be read with numpy.fromfile( path, dtype=EDGE_DTYPE )
+
+Both binary formats are written together with a vocabulary file (the output path plus .vocab),
+where line i holds the name of node i and its frequency, separated by a tab, preceded by an
+external integer id for graphs whose nodes have one, such as user ids. NumPy is required
+to build a graph, while SciPy is only needed to convert a graph to a scipy.sparse matrix.
+"""
+import os
+from array import array
+import logging as log
+from jsonltools.csvwriter import CsvWriter
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+GRAPH_FORMATS = ["csv", "npz", "edges"]
+VOCAB_SUFFIX = ".vocab"
+EDGE_DTYPE = None if np is None else np.dtype( [ ( "source", "<u4" ), ( "target", "<u4" ), ( "weight", "<u8" ) ] )
+# number of edges copied from an iterator into NumPy arrays at a time
+BLOCK_SIZE = 1 << 20
+
+# --------------------------------------------------------------
+
+def graph_format_for_path( path ):
+	""" Guess the graph output format from the extension of a path, defaulting to CSV. """
+	ext = os.path.splitext(path)[1].lower().lstrip(".")
+	if ext in ("npz", "edges"):
+		return ext
+	return "csv"
+
+def vocab_path( path ):
+	return path + VOCAB_SUFFIX
+
+def packed_edges( items ):
+	""" Convert a sequence of (packed pair,count) items, as produced by a PairCounter, into NumPy
+	arrays of sources, targets and weights. Items are copied in blocks, so the memory used is
+	16 bytes per edge rather than a Python tuple per edge. """
+	keys, counts = [], []
+	block_keys, block_counts = array("Q"), array("Q")
+	for key, count in items:
+		block_keys.append( key )
+		block_counts.append( count )
+		if len(block_keys) >= BLOCK_SIZE:
+			keys.append( np.frombuffer( block_keys, dtype=np.uint64 ).copy() )
+			counts.append( np.frombuffer( block_counts, dtype=np.uint64 ).copy() )
+			block_keys, block_counts = array("Q"), array("Q")
+	keys.append( np.array( block_keys, dtype=np.uint64 ) )
+	counts.append( np.array( block_counts, dtype=np.uint64 ) )
+	keys, counts = np.concatenate( keys ), np.concatenate( counts )
+	return ( keys >> np.uint64(32) ).astype(np.uint32), ( keys & np.uint64(0xFFFFFFFF) ).astype(np.uint32), counts
+
+def top_indices( values, k ):
+	""" Indices of the k largest values in descending order, using a partial sort. Ties are broken
+	by index, so that edges, which are stored in order of their endpoints, are ranked in the same
+	order as by aggregators.top_items(). """
+	if k <= 0 or len(values) == 0:
+		return np.zeros( 0, dtype=np.int64 )
+	n = len(values)
+	if k < n:
+		# every value tied with the k-th largest is a candidate, so that the lowest indices are kept
+		threshold = values[ np.argpartition( values, n - k )[n - k] ]
+		candidates = np.flatnonzero( values >= threshold )
+	else:
+		candidates = np.arange( n )
+	# values may be unsigned, so cannot be negated to reverse the order, so the candidates are
+	# reversed before a stable sort, which leaves ties in ascending order once that is reversed too
+	candidates = candidates[::-1]
+	return candidates[ np.argsort( values[candidates], kind="stable" )[::-1] ][:k]
+
+# --------------------------------------------------------------
+
+class SparseGraph:
+	""" A weighted graph over nodes 0..n-1 with names, stored as a CSR matrix. For an undirected
+	graph, each edge is stored in both directions. freqs holds the number of observations of each
+	node, such as the number of tweets containing a hashtag, out of a total number of observations,
+	which are used to compute association weights for the edges. ids optionally holds an external
+	64-bit id for each node. """
+	def __init__( self, indptr, indices, data, names, freqs = None, total = 0, symmetric = False, ids = None ):
+		self.indptr, self.indices, self.data = indptr, indices, data
+		self.names, self.freqs, self.total = names, freqs, total
+		self.symmetric, self.ids = symmetric, ids
+
+	@classmethod
+	def from_edges( cls, sources, targets, weights, names, freqs = None, total = 0, symmetric = False, ids = None ):
+		""" Build a graph from arrays of edges, where the weights of repeated edges are summed. """
+		n = len(names)
+		if symmetric:
+			sources, targets = np.concatenate( ( sources, targets ) ), np.concatenate( ( targets, sources ) )
+			weights = np.concatenate( ( weights, weights ) )
+		# a single sort on a combined 64-bit key is faster than a lexsort on two arrays
+		keys = sources.astype(np.uint64) * np.uint64(max( n, 1 )) + targets.astype(np.uint64)
+		order = np.argsort( keys, kind="stable" )
+		keys, weights = keys[order], weights[order]
+		del order
+		if len(keys) > 0:
+			starts = np.flatnonzero( np.concatenate( ( [True], keys[1:] != keys[:-1] ) ) )
+			if len(starts) < len(keys):
+				weights = np.add.reduceat( weights, starts )
+				keys = keys[starts]
+		rows = ( keys // np.uint64(max( n, 1 )) ).astype(np.int64)
+		indices = ( keys % np.uint64(max( n, 1 )) ).astype(np.int32)
+		indptr = np.zeros( n + 1, dtype=np.int64 )
+		np.cumsum( np.bincount( rows, minlength=n ), out=indptr[1:] )
+		return cls( indptr, indices, weights.astype(np.uint64), names, freqs, total, symmetric, ids )
+
+	def num_nodes( self ):
+		return len(self.indptr) - 1
+
+	def num_edges( self ):
+		""" Number of distinct edges, where an undirected edge is only counted once. """
+		return len(self.data) // 2 if self.symmetric else len(self.data)
+
+	def rows( self ):
+		""" The source node of every stored edge. """
+		return np.repeat( np.arange( self.num_nodes(), dtype=np.int32 ), np.diff( self.indptr ) )
+
+	def edge_arrays( self ):
+		""" Return (sources,targets,weights) arrays with each edge listed once, so with source < target
+		for an undirected graph. """
+		rows = self.rows()
+		if not self.symmetric:
+			return rows, self.indices, self.data
+		upper = rows < self.indices
+		return rows[upper], self.indices[upper], self.data[upper]
+
+	def top_edges( self, k ):
+		""" Return the k edges with the largest weights as (source,target,weight) tuples. """
+		sources, targets, weights = self.edge_arrays()
+		return [ ( int(sources[i]), int(targets[i]), int(weights[i]) ) for i in top_indices( weights, k ) ]
+
+	def weights( self ):
+		""" Compute pointwise mutual information (in bits) and Jaccard similarity for every stored edge,
+		from the node frequencies. Returns None if the frequencies are not known. """
+		if self.freqs is None or self.total == 0:
+			return None
+		freqs = np.asarray( self.freqs, dtype=np.float64 )
+		a, b = freqs[self.rows()], freqs[self.indices]
+		both = self.data.astype(np.float64)
+		with np.errstate( divide="ignore", invalid="ignore" ):
+			pmi = np.log2( both * self.total / ( a * b ) )
+			jaccard = both / ( a + b - both )
+		return pmi, jaccard
+
+	def neighbours( self, node, top ):
+		""" Return the positions in indices/data of the top neighbours of a node, by edge weight. """
+		start, end = self.indptr[node], self.indptr[node + 1]
+		return start + top_indices( self.data[start:end], top )
+
+	def to_scipy( self ):
+		import scipy.sparse
+		n = self.num_nodes()
+		return scipy.sparse.csr_matrix( ( self.data, self.indices, self.indptr ), shape=( n, n ) )
+
+	# --------------------------------------------------------------
+
+	def save( self, path, fmt = None ):
+		""" Write the graph and its vocabulary in one of the binary formats. """
+		if fmt is None:
+			fmt = graph_format_for_path( path )
+		if fmt == "npz":
+			self.save_npz( path )
+		elif fmt == "edges":
+			self.save_edges( path )
+		else:
+			raise ValueError("Unsupported graph format '%s'" % fmt)
+		self.save_vocab( vocab_path( path ) )
+
+	def save_npz( self, path ):
+		n = self.num_nodes()
+		arrays = { "format" : np.array( b"csr" ), "shape" : np.array( [ n, n ], dtype=np.int64 ),
+			"indptr" : self.indptr, "indices" : self.indices, "data" : self.data,
+			"symmetric" : np.array( self.symmetric ), "total" : np.array( self.total, dtype=np.int64 ) }
+		if not self.ids is None:
+			arrays["ids"] = np.asarray( self.ids, dtype=np.int64 )
+		with open( path, "wb" ) as fout:
+			np.savez( fout, **arrays )
+
+	def save_edges( self, path ):
+		sources, targets, weights = self.edge_arrays()
+		edges = np.empty( len(weights), dtype=EDGE_DTYPE )
+		edges["source"], edges["target"], edges["weight"] = sources, targets, weights
+		edges.tofile( path )
+
+	def save_vocab( self, path ):
+		freqs = self.freqs if not self.freqs is None else [ 0 ] * len(self.names)
+		writer = CsvWriter( path, "\t" )
+		if self.ids is None:
+			for name, freq in zip( self.names, freqs ):
+				writer.write( ( name, str(freq) ) )
+		else:
+			for node_id, name, freq in zip( self.ids, self.names, freqs ):
+				writer.write( ( str(node_id), name, str(freq) ) )
+		writer.close()
+
+# --------------------------------------------------------------
+
+def load_vocab( path ):
+	""" Read a vocabulary file, returning the node names, frequencies and ids, or None for the ids
+	if the nodes do not have them. """
+	names, freqs, ids = [], [], []
+	with open( path, "r", encoding="utf-8" ) as fin:
+		for l in fin:
+			parts = l.rstrip("\n").split("\t")
+			if len(parts) == 3:
+				ids.append( int(parts[0]) )
+			names.append( parts[-2] )
+			freqs.append( int(parts[-1]) )
+	return names, np.array( freqs, dtype=np.int64 ), np.array( ids, dtype=np.int64 ) if len(ids) > 0 else None
+
+def load_graph( path ):
+	""" Read a graph which was written in .npz format by SparseGraph.save(). """
+	names, freqs, ids = load_vocab( vocab_path( path ) )
+	with np.load( path ) as archive:
+		total = int( archive["total"] ) if "total" in archive else 0
+		symmetric = bool( archive["symmetric"] ) if "symmetric" in archive else False
+		return SparseGraph( archive["indptr"], archive["indices"], archive["data"], names,
+			freqs if total > 0 else None, total, symmetric, ids )
+
+def write_neighbours( graph, path, top, header = ( "Node", "Neighbour" ) ):
+	""" Write the top neighbours of every node in the graph to a tab-separated file, together with
+	the weight of each edge and, where the node frequencies are known, its PMI and Jaccard weights. """
+	log.info("Writing top %d neighbours of %d nodes to %s ..." % ( top, graph.num_nodes(), path ) )
+	weights = graph.weights()
+	writer = CsvWriter( path, "\t" )
+	if weights is None:
+		log.info("Node frequencies are not available, so PMI and Jaccard weights are not included")
+		writer.write( list(header) + [ "Count" ] )
+	else:
+		writer.write( list(header) + [ "Count", "PMI", "Jaccard" ] )
+	names, indices, data = graph.names, graph.indices, graph.data
+	for node in range( graph.num_nodes() ):
+		name = names[node]
+		for pos in graph.neighbours( node, top ):
+			row = [ name, names[indices[pos]], str(data[pos]) ]
+			if not weights is None:
+				row += [ "%.4f" % weights[0][pos], "%.4f" % weights[1][pos] ]
+			writer.write( row )
+	writer.close()
@@ -0,0 +1,209 @@
+"""
+Persistent byte-offset index for JSONL tweet files. For each file, the index records the byte
+offset and length of every valid tweet, together with its id and created_at time, plus the
+line orderings sorted by id and by time. It is stored in a sidecar file which is read through
+mmap, so time windows and id lookups can seek directly to the relevant lines.
+
+Optionally, posting lists mapping hashtags and user ids to index positions are stored in a
+second sidecar file.
+"""
+import os, mmap, struct, gzip, pickle, bisect, time
+from array import array
+import logging as log
+from jsonltools.engine import Aggregator
+from jsonltools.decoding import Decoder
+from jsonltools.metrics import Metrics
+from jsonltools.timeparse import twitter_epoch
+from jsonltools.normalise import hashtag
+
+MAGIC = b"JLIDX001"
+# magic, number of entries, size and modification time of the indexed file
+HEADER = struct.Struct("<8sQQd")
+INDEX_SUFFIX = ".idx"
+POSTINGS_SUFFIX = ".idx.posts"
+
+# --------------------------------------------------------------
+
+def index_path( path ):
+	return path + INDEX_SUFFIX
+
+def postings_path( path ):
+	return path + POSTINGS_SUFFIX
+
+def file_signature( path ):
+	st = os.stat( path )
+	return st.st_size, st.st_mtime
+
+class IndexEntries(Aggregator):
+	""" Collects the index entries for each tweet, fed by build_index(). """
+	fields = ( "id", "created_at", "entities.hashtags", "user.id" )
+
+	def __init__( self, postings = False ):
+		super().__init__()
+		self.offsets, self.lengths = array("Q"), array("I")
+		self.ids, self.times = array("q"), array("q")
+		self.postings = { "hashtags" : {}, "users" : {} } if postings else None
+		# lines which are not tweets, such as delete notices, are skipped and only counted
+		self.num_skipped = 0
+
+	def add( self, tweet, offset, length ):
+		if not isinstance(tweet, dict) or not "id" in tweet or not "created_at" in tweet:
+			self.num_skipped += 1
+			return
+		tweet_id, created_at = tweet["id"], twitter_epoch( tweet["created_at"] )
+		# checked before anything is appended, so that the arrays always have the same length
+		if not isinstance(tweet_id, int) or isinstance(tweet_id, bool):
+			raise TypeError("Tweet id is not an integer")
+		if tweet_id < -( 1 << 63 ) or tweet_id >= 1 << 63:
+			raise OverflowError("Tweet id %d is out of range" % tweet_id)
+		if not self.postings is None:
+			tags = set( hashtag[tag["text"]] for tag in tweet.get("entities", {}).get("hashtags", []) )
+			user_id = tweet["user"]["id"] if "user" in tweet else None
+		position = len(self.offsets)
+		self.offsets.append( offset )
+		self.lengths.append( length )
+		self.ids.append( tweet_id )
+		self.times.append( created_at )
+		if not self.postings is None:
+			for tag in tags:
+				self.postings["hashtags"].setdefault( tag, array("I") ).append( position )
+			if not user_id is None:
+				self.postings["users"].setdefault( user_id, array("I") ).append( position )
+
+def build_index( path, postings = False, metrics = None ):
+	""" Scan a JSONL file and write its index sidecar file(s). Returns the number of indexed tweets. """
+	if metrics is None:
+		metrics = Metrics()
+	clock, stages = time.perf_counter, metrics.stages
+	entries = IndexEntries( postings )
+	decode = Decoder( [entries] )
+	size, mtime = file_signature( path )
+	offset, line_number = 0, 0
+	metrics.start_file( path )
+	with open( path, "rb" ) as fin:
+		for l in metrics.timed_lines( fin ):
+			length = len(l)
+			stripped = l.strip()
+			if len(stripped) > 0:
+				line_number += 1
+				if line_number % 1000 == 0:
+					metrics.progress()
+				start = clock()
+				try:
+					tweet = decode(stripped)
+					decoded = clock()
+					stages["decode"] += decoded - start
+					entries.add( tweet, offset, length )
+					stages["apply"] += clock() - decoded
+				except Exception as e:
+					log.error("Failed to index tweet on line %d: %s" % ( line_number, e ) )
+					metrics.failure( e )
+			offset += length
+	if entries.num_skipped > 0:
+		log.info("Skipped %d lines without a tweet id and timestamp, such as delete notices" % entries.num_skipped )
+	start = clock()
+	n = len(entries.offsets)
+	id_order = array( "I", sorted( range(n), key=entries.ids.__getitem__ ) )
+	time_order = array( "I", sorted( range(n), key=entries.times.__getitem__ ) )
+	with open( index_path(path), "wb" ) as fout:
+		fout.write( HEADER.pack( MAGIC, n, size, mtime ) )
+		for values in ( entries.offsets, entries.ids, entries.times, entries.lengths, id_order, time_order ):
+			values.tofile( fout )
+	if postings:
+		with gzip.open( postings_path(path), "wb", compresslevel=6 ) as fout:
+			pickle.dump( entries.postings, fout, protocol=pickle.HIGHEST_PROTOCOL )
+	stages["output"] += clock() - start
+	return n
+
+# --------------------------------------------------------------
+
+class Sorted:
+	""" Read-only view of values in the order given by a permutation, for use with bisect. """
+	def __init__( self, values, order ):
+		self.values, self.order = values, order
+
+	def __len__( self ):
+		return len(self.order)
+
+	def __getitem__( self, i ):
+		return self.values[self.order[i]]
+
+class TweetIndex:
+	""" Memory-mapped view of an index sidecar file. """
+	def __init__( self, path ):
+		self.path = path
+		self.fin = open( index_path(path), "rb" )
+		self.mm = mmap.mmap( self.fin.fileno(), 0, access=mmap.ACCESS_READ )
+		magic, n, self.size, self.mtime = HEADER.unpack_from( self.mm, 0 )
+		if magic != MAGIC:
+			raise ValueError("%s is not a supported index file" % index_path(path))
+		view = memoryview( self.mm )
+		pos = HEADER.size
+		def take( code, width ):
+			nonlocal pos
+			values = view[pos:pos + n * width].cast( code )
+			pos += n * width
+			return values
+		self.offsets, self.ids, self.times = take("Q", 8), take("q", 8), take("q", 8)
+		self.lengths, self.id_order, self.time_order = take("I", 4), take("I", 4), take("I", 4)
+		self.views = [ view, self.offsets, self.ids, self.times, self.lengths, self.id_order, self.time_order ]
+
+	def __len__( self ):
+		return len(self.offsets)
+
+	def is_current( self ):
+		""" Check that the indexed file has not changed since the index was built. """
+		size, mtime = file_signature( self.path )
+		return size == self.size and mtime == self.mtime
+
+	def positions_between( self, since = None, until = None ):
+		""" Positions of tweets created in the range [since,until), in seconds since the epoch. """
+		times = Sorted( self.times, self.time_order )
+		lo = 0 if since is None else bisect.bisect_left( times, since )
+		hi = len(times) if until is None else bisect.bisect_left( times, until )
+		return set( self.time_order[lo:hi] )
+
+	def positions_for_ids( self, ids ):
+		ordered = Sorted( self.ids, self.id_order )
+		positions = set()
+		for tweet_id in ids:
+			i = bisect.bisect_left( ordered, tweet_id )
+			while i < len(ordered) and ordered[i] == tweet_id:
+				positions.add( self.id_order[i] )
+				i += 1
+		return positions
+
+	def iter_positions( self, positions ):
+		""" Yield the raw lines at the given index positions, in file order, read through mmap. """
+		with open( self.path, "rb" ) as fin:
+			data = mmap.mmap( fin.fileno(), 0, access=mmap.ACCESS_READ )
+			try:
+				for i in sorted(positions):
+					start = self.offsets[i]
+					yield data[start:start + self.lengths[i]]
+			finally:
+				data.close()
+
+	def close( self ):
+		for view in reversed(self.views):
+			view.release()
+		self.mm.close()
+		self.fin.close()
+
+def open_index( path ):
+	""" Return the index for a file, or None if it has no index or the index is out of date. """
+	if path == "-" or not os.path.exists( index_path(path) ):
+		return None
+	index = TweetIndex( path )
+	if not index.is_current():
+		log.warning("Ignoring out of date index for %s" % path )
+		index.close()
+		return None
+	return index
+
+def load_postings( path ):
+	""" Read the hashtag and user posting lists for a file, or None if they were not built. """
+	if not os.path.exists( postings_path(path) ):
+		return None
+	with gzip.open( postings_path(path), "rb" ) as fin:
+		return pickle.load( fin )
@@ -0,0 +1,196 @@
+"""
+Runtime instrumentation shared by all of the tools. A Metrics object counts the lines and bytes
+read, accumulates the time spent in each stage of processing (read, decode, apply, output),
+counts parse failures by exception type, and periodically logs the current rate and an estimate
+of the time remaining for the current file. A JSON summary can be written at the end of a run,
+and the whole run can optionally be profiled with cProfile and tracemalloc.
+"""
+import os, sys, time, json
+from collections import Counter
+from contextlib import contextmanager
+import logging as log
+from jsonltools.compression import detect_compression
+
+STAGES = [ "read", "decode", "apply", "output" ]
+
+# --------------------------------------------------------------
+
+def format_duration( seconds ):
+	seconds = int( seconds )
+	return "%d:%02d:%02d" % ( seconds // 3600, ( seconds // 60 ) % 60, seconds % 60 )
+
+def peak_rss_mb():
+	""" Peak resident memory of this process and any finished child processes, or None if unknown. """
+	try:
+		import resource
+	except ImportError:
+		return None
+	usage = max( resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss, resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss )
+	# ru_maxrss is in KB on Linux, and bytes on macOS
+	return usage / ( 1024.0 * 1024 if sys.platform == "darwin" else 1024.0 )
+
+class Profiler:
+	""" Profiles CPU time with cProfile and memory allocations with tracemalloc. """
+	def __init__( self, path ):
+		self.path = path
+
+	def start( self ):
+		import cProfile, tracemalloc
+		tracemalloc.start()
+		self.profile = cProfile.Profile()
+		self.profile.enable()
+
+	def stop( self ):
+		""" Write the raw cProfile statistics to the profile path, and a readable summary of the
+		slowest functions and largest allocations to the same path with a .txt suffix. """
+		import pstats, tracemalloc
+		self.profile.disable()
+		snapshot = tracemalloc.take_snapshot()
+		tracemalloc.stop()
+		self.profile.dump_stats( self.path )
+		with open( self.path + ".txt", "w" ) as fout:
+			fout.write("Functions by cumulative time:\n")
+			pstats.Stats( self.profile, stream=fout ).sort_stats("cumulative").print_stats(30)
+			fout.write("Largest memory allocations still held at the end of the run:\n")
+			for stat in snapshot.statistics("lineno")[:20]:
+				fout.write("%s\n" % stat)
+		log.info("Wrote profile to %s and %s.txt" % ( self.path, self.path ) )
+
+# --------------------------------------------------------------
+
+class Metrics:
+	""" Counters and stage timers for a run of one of the tools. """
+	def __init__( self, interval = None, out_path = None, profile_path = None ):
+		# seconds between progress messages, or None to disable them
+		self.interval = interval
+		self.out_path = out_path
+		self.profiler = None if profile_path is None else Profiler( profile_path )
+		self.start_time = time.perf_counter()
+		self.last_progress = self.start_time
+		self.num_lines, self.num_bytes = 0, 0
+		self.stages = { stage : 0.0 for stage in STAGES }
+		self.failures = Counter()
+		# tweets skipped because their ids had already been seen
+		self.num_duplicates = 0
+		self.files = []
+		self.path, self.size, self.file_start = None, None, None
+		self.file_lines, self.file_bytes = 0, 0
+
+	def start( self ):
+		if not self.profiler is None:
+			self.profiler.start()
+
+	def start_file( self, path, selection = None, sized = True ):
+		""" Begin counting progress through a file. Its size is only used to estimate the time
+		remaining when every line will be read, so not for stdin, compressed files, selections
+		or files which are still growing. """
+		self.end_file()
+		self.path, self.size = path, None
+		if sized and path != "-" and selection is None and detect_compression( path ) is None:
+			self.size = os.path.getsize( path )
+		self.file_start = time.perf_counter()
+		self.file_lines, self.file_bytes = 0, 0
+
+	def end_file( self ):
+		if self.path is None:
+			return
+		self.files.append( { "path" : self.path, "lines" : self.file_lines, "bytes" : self.file_bytes,
+			"seconds" : time.perf_counter() - self.file_start } )
+		self.path = None
+
+	def timed_lines( self, lines ):
+		""" Yield each of the lines, adding the time taken to produce them to the read stage. """
+		clock = time.perf_counter
+		it = iter( lines )
+		while True:
+			start = clock()
+			try:
+				l = next( it )
+			except StopIteration:
+				break
+			finally:
+				self.stages["read"] += clock() - start
+			self.num_lines += 1
+			self.num_bytes += len(l)
+			self.file_lines += 1
+			self.file_bytes += len(l)
+			yield l
+
+	@contextmanager
+	def stage( self, name ):
+		""" Add the time spent in a block of code to a stage. """
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.stages[name] = self.stages.get( name, 0.0 ) + time.perf_counter() - start
+
+	def failure( self, e ):
+		self.failures[type(e).__name__] += 1
+
+	def merge( self, other ):
+		""" Add the counts and stage times from a worker process. """
+		self.num_lines += other.num_lines
+		self.num_bytes += other.num_bytes
+		self.file_lines += other.num_lines
+		self.file_bytes += other.num_bytes
+		for name, seconds in other.stages.items():
+			self.stages[name] = self.stages.get( name, 0.0 ) + seconds
+		self.failures.update( other.failures )
+		self.num_duplicates += other.num_duplicates
+
+	def progress( self, force = False ):
+		""" Log the rate of processing and an estimate of the time remaining, at most once per interval. """
+		if self.interval is None:
+			return
+		now = time.perf_counter()
+		if not force and now - self.last_progress < self.interval:
+			return
+		self.last_progress = now
+		elapsed = max( now - self.file_start, 1e-9 )
+		msg = "Processed %d lines (%.0f lines/sec, %.1f MB/sec)" % ( self.file_lines, self.file_lines / elapsed, self.file_bytes / elapsed / 1e6 )
+		if not self.size is None and self.size > 0 and self.file_bytes > 0:
+			remaining = elapsed * ( self.size - self.file_bytes ) / self.file_bytes
+			msg += ", %.1f%% of file, ETA %s" % ( 100.0 * self.file_bytes / self.size, format_duration( max( remaining, 0 ) ) )
+		log.info(msg)
+
+	def summary( self ):
+		elapsed = time.perf_counter() - self.start_time
+		stages = dict( self.stages )
+		# with multiple workers the stage times are summed across processes, so can exceed the elapsed time
+		stages["other"] = max( elapsed - sum( stages.values() ), 0.0 )
+		return { "elapsed_sec" : elapsed, "lines" : self.num_lines, "bytes" : self.num_bytes,
+			"lines_per_sec" : self.num_lines / elapsed if elapsed > 0 else 0.0,
+			"mb_per_sec" : self.num_bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+			"stages_sec" : stages, "failures" : dict( self.failures ), "num_failed" : sum( self.failures.values() ),
+			"num_duplicates" : self.num_duplicates, "files" : self.files, "peak_rss_mb" : peak_rss_mb() }
+
+	def finish( self ):
+		""" Stop profiling, log a summary of the run and write the JSON summary if requested. """
+		self.end_file()
+		if not self.profiler is None:
+			self.profiler.stop()
+		summary = self.summary()
+		if summary["lines"] > 0:
+			log.info("Processed %d lines (%.1f MB) in %.2f sec, %.0f lines/sec" % ( summary["lines"], summary["bytes"] / 1e6,
+				summary["elapsed_sec"], summary["lines_per_sec"] ) )
+			log.info("Time by stage: %s" % ", ".join( "%s %.2f sec" % ( name, seconds ) for name, seconds in summary["stages_sec"].items() ) )
+		if len(self.failures) > 0:
+			log.info("Parse failures: %s" % ", ".join( "%s (%d)" % ( name, count ) for name, count in self.failures.most_common() ) )
+		if not self.out_path is None:
+			with open( self.out_path, "w" ) as fout:
+				json.dump( summary, fout, indent=2 )
+		return summary
+
+# --------------------------------------------------------------
+
+def add_metrics_options( parser ):
+	parser.add_option("--progress", action="store", type="float", dest="progress", help="seconds between progress messages (default is 10)", default=10.0)
+	parser.add_option("--metrics", action="store", type="string", dest="metrics_path", help="write a JSON summary of throughput, stage timings and parse failures to this path", default=None)
+	parser.add_option("--profile", action="store", type="string", dest="profile_path", help="profile the main process with cProfile and tracemalloc, writing statistics to this path and a summary to the path with a .txt suffix (slows processing)", default=None)
+
+def metrics_from_options( options ):
+	""" Create and start a Metrics object from the parsed command line options. """
+	metrics = Metrics( options.progress if options.progress > 0 else None, options.metrics_path, options.profile_path )
+	metrics.start()
+	return metrics
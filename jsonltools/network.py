@@ -0,0 +1,200 @@
+"""
+Extraction of directed user networks from tweets. Three types of weighted edge are counted:
+
+	mention: from the author of a tweet to each user mentioned in it
+	retweet: from the author of a retweet to the author of the original tweet
+	reply: from the author of a reply to the user being replied to
+
+Users are interned to consecutive integer node ids, and each edge is packed into a single
+64-bit key and counted in a PairCounter, so that counts beyond a memory budget are spilled to
+disk as sorted runs and combined with an external merge. The network can be written as a
+tab-separated edge list or as GraphML, which only need the standard library, or as one sparse
+matrix per edge type in the binary formats of jsonltools.graph, which require NumPy.
+"""
+import os
+from array import array
+from xml.sax.saxutils import escape
+import logging as log
+from jsonltools.engine import Aggregator
+from jsonltools.aggregators import top_items
+from jsonltools.csvwriter import CsvWriter
+from jsonltools.pairs import PairCounter, pack_pair, unpack_pair
+
+EDGE_TYPES = ["mention", "retweet", "reply"]
+NETWORK_FORMATS = ["csv", "graphml", "npz", "edges"]
+
+# --------------------------------------------------------------
+
+def network_format_for_path( path ):
+	""" Guess the network output format from the extension of a path, defaulting to CSV. """
+	ext = os.path.splitext(path)[1].lower().lstrip(".")
+	if ext in ("graphml", "npz", "edges"):
+		return ext
+	return "csv"
+
+def parse_edge_types( s ):
+	""" Parse a comma-separated list of edge types. """
+	edge_types = [ x.strip() for x in s.split(",") if len(x.strip()) > 0 ]
+	for edge_type in edge_types:
+		if not edge_type in EDGE_TYPES:
+			raise ValueError("Unknown edge type '%s', expected one of %s" % ( edge_type, ", ".join(EDGE_TYPES) ) )
+	return edge_types
+
+def typed_path( path, edge_type ):
+	""" Insert an edge type into a path, eg. network.npz -> network-mention.npz """
+	base, ext = os.path.splitext( path )
+	return "%s-%s%s" % ( base, edge_type, ext )
+
+# --------------------------------------------------------------
+
+class NetworkCounter(Aggregator):
+	""" Counts directed edges of the selected types between users. The number of tweets written
+	by each user is also counted. The mentions in a retweet are those of the original tweet, so
+	only the retweet edge is counted for a retweet. """
+	# edges accumulate across all input files
+	per_file = False
+	fields = ( "user.id", "user.screen_name", "retweeted_status.user.id", "retweeted_status.user.screen_name",
+		"in_reply_to_user_id", "in_reply_to_screen_name", "entities.user_mentions" )
+
+	def __init__( self, edge_types = None, max_pairs = None, spill_dir = None ):
+		super().__init__()
+		self.edge_types = list(EDGE_TYPES) if edge_types is None else list(edge_types)
+		self.max_pairs, self.spill_dir = max_pairs, spill_dir
+		self.nodes = {}
+		self.ids = array("q")
+		self.names = []
+		self.tweet_counts = array("Q")
+		# the memory budget is shared between the edge types
+		max_type_pairs = None if max_pairs is None else max( 1, max_pairs // len(self.edge_types) )
+		self.edges = { edge_type : PairCounter( max_type_pairs, spill_dir ) for edge_type in self.edge_types }
+
+	def spawn( self ):
+		return NetworkCounter( self.edge_types, self.max_pairs, self.spill_dir )
+
+	def intern( self, user_id, screen_name ):
+		node = self.nodes.get( user_id )
+		if node is None:
+			node = self.nodes[user_id] = len(self.names)
+			self.ids.append( user_id )
+			self.names.append( screen_name or "" )
+			self.tweet_counts.append( 0 )
+		elif screen_name and len(self.names[node]) == 0:
+			self.names[node] = screen_name
+		return node
+
+	def apply( self, tweet ):
+		if not "user" in tweet:
+			return
+		user = tweet["user"]
+		source = self.intern( user["id"], user.get("screen_name") )
+		self.tweet_counts[source] += 1
+		edges = self.edges
+		retweeted = tweet.get("retweeted_status")
+		if not retweeted is None:
+			if "retweet" in edges and "user" in retweeted:
+				original = retweeted["user"]
+				edges["retweet"].add( pack_pair( source, self.intern( original["id"], original.get("screen_name") ) ) )
+			return
+		if "reply" in edges and not tweet.get("in_reply_to_user_id") is None:
+			target = self.intern( tweet["in_reply_to_user_id"], tweet.get("in_reply_to_screen_name") )
+			edges["reply"].add( pack_pair( source, target ) )
+		if "mention" in edges and "entities" in tweet:
+			add = edges["mention"].add
+			for mention in tweet["entities"].get("user_mentions", []):
+				add( pack_pair( source, self.intern( mention["id"], mention.get("screen_name") ) ) )
+
+	def merge( self, other ):
+		if other.edge_types != self.edge_types:
+			raise ValueError("Cannot merge networks with different edge types")
+		super().merge( other )
+		# map the other counter's node ids onto our own
+		mapping = [ self.intern( user_id, name ) for user_id, name in zip( other.ids, other.names ) ]
+		for node, count in zip( mapping, other.tweet_counts ):
+			self.tweet_counts[node] += count
+		for edge_type in self.edge_types:
+			add = self.edges[edge_type].add
+			for key, count in other.edges[edge_type].items():
+				a, b = unpack_pair( key )
+				add( pack_pair( mapping[a], mapping[b] ), count )
+
+	def num_users( self ):
+		return len(self.names)
+
+	def num_edges( self, edge_type ):
+		return len(self.edges[edge_type])
+
+	def graph( self, edge_type ):
+		""" Return the edges of one type as a directed SparseGraph over the node ids. Requires NumPy. """
+		from jsonltools.graph import SparseGraph, packed_edges
+		sources, targets, weights = packed_edges( self.edges[edge_type].items() )
+		return SparseGraph.from_edges( sources, targets, weights, self.names, self.tweet_counts, self.num_tweets, ids = self.ids )
+
+	# --------------------------------------------------------------
+
+	def write( self, out_path, fmt = None ):
+		""" Write the network in the specified format. For the binary formats, each edge type is
+		written as a separate sparse matrix, and a dictionary of the graphs by edge type is returned. """
+		if fmt is None:
+			fmt = network_format_for_path( out_path )
+		if fmt == "csv":
+			self.write_edge_list( out_path )
+		elif fmt == "graphml":
+			self.write_graphml( out_path )
+		else:
+			graphs = {}
+			for edge_type in self.edge_types:
+				path = out_path if len(self.edge_types) == 1 else typed_path( out_path, edge_type )
+				log.info("Writing %s edges to %s ..." % ( edge_type, path ) )
+				graphs[edge_type] = self.graph( edge_type )
+				graphs[edge_type].save( path, fmt )
+			return graphs
+		return None
+
+	def write_edge_list( self, out_path ):
+		log.info("Writing edges to %s ..." % out_path )
+		ids, names = self.ids, self.names
+		writer = CsvWriter( out_path, "\t" )
+		writer.write( ["Source_ID", "Source", "Target_ID", "Target", "Type", "Count"] )
+		for edge_type in self.edge_types:
+			for key, count in self.edges[edge_type].items():
+				a, b = unpack_pair( key )
+				writer.write( ( str(ids[a]), names[a], str(ids[b]), names[b], edge_type, str(count) ) )
+		writer.close()
+
+	def write_graphml( self, out_path ):
+		log.info("Writing GraphML to %s ..." % out_path )
+		ids = self.ids
+		with open( out_path, "w", encoding="utf-8", errors="ignore", buffering=1 << 20 ) as fout:
+			fout.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+			fout.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+			fout.write('<key id="screen_name" for="node" attr.name="screen_name" attr.type="string"/>\n')
+			fout.write('<key id="tweets" for="node" attr.name="tweets" attr.type="long"/>\n')
+			fout.write('<key id="type" for="edge" attr.name="type" attr.type="string"/>\n')
+			fout.write('<key id="weight" for="edge" attr.name="weight" attr.type="long"/>\n')
+			fout.write('<graph id="users" edgedefault="directed">\n')
+			for user_id, name, count in zip( ids, self.names, self.tweet_counts ):
+				fout.write('<node id="%d"><data key="screen_name">%s</data><data key="tweets">%d</data></node>\n' % ( user_id, escape( name ), count ) )
+			for edge_type in self.edge_types:
+				edge_type_attr = escape( edge_type )
+				for key, count in self.edges[edge_type].items():
+					a, b = unpack_pair( key )
+					fout.write('<edge source="%d" target="%d"><data key="type">%s</data><data key="weight">%d</data></edge>\n' % ( ids[a], ids[b], edge_type_attr, count ) )
+			fout.write('</graph>\n</graphml>\n')
+
+	def report( self, top = 10, graphs = None ):
+		""" Display the edges with the highest counts of each type, which are selected from the graphs if they have been built. """
+		from prettytable import PrettyTable
+		log.info("Found %d tweets involving %d distinct users" % ( self.num_tweets, self.num_users() ) )
+		for edge_type in self.edge_types:
+			if graphs is None:
+				sx = [ unpack_pair( key ) + ( count, ) for key, count in top_items( self.edges[edge_type], top ) ]
+			else:
+				sx = graphs[edge_type].top_edges( top )
+			log.info("Top %d %s edges of %d distinct edges:" % ( len(sx), edge_type, self.num_edges( edge_type ) ) )
+			tab = PrettyTable( ["Source", "Target", "Count"] )
+			tab.align["Source"] = "l"
+			tab.align["Target"] = "l"
+			tab.align["Count"] = "r"
+			for a, b, count in sx:
+				tab.add_row( [ self.names[a] or str(self.ids[a]), self.names[b] or str(self.ids[b]), count ] )
+			log.info(tab)
@@ -0,0 +1,70 @@
+"""
+Normalisation of hashtags, screen names and free text, shared by all of the tools, so that the
+same hashtag is always counted under the same key. Hashtags and screen names are compared using
+Unicode NFKC normalisation and case folding, so that variants such as #Brexit, #BREXIT and the
+full-width #Ｂｒｅｘｉｔ are counted together.
+
+Normalising a string is much slower than looking it up, and the same few hashtags make up most
+occurrences, so each Normaliser keeps a bounded table of the raw strings it has seen. Repeated
+strings cost a single dictionary lookup, and every raw variant of a hashtag maps to the same
+canonical string object, so that the keys of the counters share their strings rather than each
+holding its own copy. Once the table is full, the least recently added half of it is dropped.
+"""
+import re, unicodedata
+from itertools import islice
+
+# default number of raw strings kept by each Normaliser
+DEFAULT_MAX_SIZE = 1 << 17
+WHITESPACE = re.compile( r"\s+" )
+NON_ASCII = re.compile( r"[^\x00-\x7f]" )
+
+# --------------------------------------------------------------
+
+def fold( s ):
+	""" Return the NFKC case folded form of a string, without surrounding whitespace. """
+	# ASCII is unchanged by NFKC, and its case folding is the same as lower()
+	if NON_ASCII.search( s ) is None:
+		return s.lower().strip()
+	return unicodedata.normalize( "NFKC", unicodedata.normalize( "NFKC", s ).casefold() ).strip()
+
+def fold_hashtag( s ):
+	""" Return the canonical form of a hashtag, with a single leading #, whether or not it had one. """
+	return "#" + fold( s ).lstrip("#")
+
+def clean_field( s, sep ):
+	""" Replace the separator and any runs of whitespace in a field with single spaces. """
+	s = s.replace( sep, " " )
+	# every whitespace character apart from the space is unprintable
+	if s.isprintable() and not "  " in s:
+		return s
+	return WHITESPACE.sub( " ", s )
+
+# --------------------------------------------------------------
+
+class Normaliser(dict):
+	""" Maps raw strings to their canonical forms using a normalisation function, as a dictionary
+	which normalises any string that it is missing, so that normaliser[s] is a single lookup for a
+	string seen before. Up to max_size raw strings are kept, and a single string object is shared
+	by each canonical form. """
+	def __init__( self, normalise = fold, max_size = DEFAULT_MAX_SIZE ):
+		super().__init__()
+		self.normalise, self.max_size = normalise, max_size
+		# canonical string -> itself, so that equal canonical strings are the same object
+		self.canonical = {}
+
+	def __missing__( self, s ):
+		if len(self) >= self.max_size:
+			self.evict()
+		value = self.normalise( s )
+		value = self[s] = self.canonical.setdefault( value, value )
+		return value
+
+	def evict( self ):
+		""" Drop the least recently added half of the raw strings, and any canonical strings which are no longer used. """
+		for s in list( islice( self, len(self) // 2 + 1 ) ):
+			del self[s]
+		self.canonical = { value : value for value in self.values() }
+
+# shared normalisers for the text of hashtag entities, and for screen names
+hashtag = Normaliser( fold_hashtag )
+screen_name = Normaliser( fold )
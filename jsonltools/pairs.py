@@ -0,0 +1,256 @@
+"""
+Compact counting of pairs of integer ids. Each pair is packed into a single 64-bit integer key.
+New keys are appended to a small unsorted buffer, which is sorted and reduced into a run of
+distinct (key,count) entries held in memory as a flat array of 16 bytes per pair, rather than
+a Python dict at about 100 bytes per pair. When the number of distinct keys held in memory
+exceeds a budget, the run is written to disk. The runs are combined with an external k-way
+merge when the counts are read back. NumPy is used to sort and reduce the buffer when it is
+installed.
+"""
+import os, heapq, tempfile, shutil
+from array import array
+from collections import defaultdict
+import logging as log
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# memory used by each distinct pair held in memory: 16 bytes for the key and count, which is
+# doubled while the buffer is merged into the run
+BYTES_PER_PAIR = 32
+# minimum number of keys appended to the buffer before it is reduced into the run held in memory;
+# the buffer also grows to a quarter of the number of pairs in the run, so that the cost of
+# merging them is spread over the keys added
+PENDING_SIZE = 1 << 16
+# number of (key,count) entries read from a run at a time
+RUN_BLOCK_SIZE = 1 << 16
+
+# --------------------------------------------------------------
+
+def pack_pair( a, b ):
+	return (a << 32) | b
+
+def unpack_pair( key ):
+	return key >> 32, key & 0xFFFFFFFF
+
+def memory_to_pairs( megabytes ):
+	""" Convert a memory budget in megabytes to a maximum number of pairs held in memory. """
+	return max( 1, int( megabytes * (1 << 20) / BYTES_PER_PAIR ) )
+
+def link_or_copy( source, target ):
+	""" Hard link a file to a new path, or copy it where it cannot be linked, such as across file systems. """
+	try:
+		os.link( source, target )
+	except OSError:
+		shutil.copyfile( source, target )
+
+def iter_run( run ):
+	""" Yield the sorted (key,count) entries of a run, which is either the path of a spill file
+	or an in-memory array of interleaved keys and counts. """
+	if isinstance(run, array):
+		for i in range(0, len(run), 2):
+			yield run[i], run[i+1]
+		return
+	with open(run, "rb") as fin:
+		while True:
+			block = array("Q")
+			try:
+				block.fromfile( fin, 2 * RUN_BLOCK_SIZE )
+			except EOFError:
+				pass
+			if len(block) == 0:
+				break
+			for i in range(0, len(block), 2):
+				yield block[i], block[i+1]
+
+def reduce_run( run, keys, counts ):
+	""" Merge unsorted keys and their counts into a sorted run of interleaved keys and counts,
+	summing the counts of equal keys. Returns the new run. """
+	if not np is None:
+		if len(run) > 0:
+			entries = np.frombuffer( run, dtype=np.uint64 ).reshape( -1, 2 )
+			keys = np.concatenate( ( entries[:,0], np.frombuffer( keys, dtype=np.uint64 ) ) )
+			counts = np.concatenate( ( entries[:,1], np.frombuffer( counts, dtype=np.uint64 ) ) )
+		else:
+			keys, counts = np.frombuffer( keys, dtype=np.uint64 ), np.frombuffer( counts, dtype=np.uint64 )
+		order = np.argsort( keys, kind="stable" )
+		keys, counts = keys[order], counts[order]
+		starts = np.flatnonzero( np.concatenate( ( [True], keys[1:] != keys[:-1] ) ) )
+		merged = np.empty( ( len(starts), 2 ), dtype=np.uint64 )
+		merged[:,0] = keys[starts]
+		merged[:,1] = np.add.reduceat( counts, starts )
+		return array( "Q", merged.tobytes() )
+	totals = defaultdict(int)
+	for key, count in iter_run( run ):
+		totals[key] += count
+	for key, count in zip( keys, counts ):
+		totals[key] += count
+	merged = array("Q")
+	for key in sorted(totals):
+		merged.append( key )
+		merged.append( totals[key] )
+	return merged
+
+# --------------------------------------------------------------
+
+class PairCounter:
+	def __init__( self, max_pairs = None, spill_dir = None ):
+		self.max_pairs = max_pairs
+		self.spill_dir = spill_dir
+		# keys and counts added since the buffer was last reduced
+		self.keys, self.counts = array("Q"), array("Q")
+		# sorted run of distinct pairs held in memory, as interleaved keys and counts
+		self.memory = array("Q")
+		# a small budget is checked more often, so that it is not exceeded by a full buffer
+		self.pending_size = PENDING_SIZE if max_pairs is None else max( 1, min( PENDING_SIZE, max_pairs ) )
+		# sorted runs which have been spilled to disk, or restored from a pickle
+		self.runs = []
+		self.num_distinct = None
+		# spill file -> hard link to it in a checkpoint directory
+		self.links = {}
+
+	def add( self, key, count = 1 ):
+		self.keys.append( key )
+		self.counts.append( count )
+		if len(self.keys) >= self.pending_size and 8 * len(self.keys) >= len(self.memory):
+			self.reduce()
+			if not self.max_pairs is None and len(self.memory) > 2 * self.max_pairs:
+				self.spill()
+
+	def reduce( self ):
+		""" Sort the buffer of new keys into the run of distinct pairs held in memory. """
+		if len(self.keys) == 0:
+			return
+		self.memory = reduce_run( self.memory, self.keys, self.counts )
+		self.keys, self.counts = array("Q"), array("Q")
+
+	def spill( self ):
+		""" Write the pairs currently held in memory to disk as a new sorted run. """
+		self.reduce()
+		if len(self.memory) == 0:
+			return
+		path = self.write_run( self.memory )
+		log.debug("Spilled %d pairs to %s" % ( len(self.memory) // 2, path ) )
+		self.runs.append( path )
+		self.memory = array("Q")
+		self.num_distinct = None
+
+	def write_run( self, run ):
+		""" Write an in-memory run to a spill file, returning its path. """
+		fd, path = tempfile.mkstemp( prefix="pairs-", suffix=".run", dir=self.spill_dir )
+		with os.fdopen( fd, "wb" ) as fout:
+			run.tofile( fout )
+		return path
+
+	def checkpoint( self, directory ):
+		""" Spill the pairs held in memory, and give each run a hard link in a checkpoint directory,
+		which outlives the spill file. Only runs created since the last checkpoint are linked, so the
+		cost is in proportion to the new pairs. Returns the paths of the links, which hold every count. """
+		self.spill()
+		self.runs = [ self.write_run( run ) if isinstance(run, array) else run for run in self.runs ]
+		links = {}
+		for run in self.runs:
+			link = self.links.get( run )
+			if link is None:
+				link = os.path.join( directory, os.path.basename( run ) )
+				link_or_copy( run, link )
+			links[run] = link
+		self.links = links
+		return list( links.values() )
+
+	@classmethod
+	def from_checkpoint( cls, links, max_pairs = None, spill_dir = None ):
+		""" Restore a counter from the runs linked into a checkpoint directory by checkpoint(). Each
+		run is linked to a new spill file, so that the checkpoint is left intact. """
+		counter = cls( max_pairs, spill_dir )
+		for link in links:
+			fd, path = tempfile.mkstemp( prefix="pairs-", suffix=".run", dir=spill_dir )
+			os.close( fd )
+			os.remove( path )
+			link_or_copy( link, path )
+			counter.runs.append( path )
+			counter.links[path] = link
+		return counter
+
+	def items( self ):
+		""" Yield every (key,count) pair, in sorted order of keys. """
+		self.reduce()
+		if len(self.runs) == 0:
+			for item in iter_run( self.memory ):
+				yield item
+			return
+		sources = [ iter_run(run) for run in self.runs ]
+		if len(self.memory) > 0:
+			sources.append( iter_run( self.memory ) )
+		current_key, current_count = None, 0
+		for key, count in heapq.merge( *sources ):
+			if key == current_key:
+				current_count += count
+			else:
+				if not current_key is None:
+					yield current_key, current_count
+				current_key, current_count = key, count
+		if not current_key is None:
+			yield current_key, current_count
+
+	def compact( self ):
+		""" Merge all runs and in-memory pairs into a single run on disk. """
+		self.reduce()
+		if len(self.runs) == 0 or ( len(self.runs) == 1 and len(self.memory) == 0 ):
+			return
+		fd, path = tempfile.mkstemp( prefix="pairs-", suffix=".run", dir=self.spill_dir )
+		num_distinct = 0
+		with os.fdopen( fd, "wb" ) as fout:
+			block = array("Q")
+			for key, count in self.items():
+				block.append( key )
+				block.append( count )
+				num_distinct += 1
+				if len(block) >= 2 * RUN_BLOCK_SIZE:
+					block.tofile( fout )
+					block = array("Q")
+			block.tofile( fout )
+		self.close()
+		self.runs = [ path ]
+		self.num_distinct = num_distinct
+
+	def __len__( self ):
+		if len(self.runs) == 0:
+			self.reduce()
+			return len(self.memory) // 2
+		self.compact()
+		return self.num_distinct
+
+	def close( self ):
+		""" Remove any spill files, and discard all counts. """
+		for run in self.runs:
+			if not isinstance(run, array) and os.path.exists(run):
+				os.remove( run )
+		self.runs = []
+		self.keys, self.counts = array("Q"), array("Q")
+		self.memory = array("Q")
+
+	def __del__( self ):
+		try:
+			self.close()
+		except Exception:
+			pass
+
+	def __getstate__( self ):
+		# spill files are local to this process, so pickle all counts as a single sorted array
+		merged = array("Q")
+		for key, count in self.items():
+			merged.append( key )
+			merged.append( count )
+		return { "max_pairs" : self.max_pairs, "spill_dir" : self.spill_dir, "merged" : merged }
+
+	def __setstate__( self, state ):
+		self.max_pairs = state["max_pairs"]
+		self.spill_dir = state["spill_dir"]
+		self.pending_size = PENDING_SIZE if self.max_pairs is None else max( 1, min( PENDING_SIZE, self.max_pairs ) )
+		self.keys, self.counts = array("Q"), array("Q")
+		self.memory = array("Q")
+		self.runs = [ state["merged"] ] if len(state["merged"]) > 0 else []
+		self.num_distinct = len(state["merged"]) // 2
+		self.links = {}
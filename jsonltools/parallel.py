@@ -0,0 +1,100 @@
+"""
+Multi-core processing of a single JSONL file. The file is split into newline-aligned byte
+ranges, each range is decoded and aggregated by a separate worker process, and the partial
+aggregates are then merged back together.
+"""
+import os
+import logging as log
+from multiprocessing import Pool
+from jsonltools.engine import process_lines
+from jsonltools.decoding import Decoder
+from jsonltools.metrics import Metrics
+
+# --------------------------------------------------------------
+
+def find_shards( path, num_shards ):
+	""" Split a file into at most num_shards (start,end) byte ranges, each starting at the beginning of a line. """
+	size = os.path.getsize(path)
+	if size == 0:
+		return []
+	bounds = [0]
+	with open(path, "rb") as fin:
+		for i in range(1, num_shards):
+			fin.seek( max( bounds[-1], (i * size) // num_shards ) )
+			# move to the start of the next line
+			fin.readline()
+			pos = fin.tell()
+			if pos >= size:
+				break
+			if pos > bounds[-1]:
+				bounds.append( pos )
+	bounds.append( size )
+	return [ (bounds[i], bounds[i+1]) for i in range(len(bounds)-1) ]
+
+def iter_range( path, start, end ):
+	""" Yield the lines which begin within the specified byte range of a file. """
+	with open(path, "rb") as fin:
+		fin.seek( start )
+		pos = start
+		for l in fin:
+			if pos >= end:
+				break
+			pos += len(l)
+			yield l
+
+def _shard_ids( job ):
+	""" Return the sorted distinct tweet ids in a byte range of a file. """
+	from jsonltools.dedupe import IdSet
+	path, start, end = job
+	decode = Decoder( [], fields = ( "id", ) )
+	ids = IdSet()
+	for l in iter_range( path, start, end ):
+		l = l.strip()
+		if len(l) == 0:
+			continue
+		try:
+			tweet = decode(l)
+			# lines which are not objects, such as a bare number, have no id, and other ids are
+			# reported as failures when the range is processed
+			if isinstance(tweet, dict) and isinstance(tweet.get("id"), int):
+				ids.add( tweet["id"] )
+		except Exception:
+			# parse failures are reported when the range is processed
+			continue
+	return ids.sorted()
+
+def _process_shard( job ):
+	path, start, end, aggregators, skip = job
+	# workers do not log progress, which is reported as each range is merged instead
+	metrics = Metrics()
+	dedupe = None
+	if not skip is None:
+		from jsonltools.dedupe import ShardFilter
+		dedupe = ShardFilter( skip )
+	num_lines = process_lines( iter_range( path, start, end ), aggregators, metrics = metrics, dedupe = dedupe )
+	return num_lines, aggregators, metrics
+
+# --------------------------------------------------------------
+
+def process_file_parallel( path, aggregators, workers, metrics = None, dedupe = None ):
+	""" Process one file using a pool of worker processes, and merge the partial results into the aggregators.
+	To skip duplicate tweets, the workers first collect the ids in each range, which are added to the dedupe
+	set in file order, so that each worker is given the ids in its range that were seen earlier. """
+	shards = find_shards( path, workers )
+	log.info("Processing %d byte ranges with %d worker processes" % ( len(shards), workers ) )
+	num_lines = 0
+	with Pool( min( workers, max( len(shards), 1 ) ) ) as pool:
+		skips = [ None ] * len(shards)
+		if not dedupe is None:
+			for i, ids in enumerate( pool.imap( _shard_ids, [ ( path, start, end ) for start, end in shards ] ) ):
+				skips[i] = dedupe.add_sorted( ids )
+		# each worker starts from empty copies of the aggregators
+		jobs = [ ( path, start, end, [ agg.spawn() for agg in aggregators ], skip ) for ( start, end ), skip in zip( shards, skips ) ]
+		for shard_lines, partials, shard_metrics in pool.imap( _process_shard, jobs ):
+			num_lines += shard_lines
+			for agg, partial in zip( aggregators, partials ):
+				agg.merge( partial )
+			if not metrics is None:
+				metrics.merge( shard_metrics )
+				metrics.progress( force = True )
+	return num_lines
@@ -0,0 +1,292 @@
+"""
+Store of user profile snapshots, keyed by user id. Only the latest snapshot of each profile is
+kept, together with the times when the user was first and last seen, the number of snapshots
+and the follower count in the earliest snapshot, so that changes in followers can be tracked.
+A snapshot is later than another if it was seen at a later time, or, where times are not known,
+if it was added later.
+
+The store is a single file, which is read through mmap:
+
+	header: magic, number of records, number of hash table slots, offset of the hash table
+	records: (int64 user id, uint32 length, JSON profile) for each user
+	hash table: open addressing table of (int64 user id, uint64 record offset) slots
+
+so that a profile can be looked up without loading the whole store. Records are kept in order of
+user id. New snapshots are collected in memory by a ProfileWriter, which writes each full batch to
+a temporary run sorted by user id. When the writer is closed, the runs are merged with the store in
+a single pass which rewrites it, so the cost of adding snapshots is one rewrite of the store per
+run of a tool, rather than one per batch. The store is also compacted, since each user only ever
+has one record, and records for users without a new snapshot are copied without being decoded.
+"""
+import os, mmap, struct, heapq, tempfile, operator
+from itertools import groupby
+from array import array
+import json
+import logging as log
+from jsonltools.decoding import full_loads
+from jsonltools.sketches import hash64
+
+MAGIC = b"JLUSR001"
+HEADER = struct.Struct("<8sQQQ")
+RECORD = struct.Struct("<qI")
+# fields of the Twitter user object kept in each snapshot
+PROFILE_FIELDS = ( "id", "screen_name", "name", "followers_count", "friends_count", "statuses_count",
+	"created_at", "lang", "location", "description" )
+# number of users with new snapshots held in memory before they are merged into the store
+DEFAULT_BATCH_SIZE = 1 << 18
+
+# --------------------------------------------------------------
+
+def snapshot( user, seen = None ):
+	""" Create a store record from a Twitter user object, seen at a time in seconds since the epoch, if known. """
+	record = { field : user.get( field ) for field in PROFILE_FIELDS }
+	record["first_seen"] = record["last_seen"] = seen
+	record["snapshots"] = 1
+	record["first_followers_count"] = record["followers_count"]
+	return record
+
+def merge_records( old, new ):
+	""" Combine two records for the same user, where new was added after old. """
+	if old["last_seen"] is None or new["last_seen"] is None or new["last_seen"] >= old["last_seen"]:
+		later = new
+	else:
+		later = old
+	# the earliest snapshot is the one which was first seen, which may not be the one last seen first
+	if old["first_seen"] is None or new["first_seen"] is None or old["first_seen"] <= new["first_seen"]:
+		earlier = old
+	else:
+		earlier = new
+	merged = dict( later )
+	times = [ t for t in ( old["first_seen"], new["first_seen"] ) if not t is None ]
+	merged["first_seen"] = min( times ) if len(times) > 0 else None
+	times = [ t for t in ( old["last_seen"], new["last_seen"] ) if not t is None ]
+	merged["last_seen"] = max( times ) if len(times) > 0 else None
+	merged["snapshots"] = old["snapshots"] + new["snapshots"]
+	merged["first_followers_count"] = earlier["first_followers_count"]
+	return merged
+
+def encode_record( record ):
+	return json.dumps( record ).encode("utf-8")
+
+# --------------------------------------------------------------
+
+class ProfileStore:
+	""" Read-only view of a profile store file. """
+	def __init__( self, path ):
+		self.path, self.table = path, None
+		self.loads = full_loads()
+		self.fin = open( path, "rb" )
+		self.mm = mmap.mmap( self.fin.fileno(), 0, access=mmap.ACCESS_READ )
+		magic, self.num_records, self.table_size, self.table_offset = HEADER.unpack_from( self.mm, 0 )
+		if magic != MAGIC:
+			self.close()
+			raise ValueError("%s is not a supported profile store" % path)
+		self.table = memoryview( self.mm )[self.table_offset:self.table_offset + 16 * self.table_size].cast("q")
+
+	def __len__( self ):
+		return self.num_records
+
+	def find( self, user_id ):
+		""" Return the offset of the record for a user, or None if the user is not in the store. """
+		table, mask = self.table, self.table_size - 1
+		slot = hash64( user_id ) & mask
+		while True:
+			offset = table[2 * slot + 1]
+			if offset == 0:
+				return None
+			if table[2 * slot] == user_id:
+				return offset
+			slot = ( slot + 1 ) & mask
+
+	def read( self, offset ):
+		user_id, length = RECORD.unpack_from( self.mm, offset )
+		start = offset + RECORD.size
+		return self.loads( self.mm[start:start + length] )
+
+	def get( self, user_id, default = None ):
+		""" Return the latest profile record for a user id. """
+		offset = self.find( user_id )
+		return default if offset is None else self.read( offset )
+
+	def __contains__( self, user_id ):
+		return not self.find( user_id ) is None
+
+	def iter_raw( self ):
+		""" Yield the (user id, encoded record) of every record in the store. """
+		mm, offset = self.mm, HEADER.size
+		while offset < self.table_offset:
+			user_id, length = RECORD.unpack_from( mm, offset )
+			start = offset + RECORD.size
+			yield user_id, mm[start:start + length]
+			offset = start + length
+
+	def iter_sorted( self ):
+		""" Yield the (user id, encoded record) of every record in order of user id. """
+		ids, offsets = array("q"), array("Q")
+		mm, offset = self.mm, HEADER.size
+		while offset < self.table_offset:
+			user_id, length = RECORD.unpack_from( mm, offset )
+			ids.append( user_id )
+			offsets.append( offset )
+			offset += RECORD.size + length
+		if all( ids[i] < ids[i + 1] for i in range( len(ids) - 1 ) ):
+			for item in self.iter_raw():
+				yield item
+			return
+		# stores written before their records were kept in order are read in order of user id
+		for i in sorted( range( len(ids) ), key=ids.__getitem__ ):
+			user_id, length = RECORD.unpack_from( mm, offsets[i] )
+			start = offsets[i] + RECORD.size
+			yield user_id, mm[start:start + length]
+
+	def __iter__( self ):
+		loads = self.loads
+		for user_id, data in self.iter_raw():
+			yield loads( data )
+
+	def close( self ):
+		if not self.table is None:
+			self.table.release()
+			self.table = None
+		self.mm.close()
+		self.fin.close()
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *args ):
+		self.close()
+
+def open_store( path ):
+	""" Open the profile store at path, or return None if it does not exist yet. """
+	if not os.path.exists( path ):
+		return None
+	return ProfileStore( path )
+
+def write_run( fout, updates ):
+	""" Write a dictionary of records by user id to a file, in order of user id. """
+	for user_id in sorted( updates ):
+		data = encode_record( updates[user_id] )
+		fout.write( RECORD.pack( user_id, len(data) ) )
+		fout.write( data )
+
+def iter_run( path ):
+	""" Yield the (user id, encoded record) of every record in a run written by write_run(). """
+	with open( path, "rb", buffering=1 << 20 ) as fin:
+		while True:
+			header = fin.read( RECORD.size )
+			if len(header) < RECORD.size:
+				return
+			user_id, length = RECORD.unpack( header )
+			yield user_id, fin.read( length )
+
+def compact( path, runs ):
+	""" Rewrite the store at path with a list of runs of new records merged into it, replacing the
+	previous store atomically. Each run is an iterable of (user id, encoded record) in order of user
+	id, and the runs are in the order that their records were added. Returns the number of records
+	in the new store. """
+	tmp_path = path + ".tmp"
+	ids, offsets = array("q"), array("Q")
+	old = None
+	try:
+		old = open_store( path )
+		with open( tmp_path, "wb" ) as fout:
+			fout.write( HEADER.pack( MAGIC, 0, 0, 0 ) )
+			offset = HEADER.size
+			sources = list( runs ) if old is None else [ old.iter_sorted() ] + list( runs )
+			loads = full_loads()
+			# heapq.merge keeps records for the same user in the order of their sources
+			for user_id, group in groupby( heapq.merge( *sources, key=operator.itemgetter(0) ), key=operator.itemgetter(0) ):
+				records = [ data for _, data in group ]
+				data = records[0]
+				if len(records) > 1:
+					record = loads( data )
+					for data in records[1:]:
+						record = merge_records( record, loads( data ) )
+					data = encode_record( record )
+				ids.append( user_id )
+				offsets.append( offset )
+				fout.write( RECORD.pack( user_id, len(data) ) )
+				fout.write( data )
+				offset += RECORD.size + len(data)
+			# at most half of the slots are used, so probe sequences are short
+			table_size = 8
+			while table_size < 2 * len(ids):
+				table_size <<= 1
+			table, mask = array("q", [0]) * ( 2 * table_size ), table_size - 1
+			for user_id, record_offset in zip( ids, offsets ):
+				slot = hash64( user_id ) & mask
+				while table[2 * slot + 1] != 0:
+					slot = ( slot + 1 ) & mask
+				table[2 * slot], table[2 * slot + 1] = user_id, record_offset
+			table.tofile( fout )
+			fout.seek( 0 )
+			fout.write( HEADER.pack( MAGIC, len(ids), table_size, offset ) )
+	finally:
+		if not old is None:
+			old.close()
+	os.replace( tmp_path, path )
+	return len(ids)
+
+# --------------------------------------------------------------
+
+class ProfileWriter:
+	""" Collects new profile snapshots, writing them to a sorted run in the directory of the store
+	whenever batch_size users have new snapshots, and merges the runs into the store at path when
+	it is closed. """
+	def __init__( self, path, batch_size = DEFAULT_BATCH_SIZE ):
+		self.path, self.batch_size = path, batch_size
+		self.updates = {}
+		self.runs = []
+		# number of updated profiles written to the runs
+		self.num_updates = 0
+		self.num_snapshots = 0
+
+	def add( self, user, seen = None ):
+		record = snapshot( user, seen )
+		user_id = record["id"]
+		old = self.updates.get( user_id )
+		self.updates[user_id] = record if old is None else merge_records( old, record )
+		self.num_snapshots += 1
+		if len(self.updates) >= self.batch_size:
+			self.flush()
+
+	def flush( self ):
+		""" Write the snapshots held in memory to a new run. """
+		if len(self.updates) == 0:
+			return
+		fd, run_path = tempfile.mkstemp( prefix=os.path.basename( self.path ) + ".", suffix=".run", dir=os.path.dirname( os.path.abspath( self.path ) ) )
+		self.runs.append( run_path )
+		with os.fdopen( fd, "wb", buffering=1 << 20 ) as fout:
+			write_run( fout, self.updates )
+		log.info("Wrote %d updated profiles to %s" % ( len(self.updates), run_path ) )
+		self.num_updates += len(self.updates)
+		self.updates = {}
+
+	def close( self ):
+		if len(self.updates) == 0 and len(self.runs) == 0 and os.path.exists( self.path ):
+			return
+		num_updates = self.num_updates + len(self.updates)
+		# the last batch is merged straight from memory
+		last = [ ( user_id, encode_record( self.updates[user_id] ) ) for user_id in sorted( self.updates ) ]
+		try:
+			num_records = compact( self.path, [ iter_run( run_path ) for run_path in self.runs ] + [ iter( last ) ] )
+			log.info("Merged %d updated profiles into %s, which has %d profiles" % ( num_updates, self.path, num_records ) )
+		finally:
+			for run_path in self.runs:
+				os.remove( run_path )
+			self.runs, self.updates, self.num_updates = [], {}, 0
+
+# --------------------------------------------------------------
+
+def add_profiles_options( parser ):
+	parser.add_option("--profiles", action="store", type="string", dest="profiles_path", help="look up the latest names and follower counts of users in a profile store built with jsonl-user-export.py --store", default=None)
+
+def profiles_from_options( parser, options ):
+	""" Open the ProfileStore given on the command line, or return None if no store was given. """
+	if options.profiles_path is None:
+		return None
+	try:
+		return ProfileStore( options.profiles_path )
+	except ( ValueError, IOError ) as e:
+		parser.error( str(e) )
@@ -0,0 +1,221 @@
+"""
+Selection of tweets by time window, tweet id, language, author, hashtag and keyword, shared by
+all of the tools. When a file has an up-to-date index (see jsonl-tweet-index.py), only the lines
+matching the time window and ids, and the hashtags and authors if it has posting lists, are read.
+
+Before a line is decoded, it is scanned for the raw bytes which any matching tweet must contain,
+such as "lang":"en" or one of the user ids, so that most lines which cannot match are skipped
+without being decoded at all. Each set of values is found with a single compiled pattern, and
+the candidates are then confirmed by checking the decoded tweet.
+"""
+import re, calendar
+from datetime import datetime
+import logging as log
+from jsonltools.index import open_index, load_postings
+from jsonltools.timeparse import twitter_epoch
+from jsonltools.normalise import hashtag, fold_hashtag
+
+DATE_FORMATS = [ "%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S" ]
+
+# --------------------------------------------------------------
+
+def parse_date( s ):
+	""" Convert a date string in UTC to seconds since the epoch. """
+	for fmt in DATE_FORMATS:
+		try:
+			return calendar.timegm( datetime.strptime( s.strip(), fmt ).timetuple() )
+		except ValueError:
+			pass
+	raise ValueError("Cannot parse date '%s', expected YYYY-MM-DD [HH:MM[:SS]]" % s)
+
+def parse_list( s ):
+	""" Parse a comma-separated list of values, or @path for a file with one value per line. """
+	if s.startswith("@"):
+		with open( s[1:], "r", encoding="utf-8" ) as fin:
+			return [ l.strip() for l in fin if len(l.strip()) > 0 ]
+	return [ x.strip() for x in s.split(",") if len(x.strip()) > 0 ]
+
+def parse_ids( s ):
+	""" Parse a comma-separated list of tweet or user ids, or @path for a file with one id per line. """
+	return set( int(x) for x in parse_list( s ) )
+
+# characters which are never escaped in the JSON written by the Twitter API, so that text made up
+# of them can be found in the raw bytes of a line
+RAW_TEXT = re.compile( r"^[A-Za-z0-9 _#@.,:;!?'-]+$" )
+# number of keywords beyond which the raw bytes are searched with a single pattern
+MAX_RAW_KEYWORDS = 16
+# every number following an "id" key, which includes the ids of the tweet and of its author
+RAW_IDS = re.compile( rb'"id"\s*:\s*(\d+)' )
+# every string value of a "text" key, which includes the text of each hashtag
+RAW_TEXTS = re.compile( rb'"text"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"' )
+# raw text which may be written differently from its normalised form
+RAW_ESCAPED = re.compile( rb'[^\x00-\x7f]|\\' )
+
+def tweet_text( tweet ):
+	""" Return the full text of a tweet, including the part of an extended tweet beyond 140 characters. """
+	extended = tweet.get("extended_tweet")
+	if not extended is None and "full_text" in extended:
+		return extended["full_text"]
+	return tweet.get("full_text") or tweet.get("text") or ""
+
+class Selection:
+	""" A time window [since,until), in seconds since the epoch, and/or sets of tweet ids, language
+	codes, author user ids and hashtags, and/or a list of keywords which must appear in the text
+	of a tweet, ignoring case. A tweet is selected if it matches every one of them which is given,
+	and any one of the values of each. """
+	def __init__( self, since = None, until = None, ids = None, langs = None, users = None, hashtags = None, keywords = None ):
+		self.since, self.until, self.ids = since, until, ids
+		self.langs = None if langs is None else set( lang.lower() for lang in langs )
+		self.users = users
+		self.hashtags = None if hashtags is None else set( fold_hashtag( tag ) for tag in hashtags )
+		self.keywords, self.keyword_pattern = keywords, None
+		if not keywords is None:
+			self.keyword_pattern = re.compile( "|".join( re.escape( k ) for k in keywords ), re.IGNORECASE )
+		# fields which must be decoded to check a tweet
+		fields = []
+		if not self.ids is None:
+			fields.append( "id" )
+		if not ( self.since is None and self.until is None ):
+			fields.append( "created_at" )
+		if not self.langs is None:
+			fields.append( "lang" )
+		if not self.users is None:
+			fields.append( "user.id" )
+		if not self.hashtags is None:
+			fields.append( "entities.hashtags" )
+		if not self.keywords is None:
+			fields += [ "text", "full_text", "extended_tweet.full_text" ]
+		self.fields = tuple( fields )
+		self.compile_raw()
+
+	def compile_raw( self ):
+		""" Build the checks on the raw bytes of a line, one for each kind of value which can always be found in them. """
+		self.raw_ids = [ frozenset( str(x).encode() for x in ids ) for ids in ( self.ids, self.users ) if not ids is None ]
+		self.raw_lang = None
+		if not self.langs is None and all( RAW_TEXT.match( lang ) for lang in self.langs ):
+			self.raw_lang = re.compile( rb'"lang"\s*:\s*"(?:' + b"|".join( re.escape( lang.encode() ) for lang in sorted(self.langs) ) + rb')"', re.IGNORECASE )
+		self.raw_hashtags = None
+		if not self.hashtags is None:
+			self.raw_hashtags = frozenset( tag[1:].encode() for tag in self.hashtags )
+		# keywords with other characters may be escaped, so can only be checked after decoding
+		# a case-insensitive pattern is slower than lowering the line and searching for each keyword,
+		# unless there are many keywords
+		self.raw_keywords = None
+		if not self.keywords is None and all( RAW_TEXT.match( k ) for k in self.keywords ):
+			keywords = [ k.lower().encode() for k in self.keywords ]
+			if len(keywords) <= MAX_RAW_KEYWORDS:
+				self.raw_keywords = lambda l : any( k in l for k in keywords )
+			else:
+				self.raw_keywords = lambda l, search = re.compile( b"|".join( re.escape( k ) for k in keywords ) ).search : not search( l ) is None
+
+	def is_active( self ):
+		return len(self.fields) > 0
+
+	def candidate( self, l ):
+		""" Check the raw bytes of a stripped line for the values that a selected tweet must contain.
+		Returns False only if the line cannot be selected. Lines which are not JSON objects are left
+		to fail decoding, so that they are still counted as failures. """
+		if l[0:1] != b"{" or l[-1:] != b"}":
+			return True
+		if not self.raw_lang is None and self.raw_lang.search( l ) is None:
+			return False
+		if not self.raw_keywords is None and not self.raw_keywords( l.lower() ):
+			return False
+		if len(self.raw_ids) > 0:
+			found = RAW_IDS.findall( l )
+			for ids in self.raw_ids:
+				if ids.isdisjoint( found ):
+					return False
+		if not self.raw_hashtags is None and not self.raw_hashtag( l ):
+			return False
+		return True
+
+	def raw_hashtag( self, l ):
+		""" Check whether any hashtag in a line could be one of those selected. The text of a hashtag never
+		contains a space, and any text which is escaped or not ASCII could normalise to a selected hashtag. """
+		tags = self.raw_hashtags
+		for text in RAW_TEXTS.findall( l ):
+			if b" " in text:
+				continue
+			if text.lower() in tags or not RAW_ESCAPED.search( text ) is None:
+				return True
+		return False
+
+	def accepts( self, tweet ):
+		if not self.ids is None and not tweet.get("id") in self.ids:
+			return False
+		if not self.langs is None and not ( tweet.get("lang") or "" ).lower() in self.langs:
+			return False
+		if not self.users is None and not tweet.get("user", {}).get("id") in self.users:
+			return False
+		if not self.hashtags is None:
+			tags = self.hashtags
+			if not any( hashtag[tag["text"]] in tags for tag in tweet.get("entities", {}).get("hashtags", []) ):
+				return False
+		if not self.keyword_pattern is None and self.keyword_pattern.search( tweet_text( tweet ) ) is None:
+			return False
+		if not ( self.since is None and self.until is None ):
+			created_at = twitter_epoch( tweet["created_at"] )
+			if not self.since is None and created_at < self.since:
+				return False
+			if not self.until is None and created_at >= self.until:
+				return False
+		return True
+
+	def select_lines( self, path ):
+		""" Return the candidate lines of a file using its index, or None if it has no usable index. """
+		index = open_index( path )
+		if index is None:
+			return None
+		positions = None
+		if not ( self.since is None and self.until is None ):
+			positions = index.positions_between( self.since, self.until )
+		if not self.ids is None:
+			matches = index.positions_for_ids( self.ids )
+			positions = matches if positions is None else positions & matches
+		if not ( self.users is None and self.hashtags is None ):
+			postings = load_postings( path )
+			if not postings is None:
+				for values, lists in ( ( self.users, postings["users"] ), ( self.hashtags, postings["hashtags"] ) ):
+					if not values is None:
+						matches = set()
+						for value in values:
+							matches.update( lists.get( value, () ) )
+						positions = matches if positions is None else positions & matches
+		# the index cannot narrow down the lines by language or keyword
+		if positions is None:
+			index.close()
+			return None
+		log.info("Index selected %d/%d tweets in %s" % ( len(positions), len(index), path ) )
+		return self._iter_selected( index, positions )
+
+	def _iter_selected( self, index, positions ):
+		try:
+			yield from index.iter_positions( positions )
+		finally:
+			index.close()
+
+# --------------------------------------------------------------
+
+def add_selection_options( parser ):
+	parser.add_option("--since", action="store", type="string", dest="since", help="only include tweets created at or after this UTC time (YYYY-MM-DD [HH:MM[:SS]])", default=None)
+	parser.add_option("--until", action="store", type="string", dest="until", help="only include tweets created before this UTC time (YYYY-MM-DD [HH:MM[:SS]])", default=None)
+	parser.add_option("--ids", action="store", type="string", dest="ids", help="only include tweets with these comma-separated ids, or @path for a file of ids", default=None)
+	parser.add_option("--lang", action="store", type="string", dest="langs", help="only include tweets in these comma-separated languages, eg. en,fr", default=None)
+	parser.add_option("--users", action="store", type="string", dest="users", help="only include tweets by users with these comma-separated ids, or @path for a file of user ids", default=None)
+	parser.add_option("--hashtags", action="store", type="string", dest="hashtags", help="only include tweets with at least one of these comma-separated hashtags, or @path for a file of hashtags", default=None)
+	parser.add_option("--keywords", action="store", type="string", dest="keywords", help="only include tweets whose text contains at least one of these comma-separated keywords, ignoring case, or @path for a file of keywords", default=None)
+
+def selection_from_options( parser, options ):
+	""" Create a Selection from the parsed command line options, or None if no selection options were given. """
+	try:
+		selection = Selection( None if options.since is None else parse_date( options.since ),
+			None if options.until is None else parse_date( options.until ),
+			None if options.ids is None else parse_ids( options.ids ),
+			None if options.langs is None else parse_list( options.langs ),
+			None if options.users is None else parse_ids( options.users ),
+			None if options.hashtags is None else parse_list( options.hashtags ),
+			None if options.keywords is None else parse_list( options.keywords ) )
+	except ( ValueError, IOError ) as e:
+		parser.error( str(e) )
+	return selection if selection.is_active() else None
@@ -0,0 +1,164 @@
+"""
+Bounded-memory sketches for approximate counting over large collections of tweets.
+"""
+import heapq, hashlib, math
+
+MASK64 = (1 << 64) - 1
+
+# --------------------------------------------------------------
+
+class SpaceSaving:
+	""" Space-Saving heavy hitters sketch, which tracks at most 'capacity' keys. The count for
+	a tracked key overestimates its true count by at most its recorded error, and any key whose
+	true count exceeds total/capacity is guaranteed to be tracked. """
+	def __init__( self, capacity ):
+		self.capacity = capacity
+		self.total = 0
+		self.counts = {}
+		self.errors = {}
+		# holds exactly one (count,key) entry per tracked key, where counts may be stale
+		self.heap = []
+
+	@classmethod
+	def for_error( cls, error ):
+		""" Create a sketch whose counts overestimate by at most error * total. """
+		return cls( int( math.ceil( 1.0 / error ) ) )
+
+	def add( self, key, count = 1 ):
+		""" Add to the count for a key, returning any key which was evicted to make room for it. """
+		self.total += count
+		counts = self.counts
+		if key in counts:
+			counts[key] += count
+			return None
+		if len(counts) < self.capacity:
+			counts[key] = count
+			self.errors[key] = 0
+			heapq.heappush( self.heap, ( count, key ) )
+			return None
+		# replace the key with the smallest count
+		min_count, min_key = self._pop_min()
+		del counts[min_key]
+		del self.errors[min_key]
+		counts[key] = min_count + count
+		self.errors[key] = min_count
+		heapq.heappush( self.heap, ( counts[key], key ) )
+		return min_key
+
+	def _pop_min( self ):
+		heap, counts = self.heap, self.counts
+		while True:
+			count, key = heap[0]
+			actual = counts[key]
+			if actual == count:
+				return heapq.heappop( heap )
+			# refresh the stale entry and try again
+			heapq.heapreplace( heap, ( actual, key ) )
+
+	def min_count( self ):
+		""" Return the smallest tracked count if the sketch is full, which is an upper bound on the
+		count of any key that is not tracked, or otherwise 0. """
+		if len(self.counts) < self.capacity:
+			return 0
+		return min( self.counts.values() )
+
+	def merge( self, other ):
+		""" Add the counts of another sketch of the same capacity. A key which is not tracked by one of
+		the sketches may have occurred up to its smallest count there, so that is counted for it, which
+		keeps every count an overestimate by at most the total of both sketches / capacity. The keys
+		with the largest counts are kept. """
+		min_self, min_other = self.min_count(), other.min_count()
+		counts, errors = {}, {}
+		for key in set( self.counts ) | set( other.counts ):
+			if key in self.counts:
+				count, error = self.counts[key], self.errors[key]
+			else:
+				count, error = min_self, min_self
+			if key in other.counts:
+				count, error = count + other.counts[key], error + other.errors[key]
+			else:
+				count, error = count + min_other, error + min_other
+			counts[key], errors[key] = count, error
+		if len(counts) > self.capacity:
+			keep = heapq.nlargest( self.capacity, counts, key = counts.get )
+			counts = { key : counts[key] for key in keep }
+			errors = { key : errors[key] for key in keep }
+		self.counts, self.errors = counts, errors
+		self.heap = [ ( count, key ) for key, count in counts.items() ]
+		heapq.heapify( self.heap )
+		self.total += other.total
+
+	def map_keys( self, function ):
+		""" Return a copy of the sketch with each key replaced by function(key), which must not map
+		two keys to the same one. """
+		sketch = SpaceSaving( self.capacity )
+		sketch.total = self.total
+		for key, count in self.counts.items():
+			mapped = function( key )
+			sketch.counts[mapped], sketch.errors[mapped] = count, self.errors[key]
+			sketch.heap.append( ( count, mapped ) )
+		heapq.heapify( sketch.heap )
+		return sketch
+
+	def items( self ):
+		return self.counts.items()
+
+	def error( self, key ):
+		return self.errors.get( key, 0 )
+
+	def __len__( self ):
+		return len(self.counts)
+
+# --------------------------------------------------------------
+
+def hash64( key ):
+	""" Stable 64-bit hash of an integer or string, which is the same across processes. """
+	if isinstance(key, int):
+		# splitmix64 finaliser
+		x = ( key + 0x9E3779B97F4A7C15 ) & MASK64
+		x = ( (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 ) & MASK64
+		x = ( (x ^ (x >> 27)) * 0x94D049BB133111EB ) & MASK64
+		return x ^ (x >> 31)
+	if isinstance(key, str):
+		key = key.encode("utf-8", "surrogatepass")
+	return int.from_bytes( hashlib.blake2b( key, digest_size=8 ).digest(), "little" )
+
+class HyperLogLog:
+	""" HyperLogLog sketch for estimating the number of distinct keys, using 2^precision one-byte
+	registers. The relative standard error of the estimate is about 1.04/sqrt(2^precision). """
+	def __init__( self, precision = 14 ):
+		if precision < 4 or precision > 18:
+			raise ValueError("HyperLogLog precision must be between 4 and 18")
+		self.precision = precision
+		self.registers = bytearray( 1 << precision )
+
+	@classmethod
+	def for_error( cls, error ):
+		precision = int( math.ceil( math.log( (1.04 / error) ** 2, 2 ) ) )
+		return cls( min( max( precision, 4 ), 18 ) )
+
+	def add( self, key ):
+		x = hash64( key )
+		p = self.precision
+		index = x >> (64 - p)
+		rank = (64 - p) - ( x & ((1 << (64 - p)) - 1) ).bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+
+	def merge( self, other ):
+		if other.precision != self.precision:
+			raise ValueError("Cannot merge HyperLogLog sketches with different precisions")
+		self.registers = bytearray( map( max, self.registers, other.registers ) )
+
+	def estimate( self ):
+		m = len(self.registers)
+		alpha = 0.7213 / ( 1 + 1.079 / m )
+		raw = alpha * m * m / sum( 2.0 ** -r for r in self.registers )
+		zeros = self.registers.count(0)
+		# linear counting is more accurate for small cardinalities
+		if raw <= 2.5 * m and zeros > 0:
+			return m * math.log( m / zeros )
+		return raw
+
+	def __len__( self ):
+		return int( round( self.estimate() ) )
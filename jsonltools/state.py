@@ -0,0 +1,52 @@
+"""
+Saving and merging of partial aggregate state. A state file holds the aggregators for one or
+more reports, so that each day or shard of data only has to be scanned once, and many small
+state files can later be merged into a final report.
+
+State files are pickles of the aggregators, so loading one can run arbitrary code, and they should
+only be loaded from trusted sources, such as earlier runs of the same tools. A state file may also
+not load after a change to the classes of the aggregators which it holds.
+"""
+import gzip, pickle
+import logging as log
+
+# version of the state file layout
+STATE_FORMAT = 1
+
+# --------------------------------------------------------------
+
+def save_state( path, aggregators ):
+	""" Write a dictionary mapping report names to aggregators to a compressed state file. """
+	log.info("Saving aggregate state to %s ..." % path )
+	with gzip.open( path, "wb", compresslevel=6 ) as fout:
+		pickle.dump( { "format" : STATE_FORMAT, "aggregators" : aggregators }, fout, protocol=pickle.HIGHEST_PROTOCOL )
+
+def load_state( path ):
+	""" Read the dictionary of report names to aggregators from a state file, which must come from a
+	trusted source. Raises ValueError if the file is not a state file or cannot be read by this version. """
+	try:
+		with gzip.open( path, "rb" ) as fin:
+			state = pickle.load( fin )
+	except FileNotFoundError:
+		raise
+	except Exception as e:
+		# unpickling a file which is not a pickle can fail with almost any type of exception
+		raise ValueError( "%s is not a readable state file: %s" % ( path, e ) )
+	if not isinstance(state, dict) or state.get("format") != STATE_FORMAT:
+		raise ValueError( "%s is not a supported state file" % path )
+	return state["aggregators"]
+
+def merge_states( paths, names ):
+	""" Merge the aggregators for the specified reports across a list of state files. """
+	merged = {}
+	for path in paths:
+		log.info("Merging aggregate state from %s ..." % path )
+		aggregators = load_state( path )
+		for name in names:
+			if not name in aggregators:
+				raise ValueError( "State file %s does not contain a '%s' report" % ( path, name ) )
+			if name in merged:
+				merged[name].merge( aggregators[name] )
+			else:
+				merged[name] = aggregators[name]
+	return merged
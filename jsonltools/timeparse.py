@@ -0,0 +1,104 @@
+"""
+Fast parsing of Twitter timestamps, which use the fixed layout 'Wed Aug 27 13:08:45 +0000 2008'.
+Fields are read from fixed positions instead of using strptime(), timezone offsets are applied
+rather than dropped, and results are memoised since bursts of tweets share the same timestamp.
+"""
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+MONTHS = { "Jan" : 1, "Feb" : 2, "Mar" : 3, "Apr" : 4, "May" : 5, "Jun" : 6,
+	"Jul" : 7, "Aug" : 8, "Sep" : 9, "Oct" : 10, "Nov" : 11, "Dec" : 12 }
+EPOCH = datetime(1970, 1, 1)
+CACHE_SIZE = 1 << 16
+
+# --------------------------------------------------------------
+
+def days_from_civil( year, month, day ):
+	""" Number of days since 1970-01-01 for a date in the proleptic Gregorian calendar. """
+	year -= month <= 2
+	era = year // 400
+	yoe = year - era * 400
+	doy = ( 153 * ( month + ( -3 if month > 2 else 9 ) ) + 2 ) // 5 + day - 1
+	doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+	return era * 146097 + doe - 719468
+
+@lru_cache(maxsize=CACHE_SIZE)
+def twitter_epoch( s ):
+	""" Convert a Twitter timestamp to seconds since the epoch (UTC). """
+	if len(s) != 30 or s[3] != " " or s[19] != " " or s[25] != " ":
+		raise ValueError("time data '%s' does not match the Twitter timestamp format" % s)
+	try:
+		month = MONTHS[s[4:7]]
+	except KeyError:
+		raise ValueError("time data '%s' has an unknown month" % s)
+	day, year = int(s[8:10]), int(s[26:30])
+	hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+	if day < 1 or day > 31 or hour > 23 or minute > 59 or second > 61:
+		raise ValueError("time data '%s' is out of range" % s)
+	# offset is in the form +HHMM
+	sign = -1 if s[20] == "-" else 1
+	offset = sign * ( int(s[21:23]) * 3600 + int(s[23:25]) * 60 )
+	return days_from_civil( year, month, day ) * 86400 + hour * 3600 + minute * 60 + second - offset
+
+def parse_twitter_date( s ):
+	""" Convert a Twitter timestamp to a naive datetime in UTC. """
+	return EPOCH + timedelta( seconds = twitter_epoch( s ) )
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_twitter_date( s ):
+	""" Convert a Twitter timestamp to a 'YYYY-MM-DD HH:MM:SS' string in UTC. """
+	return "%04d-%02d-%02d %02d:%02d:%02d" % time.gmtime( twitter_epoch( s ) )[0:6]
+
+def parse_fixed( values ):
+	""" Parse a list of Twitter timestamps with array arithmetic on their bytes, returning None
+	if any of them is not a well-formed timestamp. """
+	import numpy as np
+	try:
+		# one byte longer than a timestamp, so that longer values are not silently truncated
+		raw = np.array( values, dtype="S31" ).view( np.uint8 ).reshape( -1, 31 )
+	except ( TypeError, ValueError, UnicodeEncodeError ):
+		return None
+	# values are padded with null bytes, and a timestamp ends with a digit
+	if ( raw[:, 30] != 0 ).any() or ( raw[:, 29] == 0 ).any():
+		return None
+	b = raw[:, :30].astype( np.int64 )
+	digits = b - 48
+	digit_cols = [ 8, 9, 11, 12, 14, 15, 17, 18, 21, 22, 23, 24, 26, 27, 28, 29 ]
+	ok = ( ( digits[:, digit_cols] >= 0 ) & ( digits[:, digit_cols] <= 9 ) ).all( axis=1 )
+	ok &= ( b[:, 3] == 32 ) & ( b[:, 19] == 32 ) & ( b[:, 25] == 32 ) & ( ( b[:, 20] == 43 ) | ( b[:, 20] == 45 ) )
+	keys = ( b[:, 4] << 16 ) | ( b[:, 5] << 8 ) | b[:, 6]
+	names = sorted( MONTHS, key=lambda name : name.encode() )
+	month_keys = np.array( [ int.from_bytes( name.encode(), "big" ) for name in names ], dtype=np.int64 )
+	pos = np.minimum( np.searchsorted( month_keys, keys ), len(names) - 1 )
+	ok &= month_keys[pos] == keys
+	month = np.array( [ MONTHS[name] for name in names ], dtype=np.int64 )[pos]
+	day, year = digits[:, 8] * 10 + digits[:, 9], digits[:, 26] * 1000 + digits[:, 27] * 100 + digits[:, 28] * 10 + digits[:, 29]
+	hour, minute, second = digits[:, 11] * 10 + digits[:, 12], digits[:, 14] * 10 + digits[:, 15], digits[:, 17] * 10 + digits[:, 18]
+	ok &= ( day >= 1 ) & ( day <= 31 ) & ( hour <= 23 ) & ( minute <= 59 ) & ( second <= 61 )
+	if not ok.all():
+		return None
+	offset = np.where( b[:, 20] == 45, -1, 1 ) * ( ( digits[:, 21] * 10 + digits[:, 22] ) * 3600 + ( digits[:, 23] * 10 + digits[:, 24] ) * 60 )
+	# days_from_civil(), on arrays
+	year = year - ( month <= 2 )
+	era = year // 400
+	yoe = year - era * 400
+	doy = ( 153 * ( month + np.where( month > 2, -3, 9 ) ) + 2 ) // 5 + day - 1
+	doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+	days = era * 146097 + doe - 719468
+	return days * 86400 + hour * 3600 + minute * 60 + second - offset
+
+def twitter_epochs( values ):
+	""" Vectorised conversion of a sequence of Twitter timestamps to a NumPy int64 array of
+	seconds since the epoch. Well-formed timestamps are parsed as an array of bytes, and
+	otherwise each distinct timestamp is only parsed once. """
+	import numpy as np
+	if len(values) == 0:
+		return np.zeros( 0, dtype=np.int64 )
+	parsed = parse_fixed( values )
+	if not parsed is None:
+		return parsed
+	values = np.asarray( values, dtype=object )
+	unique, inverse = np.unique( values, return_inverse=True )
+	parsed = np.fromiter( ( twitter_epoch(s) for s in unique ), dtype=np.int64, count=len(unique) )
+	return parsed[inverse.reshape(-1)]
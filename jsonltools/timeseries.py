@@ -0,0 +1,394 @@
+"""
+Time series of tweet volume, binned by created_at at a fixed interval such as an hour. For each
+bin, the total number of tweets, retweets and replies is counted, together with the number of
+tweets in each language and containing each hashtag, so that series for the top hashtags can be
+produced at the end.
+
+apply() only appends the raw values of each tweet to lists, and the timestamps are parsed and
+binned for a whole batch of tweets at a time with NumPy, so the cost added to the decoding pass
+is small. Counts are held in arrays with one column per bin, aligned on multiples of the interval
+since the epoch, so that counters from different files or workers can be merged by adding them.
+
+Bursts are bins whose count is well above the recent level, measured by a z-score against the
+mean and standard deviation of a trailing window of earlier bins. NumPy is required.
+"""
+import time, heapq
+from collections import defaultdict
+import logging as log
+from jsonltools.engine import Aggregator
+from jsonltools.timeparse import twitter_epoch, twitter_epochs
+from jsonltools.windows import parse_span
+from jsonltools.normalise import hashtag
+from jsonltools.cache import IS_OBJECT, IS_RETWEET, IS_REPLY
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# series counted for every tweet, in the order of the rows of TimeSeriesCounter.counts
+SERIES = [ "total", "retweets", "replies" ]
+# number of tweets collected before their timestamps are parsed and binned
+BATCH_SIZE = 1 << 16
+
+# --------------------------------------------------------------
+
+def parse_epochs( values ):
+	""" Parse a list of Twitter timestamps, returning an array of seconds since the epoch and a
+	mask of the values which could be parsed, so that one bad value only loses its own tweet. """
+	try:
+		return twitter_epochs( values ), None
+	except ( ValueError, TypeError ):
+		pass
+	epochs = np.zeros( len(values), dtype=np.int64 )
+	valid = np.ones( len(values), dtype=bool )
+	for i, s in enumerate( values ):
+		try:
+			epochs[i] = twitter_epoch( s )
+		except ( ValueError, TypeError ):
+			valid[i] = False
+	return epochs, valid
+
+def top_order( values, top ):
+	""" Indices of the top largest values in descending order, where ties are in index order, using a partial sort. """
+	if top < len(values):
+		candidates = np.argpartition( -values, top )[:top]
+	else:
+		candidates = np.arange( len(values) )
+	return candidates[ np.lexsort( ( candidates, -values[candidates] ) ) ]
+
+def resize( counts, rows, before, after ):
+	""" Return a copy of a 2D array of counts with rows added at the end, and columns added before and after. """
+	resized = np.zeros( ( rows, before + counts.shape[1] + after ), dtype=counts.dtype )
+	resized[:counts.shape[0], before:before + counts.shape[1]] = counts
+	return resized
+
+def detect_bursts( counts, window = 24, threshold = 3.0, min_count = 10 ):
+	""" Find runs of bins whose counts have a z-score of at least threshold, relative to the mean and
+	standard deviation of up to 'window' preceding bins, and which have at least min_count tweets.
+	The standard deviation is taken to be at least the square root of the mean, as for Poisson
+	counts, so that quiet series do not produce bursts from tiny changes. Returns a list of
+	(first bin, last bin, peak bin, peak z-score) tuples, with bins as column indices. """
+	x = np.asarray( counts, dtype=np.float64 )
+	n = len(x)
+	if n < 2:
+		return []
+	sums = np.concatenate( ( [0.0], np.cumsum( x ) ) )
+	squares = np.concatenate( ( [0.0], np.cumsum( x * x ) ) )
+	ends = np.arange( n )
+	starts = np.maximum( ends - window, 0 )
+	sizes = np.maximum( ends - starts, 1 )
+	mean = ( sums[ends] - sums[starts] ) / sizes
+	var = np.maximum( ( squares[ends] - squares[starts] ) / sizes - mean * mean, 0 )
+	std = np.maximum( np.sqrt( var ), np.maximum( np.sqrt( mean ), 1.0 ) )
+	z = ( x - mean ) / std
+	# the first bin has no history to compare against
+	z[0] = 0
+	hot = ( z >= threshold ) & ( x >= min_count )
+	bursts = []
+	for i in np.flatnonzero( hot & ~np.concatenate( ( [False], hot[:-1] ) ) ):
+		j = i
+		while j + 1 < n and hot[j + 1]:
+			j += 1
+		peak = int( i + np.argmax( z[i:j + 1] ) )
+		bursts.append( ( int(i), int(j), peak, float( z[peak] ) ) )
+	return bursts
+
+# shared default for tweets without entities
+EMPTY = {}
+
+# --------------------------------------------------------------
+
+class TimeSeriesCounter(Aggregator):
+	""" Counts tweets in bins of a fixed interval in seconds. The counts for bin b are in column
+	b - start of each array, where start is the first bin seen. """
+	# series accumulate across all input files
+	per_file = False
+	batched = True
+	fields = ( "created_at", "retweeted_status?", "in_reply_to_user_id", "lang", "entities.hashtags" )
+
+	def __init__( self, interval = 3600, batch_size = BATCH_SIZE ):
+		super().__init__()
+		if np is None:
+			raise ImportError("NumPy is required for time series")
+		self.interval, self.batch_size = interval, batch_size
+		self.start = None
+		self.counts = np.zeros( ( len(SERIES), 0 ), dtype=np.int64 )
+		self.lang_ids, self.langs = {}, []
+		self.lang_counts = np.zeros( ( 0, 0 ), dtype=np.int64 )
+		self.tag_ids, self.tags = {}, []
+		# packed (hashtag id, bin) -> number of tweets
+		self.tag_bins = defaultdict(int)
+		self.clear_batch()
+
+	def spawn( self ):
+		return TimeSeriesCounter( self.interval, self.batch_size )
+
+	def clear_batch( self ):
+		self.batch_times, self.batch_flags, self.batch_langs = [], [], []
+		# raw language codes, and the raw hashtag text with the position in the batch of the tweet
+		# containing each one, which are interned when the batch is flushed
+		self.batch_tags, self.batch_rows = [], []
+
+	def intern_lang( self, lang ):
+		lang_id = self.lang_ids.get( lang )
+		if lang_id is None:
+			lang_id = self.lang_ids[lang] = len(self.langs)
+			self.langs.append( lang )
+		return lang_id
+
+	def intern_tag( self, tag ):
+		tag_id = self.tag_ids.get( tag )
+		if tag_id is None:
+			tag_id = self.tag_ids[tag] = len(self.tags)
+			self.tags.append( tag )
+		return tag_id
+
+	def apply( self, tweet ):
+		created_at = tweet["created_at"]
+		get = tweet.get
+		flags = ( not get("retweeted_status") is None ) | ( ( not get("in_reply_to_user_id") is None ) << 1 )
+		# languages and hashtags are interned once per batch, rather than for every tweet
+		lang = get("lang")
+		if not ( lang is None or lang.__class__ is str ):
+			raise TypeError("Language is not a string")
+		hashtags = get("entities", EMPTY).get("hashtags")
+		texts = None
+		if hashtags:
+			texts = [ tag["text"] for tag in hashtags ]
+			for text in texts:
+				if not text.__class__ is str:
+					raise TypeError("Hashtag text is not a string")
+		# nothing is added to the batch until every field has been read
+		batch_times = self.batch_times
+		row = len(batch_times)
+		batch_times.append( created_at )
+		self.batch_flags.append( flags )
+		self.batch_langs.append( lang )
+		if texts:
+			self.batch_tags += texts
+			self.batch_rows += [row] * len(texts)
+		if row + 1 >= self.batch_size:
+			self.flush()
+
+	def extend( self, first, last ):
+		""" Make sure that the arrays have columns for the bins first..last, and rows for every language. """
+		if self.start is None:
+			self.start = first
+		end = self.start + self.counts.shape[1]
+		before, after = max( self.start - first, 0 ), max( last + 1 - end, 0 )
+		self.start -= before
+		if before > 0 or after > 0:
+			self.counts = resize( self.counts, len(SERIES), before, after )
+		if before > 0 or after > 0 or self.lang_counts.shape[0] < len(self.langs):
+			self.lang_counts = resize( self.lang_counts, len(self.langs), before, self.counts.shape[1] - before - self.lang_counts.shape[1] )
+
+	def apply_batch( self, batch ):
+		self.flush()
+		strings = batch.strings
+		# apply() fails for rows without created_at, which include any rows which are not objects
+		codes = batch.column("created_at")
+		ok = batch.has( IS_OBJECT ) & ( codes >= 0 )
+		num_ok = int( ok.sum() )
+		self.num_tweets += num_ok
+		self.num_failed += len(batch) - num_ok
+		# each distinct timestamp is only parsed once
+		time_codes, inverse = np.unique( codes[ok], return_inverse=True )
+		epochs, valid = parse_epochs( [ strings[code] for code in time_codes.tolist() ] )
+		inverse = inverse.reshape(-1)
+		epochs, valid = epochs[inverse], None if valid is None else valid[inverse]
+		flags = ( batch.has( IS_RETWEET ).astype(np.int8) | ( batch.has( IS_REPLY ).astype(np.int8) << 1 ) )[ok]
+		lang_codes, inverse = np.unique( batch.column("lang")[ok], return_inverse=True )
+		lang_ids = np.array( [ self.intern_lang( strings[code] or "und" ) for code in lang_codes.tolist() ], dtype=np.int64 )
+		langs = lang_ids[inverse.reshape(-1)]
+		# hashtags are only counted once per tweet
+		rows, tag_codes = batch.lists( "hashtags.offsets", "hashtags.text" )
+		tag_codes, inverse = np.unique( tag_codes, return_inverse=True )
+		tag_ids = np.array( [ self.intern_tag( hashtag[strings[code]] ) for code in tag_codes.tolist() ], dtype=np.int64 )
+		pairs = np.unique( ( rows.astype(np.int64) << 32 ) | tag_ids[inverse.reshape(-1)] )
+		rows, tags = pairs >> 32, pairs & 0xFFFFFFFF
+		tag_ok = ok[rows]
+		rows = ( np.cumsum( ok ) - 1 )[rows[tag_ok]]
+		self.add_epochs( epochs, valid, flags, langs, tags[tag_ok], rows )
+
+	def flush( self ):
+		""" Parse and bin the timestamps of the current batch of tweets, and add them to the counts. """
+		if len(self.batch_times) == 0:
+			return
+		epochs, valid = parse_epochs( self.batch_times )
+		flags = np.array( self.batch_flags, dtype=np.int8 )
+		langs = self.batch_ids( self.batch_langs, lambda lang : self.intern_lang( lang or "und" ) )
+		tags, rows = self.batch_ids( self.batch_tags, lambda text : self.intern_tag( hashtag[text] ) ), np.array( self.batch_rows, dtype=np.int64 )
+		self.clear_batch()
+		if len(tags) > 0:
+			# hashtags are only counted once per tweet
+			pairs = np.unique( ( rows << 32 ) | tags )
+			rows, tags = pairs >> 32, pairs & 0xFFFFFFFF
+		self.add_epochs( epochs, valid, flags, langs, tags, rows )
+
+	def batch_ids( self, values, intern ):
+		""" Return an array of the ids of a list of raw values in the current batch, interning each distinct value once. """
+		ids = {}
+		for value in values:
+			if not value in ids:
+				ids[value] = intern( value )
+		return np.fromiter( map( ids.__getitem__, values ), dtype=np.int64, count=len(values) )
+
+	def add_epochs( self, epochs, valid, flags, langs, tags, rows ):
+		""" Add tweets to the counts, given their times, flags and language ids, where tags holds the ids
+		of their hashtags, and rows the position of the tweet containing each one. Tweets whose times
+		are not marked as valid are counted as failures instead. """
+		bins = np.asarray( epochs, dtype=np.int64 ) // self.interval
+		if not valid is None:
+			num_invalid = int( len(valid) - valid.sum() )
+			if num_invalid > 0:
+				log.error("Failed to parse created_at of %d tweets" % num_invalid )
+			self.num_failed += num_invalid
+			self.num_tweets -= num_invalid
+			tag_valid = valid[rows]
+			tags, rows = tags[tag_valid], rows[tag_valid]
+			if len(tags) > 0:
+				# positions in the batch change when invalid tweets are removed
+				rows = ( np.cumsum( valid ) - 1 )[rows]
+			bins, flags, langs = bins[valid], flags[valid], langs[valid]
+		# a batch may have no tweets with a valid time, such as a cached block without created_at
+		if len(bins) == 0:
+			return
+		self.extend( int( bins.min() ), int( bins.max() ) )
+		n = self.counts.shape[1]
+		cols = bins - self.start
+		self.counts[0] += np.bincount( cols, minlength=n )
+		self.counts[1] += np.bincount( cols[( flags & 1 ) != 0], minlength=n )
+		self.counts[2] += np.bincount( cols[( flags & 2 ) != 0], minlength=n )
+		self.lang_counts += np.bincount( langs * n + cols, minlength=self.lang_counts.size ).reshape( self.lang_counts.shape )
+		if len(tags) > 0:
+			keys, key_counts = np.unique( ( tags << 32 ) | bins[rows], return_counts=True )
+			tag_bins = self.tag_bins
+			for key, count in zip( keys.tolist(), key_counts.tolist() ):
+				tag_bins[key] += count
+
+	def merge( self, other ):
+		if other.interval != self.interval:
+			raise ValueError("Cannot merge time series with different intervals")
+		super().merge( other )
+		self.flush()
+		other.flush()
+		if other.start is None:
+			return
+		lang_mapping = [ self.intern_lang( lang ) for lang in other.langs ]
+		other_end = other.start + other.counts.shape[1] - 1
+		self.extend( other.start, other_end )
+		cols = slice( other.start - self.start, other_end - self.start + 1 )
+		self.counts[:, cols] += other.counts
+		for lang_id, counts in zip( lang_mapping, other.lang_counts ):
+			self.lang_counts[lang_id, cols] += counts
+		tag_mapping = [ self.intern_tag( tag ) for tag in other.tags ]
+		for key, count in other.tag_bins.items():
+			self.tag_bins[( tag_mapping[key >> 32] << 32 ) | ( key & 0xFFFFFFFF )] += count
+
+	def __getstate__( self ):
+		# pending tweets are binned before the counts are saved or sent back from a worker
+		self.flush()
+		return self.__dict__
+
+	# --------------------------------------------------------------
+
+	def times( self ):
+		""" Start time of each bin, in seconds since the epoch. """
+		if self.start is None:
+			return np.zeros( 0, dtype=np.int64 )
+		return ( self.start + np.arange( self.counts.shape[1], dtype=np.int64 ) ) * self.interval
+
+	def top_tags( self, top ):
+		""" Return the names and counts per bin of the hashtags which appear in the most tweets. """
+		self.flush()
+		n = self.counts.shape[1]
+		if top <= 0 or len(self.tag_bins) == 0:
+			return [], np.zeros( ( 0, n ), dtype=np.int64 )
+		keys = np.fromiter( self.tag_bins.keys(), dtype=np.int64, count=len(self.tag_bins) )
+		key_counts = np.fromiter( self.tag_bins.values(), dtype=np.int64, count=len(self.tag_bins) )
+		tag_ids, cols = keys >> 32, ( keys & 0xFFFFFFFF ) - self.start
+		totals = np.bincount( tag_ids, weights=key_counts, minlength=len(self.tags) )
+		order = top_order( totals, top )
+		rows = np.full( len(self.tags), -1, dtype=np.int64 )
+		rows[order] = np.arange( len(order) )
+		selected = rows[tag_ids] >= 0
+		series = np.zeros( ( len(order), n ), dtype=np.int64 )
+		np.add.at( series, ( rows[tag_ids[selected]], cols[selected] ), key_counts[selected] )
+		return [ self.tags[i] for i in order ], series
+
+	def series( self, top_tags = 10 ):
+		""" Return a list of (name, counts per bin) pairs for all of the series, where languages are
+		ordered by their total counts. """
+		self.flush()
+		columns = [ ( name, self.counts[i] ) for i, name in enumerate( SERIES ) ]
+		if len(self.langs) > 0:
+			for i in np.argsort( -self.lang_counts.sum( axis=1 ), kind="stable" ):
+				columns.append( ( "lang:" + self.langs[i], self.lang_counts[i] ) )
+		names, tag_series = self.top_tags( top_tags )
+		columns += list( zip( names, tag_series ) )
+		return columns
+
+	def write( self, out_path, top_tags = 10 ):
+		""" Write the time series to a CSV file with one row per bin, or to a NumPy .npz archive with one array per series. """
+		columns = self.series( top_tags )
+		log.info("Writing time series of %d bins to %s ..." % ( self.counts.shape[1], out_path ) )
+		times = self.times()
+		if out_path.lower().endswith(".npz"):
+			arrays = { name : counts for name, counts in columns }
+			arrays["time"] = times.astype("datetime64[s]")
+			with open( out_path, "wb" ) as fout:
+				np.savez( fout, **arrays )
+			return
+		from jsonltools.csvwriter import CsvWriter
+		writer = CsvWriter( out_path, "," )
+		writer.write( [ "Time" ] + [ name for name, counts in columns ] )
+		values = np.stack( [ counts for name, counts in columns ], axis=1 ) if len(times) > 0 else []
+		for t, row in zip( times.tolist(), values ):
+			writer.write( [ format_time( t ) ] + [ str(x) for x in row.tolist() ] )
+		writer.close()
+
+	def report( self, top = 10, window = 24, threshold = 3.0, min_count = 10 ):
+		from prettytable import PrettyTable
+		self.flush()
+		n = self.counts.shape[1]
+		if n == 0:
+			log.info("No tweets with valid times")
+			return
+		times, totals = self.times(), self.counts[0]
+		peak = int( np.argmax( totals ) )
+		log.info("Time series of %d bins of %d seconds from %s to %s UTC, peak of %d tweets at %s" % ( n, self.interval,
+			format_time( times[0] ), format_time( times[-1] + self.interval ), totals[peak], format_time( times[peak] ) ) )
+		names, tag_series = self.top_tags( top )
+		rows = []
+		for name, counts in [ ( "all tweets", totals ) ] + list( zip( names, tag_series ) ):
+			for first, last, burst_peak, z in detect_bursts( counts, window, threshold, min_count ):
+				rows.append( ( name, format_time( times[first] ), format_time( times[last] + self.interval ), int( counts[burst_peak] ), z ) )
+		log.info("Found %d bursts of activity in all tweets and the top %d hashtags:" % ( len(rows), len(names) ) )
+		tab = PrettyTable( ["Series", "Start", "End", "Peak Count", "Z-Score"] )
+		tab.align["Series"] = "l"
+		tab.align["Peak Count"] = "r"
+		tab.align["Z-Score"] = "r"
+		for name, start, end, count, z in heapq.nlargest( top, rows, key=lambda row: row[4] ):
+			tab.add_row( [ name, start, end, count, "%.1f" % z ] )
+		log.info(tab)
+
+def format_time( t ):
+	return time.strftime( "%Y-%m-%d %H:%M:%S", time.gmtime( int(t) ) )
+
+# --------------------------------------------------------------
+
+def add_timeseries_options( parser ):
+	parser.add_option("--timeseries", action="store", type="string", dest="timeseries_path", help="also count tweets in time bins, writing the series to this path as CSV or, with the extension .npz, as NumPy arrays (requires NumPy)", default=None)
+	parser.add_option("--interval", action="store", type="string", dest="interval", help="length of each time bin, in s, m, h or d (default is 1h)", default="1h")
+	parser.add_option("--series-hashtags", action="store", type="int", dest="series_hashtags", help="number of top hashtags to write time series for (default is 10)", default=10)
+	parser.add_option("--burst-window", action="store", type="int", dest="burst_window", help="number of preceding bins which bursts are compared against (default is 24)", default=24)
+	parser.add_option("--burst-threshold", action="store", type="float", dest="burst_threshold", help="z-score above which a bin is part of a burst (default is 3)", default=3.0)
+
+def timeseries_from_options( parser, options ):
+	""" Create a TimeSeriesCounter from the parsed command line options, or None if no time series was requested. """
+	if options.timeseries_path is None:
+		return None
+	try:
+		return TimeSeriesCounter( parse_span( options.interval ) )
+	except ( ValueError, ImportError ) as e:
+		parser.error( str(e) )
@@ -0,0 +1,161 @@
+"""
+Sliding time windows over key counts, such as the hashtags used in the last 5 minutes, hour and
+day. Keys are counted in one bucket per second of tweet time, and each window holds references
+to the buckets it covers, so that when time advances, expired buckets are removed from the oldest
+end of each window and only their keys are decremented. The cost of keeping the windows up to
+date is therefore proportional to the number of new tweets, and the memory used is proportional
+to the number of distinct keys in each second of the longest window.
+
+The windows end at the latest tweet time seen. Tweets which arrive out of order are counted in
+the bucket for their own second, in each of the windows which still covers it, and are left out
+of any window which has already moved past them.
+"""
+import time, re
+from collections import deque, defaultdict, Counter
+import logging as log
+from jsonltools.engine import Aggregator
+from jsonltools.aggregators import top_items
+from jsonltools.timeparse import twitter_epoch
+
+UNITS = { "s" : 1, "m" : 60, "h" : 3600, "d" : 86400 }
+DEFAULT_WINDOWS = "5m,1h,24h"
+
+# --------------------------------------------------------------
+
+def parse_span( s ):
+	""" Convert a window length such as '90s', '5m', '1h' or '7d' to seconds. """
+	m = re.match( r"^\s*(\d+)\s*([smhd]?)\s*$", s )
+	if m is None or int(m.group(1)) == 0:
+		raise ValueError("Invalid window length '%s', expected a number followed by s, m, h or d" % s)
+	return int(m.group(1)) * UNITS[m.group(2) or "s"]
+
+def parse_windows( s ):
+	""" Parse a comma-separated list of window lengths, returning (name, seconds) pairs. """
+	return [ ( x.strip(), parse_span( x ) ) for x in s.split(",") if len(x.strip()) > 0 ]
+
+class Window:
+	def __init__( self, name, span ):
+		self.name, self.span = name, span
+		# buckets in order of time
+		self.buckets = deque()
+		self.counts = defaultdict(int)
+		self.total = 0
+
+	def covers( self, t, now ):
+		return t > now - self.span
+
+	def insert( self, bucket ):
+		""" Add the bucket for a time before the latest one, keeping the buckets in order of time. """
+		buckets, i = self.buckets, len(self.buckets)
+		# out of order tweets are usually only a little late, so the search starts from the newest bucket
+		while i > 0 and buckets[i - 1][0] > bucket[0]:
+			i -= 1
+		buckets.insert( i, bucket )
+
+class SlidingWindows:
+	""" Counts of keys within several sliding windows, ending at the latest time seen. Each bucket
+	is a [time, Counter of keys] pair, shared by all of the windows which cover its time. """
+	def __init__( self, windows ):
+		self.windows = [ Window( name, span ) for name, span in windows ]
+		self.now = None
+		# the bucket which keys are currently added to, or None if its time is outside every window
+		self.bucket = None
+		# time -> bucket, for every bucket in the longest window
+		self.buckets = {}
+		# one shared copy of each key, which is kept until it expires from the longest window
+		self.keys = {}
+		self.longest = max( self.windows, key=lambda window: window.span )
+
+	def advance( self, now ):
+		""" Set the time in seconds since the epoch at which keys are counted. A later time moves the
+		end of the windows forward, evicting expired keys, while an earlier time selects the bucket
+		for that time, if any window still covers it. """
+		if not self.now is None and now <= self.now:
+			self.bucket = self.buckets.get( now )
+			if self.bucket is None and self.longest.covers( now, self.now ):
+				self.bucket = self.buckets[now] = [ now, Counter() ]
+				for window in self.windows:
+					if window.covers( now, self.now ):
+						window.insert( self.bucket )
+			return
+		self.now = now
+		self.bucket = self.buckets[now] = [ now, Counter() ]
+		for window in self.windows:
+			window.buckets.append( self.bucket )
+			self.evict( window )
+
+	def evict( self, window ):
+		cutoff = self.now - window.span
+		buckets, counts = window.buckets, window.counts
+		longest = window is self.longest
+		while len(buckets) > 0 and buckets[0][0] <= cutoff:
+			t, keys = buckets.popleft()
+			if longest:
+				del self.buckets[t]
+			for key, n in keys.items():
+				window.total -= n
+				count = counts[key] - n
+				if count == 0:
+					del counts[key]
+					if longest:
+						del self.keys[key]
+				else:
+					counts[key] = count
+
+	def add( self, key, n = 1 ):
+		""" Count n occurrences of a key at the current time. """
+		bucket = self.bucket
+		if bucket is None:
+			return
+		key = self.keys.setdefault( key, key )
+		bucket[1][key] += n
+		t, now = bucket[0], self.now
+		for window in self.windows:
+			if window.covers( t, now ):
+				window.counts[key] += n
+				window.total += n
+
+# --------------------------------------------------------------
+
+class WindowedCounter(Aggregator):
+	""" Wraps a KeyCounter, such as a HashtagCounter, so that every key it counts is also counted
+	in a set of sliding time windows, based on the creation time of each tweet. """
+	def __init__( self, counter, windows, title = "keys" ):
+		super().__init__()
+		self.counter, self.title = counter, title
+		self.windows = SlidingWindows( windows )
+		self.fields = None if counter.fields is None else counter.fields + ( "created_at", )
+		# the prefilter of the counter is not used, since tweets without any keys still move the windows forward
+		counter.on_count = self.windows.add
+
+	def apply( self, tweet ):
+		self.windows.advance( twitter_epoch( tweet["created_at"] ) )
+		self.counter.apply( tweet )
+
+	def label( self, key ):
+		""" Display a key as its screen name, for counters which keep one. """
+		fields = self.counter.display.get( key )
+		return key if fields is None else "@%s" % fields[0]
+
+	def report_windows( self, top = 10 ):
+		""" Log a table of the top keys in each of the windows. """
+		from prettytable import PrettyTable
+		if self.windows.now is None:
+			log.info("No tweets yet")
+			return
+		end = time.strftime( "%Y-%m-%d %H:%M:%S", time.gmtime( self.windows.now ) )
+		for window in self.windows.windows:
+			sx = top_items( window.counts, top )
+			log.info("Top %d %s in the last %s up to %s UTC (%d in total, %d distinct):" % ( len(sx), self.title, window.name,
+				end, window.total, len(window.counts) ) )
+			tab = PrettyTable( [self.title.capitalize(), "Count"] )
+			tab.align[self.title.capitalize()] = "l"
+			tab.align["Count"] = "r"
+			for key, count in sx:
+				tab.add_row( [ self.label( key ), count ] )
+			log.info(tab)
+
+	def report( self, top = 10 ):
+		# tweets are only counted by this wrapper
+		self.counter.num_tweets, self.counter.num_failed = self.num_tweets, self.num_failed
+		self.counter.report( top )
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the tests, which compare the reports of runs that take a different route
+through the tools, such as reading from a cache or resuming from a checkpoint, with a plain run
+over the same sample tweets.
+"""
+import os, sys, io, shutil
+import logging as log
+import pytest
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+sys.path.insert( 0, ROOT )
+
+from jsonltools.aggregators import REPORTS
+
+SAMPLE_PATH = os.path.join( ROOT, "sample", "sample-tweets-500.jsonl" )
+
+# --------------------------------------------------------------
+
+def new_reports():
+	""" Create one aggregator for each report. """
+	return { name : REPORTS[name]() for name in REPORTS }
+
+def write_lines( path, lines ):
+	""" Write a list of raw lines to a new JSONL file, returning its path. """
+	with open( path, "wb" ) as fout:
+		fout.writelines( lines )
+	return path
+
+def report_text( aggregators, top = 20 ):
+	""" Return the text logged by the report of each aggregator in a dictionary of report names to aggregators. """
+	out = io.StringIO()
+	handler = log.StreamHandler( out )
+	root = log.getLogger()
+	level = root.level
+	root.addHandler( handler )
+	root.setLevel( log.INFO )
+	try:
+		for name in sorted( aggregators ):
+			out.write( "-- %s\n" % name )
+			aggregators[name].report( top )
+	finally:
+		root.removeHandler( handler )
+		root.setLevel( level )
+	return out.getvalue()
+
+# --------------------------------------------------------------
+
+@pytest.fixture
+def sample( tmp_path ):
+	""" A copy of the sample tweets, so that any sidecar files are written to a temporary directory. """
+	path = str( tmp_path / "tweets.jsonl" )
+	shutil.copyfile( SAMPLE_PATH, path )
+	return path
+
+@pytest.fixture
+def sample_lines():
+	with open( SAMPLE_PATH, "rb" ) as fin:
+		return [ l for l in fin if len(l.strip()) > 0 ]
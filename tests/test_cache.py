@@ -0,0 +1,58 @@
+"""
+Reading tweets from the columnar cache should give the same reports as decoding the JSONL file.
+"""
+import os
+import pytest
+from jsonltools.engine import Aggregator, process_file
+from jsonltools.cache import cache_path
+from jsonltools.selection import Selection
+from jsonltools.dedupe import IdSet
+from conftest import new_reports, report_text, write_lines
+
+# --------------------------------------------------------------
+
+def test_cache_round_trip( sample ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	# the first cached run builds the cache while decoding, and the second reads from it
+	for _ in range( 2 ):
+		cached = new_reports()
+		process_file( sample, cached.values(), cache = True )
+		assert os.path.exists( cache_path( sample ) )
+		assert report_text( cached ) == report_text( aggregators )
+
+@pytest.mark.parametrize( "selection", [
+	Selection( langs = { "en" } ),
+	Selection( hashtags = { "#scotus", "#gop" } ),
+	Selection( since = 1460000000, until = 1470000000 ) ] )
+def test_cached_selection_matches_plain_run( sample, selection ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values(), selection = selection )
+	for _ in range( 2 ):
+		cached = new_reports()
+		process_file( sample, cached.values(), selection = selection, cache = True )
+		assert report_text( cached ) == report_text( aggregators )
+
+def test_cached_dedupe_matches_plain_run( sample, sample_lines, tmp_path ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	path = write_lines( str( tmp_path / "duplicated.jsonl" ), sample_lines + sample_lines[:100] )
+	for _ in range( 2 ):
+		cached = new_reports()
+		process_file( path, cached.values(), dedupe = IdSet(), cache = True )
+		assert report_text( cached ) == report_text( aggregators )
+
+class FailingCounter(Aggregator):
+	""" Fails while it holds views of a cached block. """
+	fields = ( "id", "lang" )
+	batched = True
+
+	def apply_batch( self, batch ):
+		codes = batch.column("lang")
+		raise RuntimeError("failed on a block of %d rows" % len(codes))
+
+def test_cache_error_is_not_hidden( sample ):
+	process_file( sample, new_reports().values(), cache = True )
+	assert os.path.exists( cache_path( sample ) )
+	with pytest.raises( RuntimeError, match="failed on a block" ):
+		process_file( sample, [FailingCounter()], cache = True )
@@ -0,0 +1,71 @@
+"""
+A run which is interrupted and resumed from its last checkpoint should give the same report as a
+run which was never interrupted.
+"""
+import os
+from itertools import islice
+import pytest
+from jsonltools.engine import process_file, process_lines
+from jsonltools.aggregators import CooccurrenceCounter
+from jsonltools.checkpoint import Checkpointer, CHECKPOINT_SUBDIR, CHECKPOINT_FILE
+from conftest import report_text, write_lines
+
+# --------------------------------------------------------------
+
+@pytest.mark.parametrize( "max_pairs, approx", [ ( None, 0 ), ( 50, 0 ), ( None, 100 ) ] )
+def test_resumed_run_matches_uninterrupted_run( sample, sample_lines, tmp_path, max_pairs, approx ):
+	# the second file is long enough for a checkpoint part of the way through it
+	inputs = [ sample, write_lines( str( tmp_path / "long.jsonl" ), sample_lines[::-1] * 3 ) ]
+	spill_dir = str( tmp_path )
+	expected = CooccurrenceCounter( max_pairs, approx, spill_dir )
+	for path in inputs:
+		process_file( path, [expected] )
+
+	directory = str( tmp_path / "checkpoints" )
+	counter = CooccurrenceCounter( max_pairs, approx, spill_dir )
+	# with no interval, a checkpoint is made at the end of the first file and after every 1000 lines
+	checkpointer = Checkpointer( directory, inputs, {}, lambda directory : counter.checkpoint_state( directory ), interval = 0 )
+	checkpointer.process_file( 0, inputs[0], [counter] )
+	# the run dies part of the way through the second file, after its first checkpoint
+	process_lines( islice( checkpointer.lines( 1, inputs[1] ), 1200 ), [counter] )
+	assert checkpointer.num_checkpoints == 2
+	counter = None
+
+	checkpointer = Checkpointer( directory, inputs, {}, lambda directory : resumed.checkpoint_state( directory ), interval = 0 )
+	file_index, offset, state = checkpointer.load()
+	assert file_index == 1 and offset > 0
+	resumed = CooccurrenceCounter.from_checkpoint( state )
+	checkpointer.process_file( file_index, inputs[1], [resumed], offset = offset )
+	checkpointer.finish()
+	assert resumed.num_tweets == expected.num_tweets
+	assert resumed.num_multiple == expected.num_multiple
+	assert report_text( { "cooccur" : resumed } ) == report_text( { "cooccur" : expected } )
+
+def test_checkpoint_rejects_changed_inputs( sample, tmp_path ):
+	directory = str( tmp_path / "checkpoints" )
+	counter = CooccurrenceCounter()
+	checkpointer = Checkpointer( directory, [sample], {}, lambda directory : counter.checkpoint_state( directory ), interval = 0 )
+	checkpointer.process_file( 0, sample, [counter] )
+	assert ( tmp_path / "checkpoints" / CHECKPOINT_SUBDIR / CHECKPOINT_FILE ).exists()
+	with pytest.raises( ValueError ):
+		Checkpointer( directory, [sample], { "approx" : 100 }, None ).load()
+	with open( sample, "ab" ) as fout:
+		fout.write( b"\n" )
+	with pytest.raises( ValueError ):
+		Checkpointer( directory, [sample], {}, None ).load()
+
+def test_checkpoint_only_removes_its_own_files( sample, sample_lines, tmp_path ):
+	# the checkpoint directory already holds a file and a directory of the user's
+	( tmp_path / "keep.txt" ).write_text( "keep" )
+	( tmp_path / "data" ).mkdir()
+	path = write_lines( str( tmp_path / "data" / "long.jsonl" ), sample_lines * 5 )
+	counter = CooccurrenceCounter( 50, 0, str( tmp_path / "data" ) )
+	checkpointer = Checkpointer( str( tmp_path ), [path], {}, lambda directory : counter.checkpoint_state( directory ), interval = 0 )
+	checkpointer.process_file( 0, path, [counter] )
+	assert checkpointer.num_checkpoints > 1
+	# the spilled runs linked into the checkpoint are only in its own subdirectory
+	assert len( os.listdir( str( tmp_path / CHECKPOINT_SUBDIR ) ) ) > 1
+	checkpointer.finish()
+	assert ( tmp_path / "keep.txt" ).read_text() == "keep"
+	assert ( tmp_path / "data" / "long.jsonl" ).exists()
+	assert not ( tmp_path / CHECKPOINT_SUBDIR ).exists()
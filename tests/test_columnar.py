@@ -0,0 +1,104 @@
+"""
+Columnar writers should round trip every column type across batches, and a bad value should
+only lose its own row.
+"""
+import os, subprocess, sys
+import pytest
+np = pytest.importorskip("numpy")
+from jsonltools.columnar import NpzWriter, open_writer, load_npz, format_for_path
+from conftest import ROOT
+
+# --------------------------------------------------------------
+
+COLUMNS = [ ( "id", "int64" ), ( "created_at", "timestamp" ), ( "lang", "category" ), ( "text", "string" ) ]
+
+ROWS = [
+	( 793496734553493504, "Tue Nov 01 17:00:00 +0000 2016", "en", "first tweet" ),
+	( 1, 1478019600, "es", "café, 日本" ),
+	( ( 1 << 63 ) - 1, "Thu Jan 01 00:00:00 +0000 1970", None, None ),
+	( -5, 0, "en", "" ),
+]
+
+# each bad row raises, and is not written
+BAD_ROWS = [
+	( 2, 0, "en" ),
+	( "3", 0, "en", "id is a string" ),
+	( 1 << 63, 0, "en", "id out of range" ),
+	( 4, "not a timestamp", "en", "bad time" ),
+	( 5, 0, "en", 123 ),
+	( 6.5, 0, "en", "float id" ),
+]
+
+def test_format_for_path():
+	assert format_for_path( "tweets.npz" ) == "npz"
+	assert format_for_path( "tweets.PARQUET" ) == "parquet" and format_for_path( "t.pq" ) == "parquet"
+	assert format_for_path( "tweets.csv" ) == "csv" and format_for_path( "tweets" ) == "csv"
+	with pytest.raises( ValueError ):
+		open_writer( "tweets.csv", COLUMNS )
+
+def test_unknown_column_type( tmp_path ):
+	with pytest.raises( ValueError ):
+		NpzWriter( str( tmp_path / "t.npz" ), [ ( "id", "float" ) ] )
+
+@pytest.mark.parametrize( "batch_size", [ 1, 3, 1000 ] )
+def test_npz_round_trip( tmp_path, batch_size ):
+	path = str( tmp_path / "tweets.npz" )
+	writer = open_writer( path, COLUMNS, batch_size = batch_size )
+	for row in ROWS:
+		writer.write( row )
+	writer.close()
+	assert writer.num_rows == len(ROWS)
+	columns = load_npz( path )
+	assert list( columns ) == [ name for name, kind in COLUMNS ]
+	assert columns["id"].tolist() == [ row[0] for row in ROWS ]
+	assert columns["created_at"].dtype == np.dtype("datetime64[s]")
+	assert columns["created_at"].astype(np.int64).tolist() == [ 1478019600, 1478019600, 0, 0 ]
+	# missing strings are written as empty ones
+	assert columns["lang"].tolist() == [ "en", "es", "", "en" ]
+	assert columns["text"].tolist() == [ "first tweet", "café, 日本", "", "" ]
+
+@pytest.mark.parametrize( "row", BAD_ROWS )
+def test_bad_row_only_loses_itself( tmp_path, row ):
+	path = str( tmp_path / "tweets.npz" )
+	writer = open_writer( path, COLUMNS, batch_size = 2 )
+	writer.write( ROWS[0] )
+	with pytest.raises( ( ValueError, TypeError, OverflowError ) ):
+		writer.write( row )
+	for good in ROWS[1:]:
+		writer.write( good )
+	writer.close()
+	assert writer.num_rows == len(ROWS)
+	assert load_npz( path )["id"].tolist() == [ good[0] for good in ROWS ]
+
+def test_empty_npz( tmp_path ):
+	path = str( tmp_path / "empty.npz" )
+	open_writer( path, COLUMNS ).close()
+	columns = load_npz( path )
+	assert all( len(column) == 0 for column in columns.values() )
+
+def test_parquet_round_trip( tmp_path ):
+	pytest.importorskip("pyarrow")
+	import pyarrow.parquet
+	path = str( tmp_path / "tweets.parquet" )
+	writer = open_writer( path, COLUMNS, batch_size = 3 )
+	for row in ROWS:
+		writer.write( row )
+	with pytest.raises( TypeError ):
+		writer.write( BAD_ROWS[4] )
+	writer.close()
+	table = pyarrow.parquet.read_table( path )
+	assert table.column("id").to_pylist() == [ row[0] for row in ROWS ]
+	assert table.column("text").to_pylist() == [ "first tweet", "café, 日本", "", "" ]
+
+# --------------------------------------------------------------
+
+def test_export_npz_matches_csv( sample, tmp_path ):
+	csv_path, npz_path = str( tmp_path / "tweets.csv" ), str( tmp_path / "tweets.npz" )
+	for path in ( csv_path, npz_path ):
+		subprocess.run( [ sys.executable, os.path.join( ROOT, "jsonl-tweet-export.py" ), "-o", path, sample ],
+			check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+	ids = list( load_npz( npz_path ).values() )[0]
+	with open( csv_path, encoding = "utf-8" ) as fin:
+		next( fin )
+		csv_ids = [ int( l.split(",")[0].strip('"') ) for l in fin ]
+	assert ids.tolist() == csv_ids and len(csv_ids) > 0
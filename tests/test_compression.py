@@ -0,0 +1,75 @@
+"""
+Compressed input files should be detected from their extension or magic bytes, and give the
+same reports as the uncompressed file, with decompression either in-process or by an external
+command.
+"""
+import os, bz2, gzip, lzma, shutil, subprocess
+import pytest
+from jsonltools import compression
+from jsonltools.compression import detect_compression, iter_compressed_lines, split_lines
+from jsonltools.engine import process_file
+from conftest import new_reports, report_text
+
+# --------------------------------------------------------------
+
+def compress_zstd( data ):
+	if shutil.which("zstd") is None:
+		pytest.skip("the zstd command is not installed")
+	return subprocess.run( ["zstd", "-cq"], input=data, stdout=subprocess.PIPE, check=True ).stdout
+
+COMPRESSORS = { "gzip" : ( ".gz", gzip.compress ), "bz2" : ( ".bz2", bz2.compress ), "xz" : ( ".xz", lambda data : lzma.compress( data, preset = 0 ) ),
+	"zstd" : ( ".zst", compress_zstd ) }
+
+@pytest.fixture( params = [ True, False ], ids = [ "external", "in-process" ] )
+def external( request, monkeypatch ):
+	monkeypatch.setattr( compression, "use_external", request.param )
+	return request.param
+
+def write_compressed( path, data, fmt ):
+	with open( path, "wb" ) as fout:
+		fout.write( COMPRESSORS[fmt][1]( data ) )
+	return path
+
+def test_split_lines():
+	chunks = [ b"ab", b"c\nd", b"\n\n", b"ef\ngh", b"" ]
+	assert list( split_lines( chunks ) ) == [ b"abc", b"d", b"", b"ef", b"gh" ]
+	assert list( split_lines( [ b"a\n" ] ) ) == [ b"a" ]
+	assert list( split_lines( [] ) ) == []
+
+@pytest.mark.parametrize( "fmt", sorted( COMPRESSORS ) )
+def test_detect_compression( sample, tmp_path, fmt ):
+	data = open( sample, "rb" ).read()
+	ext = COMPRESSORS[fmt][0]
+	assert detect_compression( write_compressed( str( tmp_path / ( "tweets.jsonl" + ext ) ), data, fmt ) ) == fmt
+	# without the extension, the format is detected from the magic bytes
+	assert detect_compression( write_compressed( str( tmp_path / "tweets.dat" ), data, fmt ) ) == fmt
+	assert detect_compression( sample ) is None
+
+@pytest.mark.parametrize( "fmt", sorted( COMPRESSORS ) )
+def test_compressed_lines_match( sample, tmp_path, fmt, external ):
+	data = open( sample, "rb" ).read()
+	path = write_compressed( str( tmp_path / ( "tweets.jsonl" + COMPRESSORS[fmt][0] ) ), data, fmt )
+	if fmt == "zstd" and not external:
+		pytest.importorskip("zstandard")
+	assert list( iter_compressed_lines( path, fmt ) ) == data.rstrip(b"\n").split(b"\n")
+
+@pytest.mark.parametrize( "fmt", [ "gzip", "bz2" ] )
+def test_compressed_reports_match( sample, tmp_path, fmt, external ):
+	path = write_compressed( str( tmp_path / "tweets.dat" ), open( sample, "rb" ).read(), fmt )
+	expected = new_reports()
+	process_file( sample, expected.values() )
+	# compressed files are not split between workers
+	aggregators = new_reports()
+	process_file( path, aggregators.values(), workers = 2 )
+	assert report_text( aggregators ) == report_text( expected )
+
+@pytest.mark.parametrize( "fmt", [ "gzip", "xz" ] )
+def test_truncated_file_raises( sample, tmp_path, fmt, external ):
+	data = COMPRESSORS[fmt][1]( open( sample, "rb" ).read() )
+	path = str( tmp_path / ( "tweets.jsonl" + COMPRESSORS[fmt][0] ) )
+	with open( path, "wb" ) as fout:
+		fout.write( data[:len(data) // 2] )
+	with pytest.raises( ( IOError, EOFError, lzma.LZMAError ) ):
+		for _ in iter_compressed_lines( path, fmt ):
+			pass
+	assert os.path.exists( path )
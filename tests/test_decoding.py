@@ -0,0 +1,37 @@
+"""
+Decoding with the line prefilter should give the same reports and failure counts as decoding
+every line.
+"""
+import pytest
+from jsonltools.engine import process_lines
+from jsonltools.decoding import Decoder
+from jsonltools.aggregators import TweetCounter, HashtagCounter, MentionCounter
+from conftest import report_text
+
+# --------------------------------------------------------------
+
+# malformed lines which start and end with braces, and do not match any of the prefilters
+BAD_LINES = [ b'{"id": 1, "text": "no closing quote}', b'{"id": 2,, "lang": "en"}', b'{not json}' ]
+
+def test_prefilter_skips_lines_without_keys():
+	decode = Decoder( [HashtagCounter()], backend = "json" )
+	assert not decode.patterns is None
+	assert decode( b'{"id": 1, "entities": {"hashtags": []}}' ) is None
+	assert decode( b'{"entities": {"hashtags": [{"text": "x"}]}}' ) == { "entities" : { "hashtags" : [ { "text" : "x" } ] } }
+
+@pytest.mark.parametrize( "line", BAD_LINES )
+def test_prefilter_rejects_malformed_lines( line ):
+	decode = Decoder( [HashtagCounter()], backend = "json" )
+	with pytest.raises( ValueError ):
+		decode( line )
+
+def test_prefilter_matches_full_decoding( sample_lines ):
+	lines = sample_lines[:100] + BAD_LINES + sample_lines[100:]
+	runs = []
+	# a TweetCounter has no prefilter, so adding one means that every line is decoded
+	for extra in ( {}, { "stats" : TweetCounter() } ):
+		aggregators = { "hashtags" : HashtagCounter(), "mentions" : MentionCounter() }
+		process_lines( iter(lines), list( aggregators.values() ) + list( extra.values() ) )
+		runs.append( ( report_text( aggregators ), [ ( agg.num_tweets, agg.num_failed ) for agg in aggregators.values() ] ) )
+	assert runs[0] == runs[1]
+	assert runs[0][1] == [ ( len(sample_lines), len(BAD_LINES) ) ] * 2
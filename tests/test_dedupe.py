@@ -0,0 +1,37 @@
+"""
+Skipping duplicate tweets should give the same reports as a run over the tweets without the duplicates.
+"""
+import pytest
+from jsonltools.engine import process_file
+from jsonltools.dedupe import IdSet, ScalableBloomFilter
+from conftest import new_reports, report_text, write_lines
+
+# --------------------------------------------------------------
+
+def new_dedupe( kind ):
+	if kind == "exact":
+		return IdSet()
+	return ScalableBloomFilter( 1e-9, capacity = 1 << 10 )
+
+@pytest.mark.parametrize( "kind", [ "exact", "bloom" ] )
+@pytest.mark.parametrize( "workers", [ 1, 2 ] )
+def test_duplicated_file_matches_plain_run( sample, sample_lines, tmp_path, kind, workers ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	# every tweet appears twice, with the second copies in a different order
+	path = write_lines( str( tmp_path / "duplicated.jsonl" ), sample_lines + sample_lines[::-1] )
+	deduped = new_reports()
+	process_file( path, deduped.values(), workers, dedupe = new_dedupe( kind ) )
+	assert report_text( deduped ) == report_text( aggregators )
+
+@pytest.mark.parametrize( "kind", [ "exact", "bloom" ] )
+def test_duplicates_across_files_match_plain_run( sample, sample_lines, tmp_path, kind ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	# the files overlap, so the second one only adds the tweets which are missing from the first
+	first = write_lines( str( tmp_path / "first.jsonl" ), sample_lines[:300] )
+	second = write_lines( str( tmp_path / "second.jsonl" ), sample_lines[200:] )
+	deduped, dedupe = new_reports(), new_dedupe( kind )
+	for path in ( first, second ):
+		process_file( path, deduped.values(), dedupe = dedupe )
+	assert report_text( deduped ) == report_text( aggregators )
@@ -0,0 +1,89 @@
+"""
+The sparse cooccurrence graph, its binary formats, and the ranking of its edges.
+"""
+import heapq, random
+import numpy as np
+import pytest
+from jsonltools.engine import process_file
+from jsonltools.aggregators import CooccurrenceCounter, top_items
+from jsonltools.pairs import pack_pair
+from jsonltools.graph import SparseGraph, top_indices, load_graph, load_vocab, vocab_path, write_neighbours, EDGE_DTYPE
+from conftest import report_text
+
+# --------------------------------------------------------------
+
+@pytest.fixture
+def counter( sample ):
+	counter = CooccurrenceCounter()
+	process_file( sample, [counter] )
+	return counter
+
+def test_top_indices_break_ties_by_index():
+	rng = random.Random( 1 )
+	for _ in range( 500 ):
+		values = np.array( [ rng.randint( 0, 3 ) for _ in range( rng.randint( 0, 40 ) ) ], dtype=np.uint64 )
+		k = rng.randint( 0, 45 )
+		expected = heapq.nsmallest( k, range( len(values) ), key=lambda i : ( -int( values[i] ), i ) )
+		assert top_indices( values, k ).tolist() == expected
+
+def test_top_edges_match_top_items( counter ):
+	graph = counter.graph()
+	for top in ( 1, 5, 20, 1000 ):
+		edges = [ ( pack_pair( a, b ), count ) for a, b, count in graph.top_edges( top ) ]
+		assert edges == top_items( counter.pairs, top )
+
+@pytest.mark.parametrize( "fmt", [ "npz", "edges" ] )
+def test_report_is_the_same_for_every_format( counter, tmp_path, fmt ):
+	expected = report_text( { "cooccur" : counter } )
+	graph = counter.write( str( tmp_path / ( "pairs." + fmt ) ) )
+	text = report_text( { "cooccur" : counter } )
+	assert text == expected
+	# the report of the written graph ranks the pairs in the same way
+	class GraphReport:
+		def report( self, top ):
+			counter.report( top, graph )
+	assert report_text( { "cooccur" : GraphReport() } ) == expected
+
+def test_npz_round_trip( counter, tmp_path ):
+	path = str( tmp_path / "pairs.npz" )
+	graph = counter.write( path )
+	loaded = load_graph( path )
+	assert loaded.names == counter.tags
+	assert loaded.symmetric and loaded.total == counter.num_tweets
+	assert loaded.num_edges() == counter.num_pairs()
+	for a, b in ( ( loaded.indptr, graph.indptr ), ( loaded.indices, graph.indices ), ( loaded.data, graph.data ) ):
+		assert np.array_equal( a, b )
+	assert loaded.freqs.tolist() == list( counter.tag_counts )
+
+def test_edges_file( counter, tmp_path ):
+	path = str( tmp_path / "pairs.edges" )
+	counter.write( path )
+	edges = np.fromfile( path, dtype=EDGE_DTYPE )
+	names, freqs, ids = load_vocab( vocab_path( path ) )
+	assert ids is None and names == counter.tags
+	pairs = dict( counter.pairs.items() )
+	assert len(edges) == len(pairs)
+	for source, target, weight in edges.tolist():
+		assert source < target and pairs[pack_pair( source, target )] == weight
+
+def test_from_edges_sums_repeated_edges():
+	sources, targets = np.array( [ 0, 1, 0, 2 ], dtype=np.uint32 ), np.array( [ 1, 2, 1, 0 ], dtype=np.uint32 )
+	graph = SparseGraph.from_edges( sources, targets, np.array( [ 1, 2, 3, 4 ], dtype=np.uint64 ), [ "a", "b", "c" ] )
+	assert graph.num_edges() == 3
+	assert sorted( zip( *[ a.tolist() for a in graph.edge_arrays() ] ) ) == [ ( 0, 1, 4 ), ( 1, 2, 2 ), ( 2, 0, 4 ) ]
+	assert graph.weights() is None
+
+def test_weights_and_neighbours( tmp_path ):
+	# a and b always appear together, while c appears with a once
+	graph = SparseGraph.from_edges( np.array( [ 0, 0 ], dtype=np.uint32 ), np.array( [ 1, 2 ], dtype=np.uint32 ),
+		np.array( [ 4, 1 ], dtype=np.uint64 ), [ "a", "b", "c" ], [ 5, 4, 2 ], 10, symmetric = True )
+	pmi, jaccard = graph.weights()
+	first = graph.neighbours( 0, 1 )[0]
+	assert graph.names[graph.indices[first]] == "b"
+	assert jaccard[first] == pytest.approx( 4 / 5 ) and pmi[first] == pytest.approx( np.log2( 4 * 10 / ( 5 * 4 ) ) )
+	path = str( tmp_path / "neighbours.tsv" )
+	write_neighbours( graph, path, 1, ( "Hashtag", "Neighbour" ) )
+	with open( path ) as fin:
+		rows = [ l.rstrip("\n").split("\t") for l in fin ]
+	assert rows[0] == [ "Hashtag", "Neighbour", "Count", "PMI", "Jaccard" ]
+	assert [ row[:3] for row in rows[1:] ] == [ [ "a", "b", "4" ], [ "b", "a", "4" ], [ "c", "a", "1" ] ]
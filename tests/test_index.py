@@ -0,0 +1,57 @@
+"""
+Building and reading the index sidecar files, including lines which cannot be indexed.
+"""
+import json, os
+from jsonltools.index import build_index, open_index, load_postings, index_path
+from jsonltools.timeparse import twitter_epoch
+from conftest import write_lines
+
+# --------------------------------------------------------------
+
+BAD_LINES = [
+	b'{"delete":{"status":{"id":1,"user_id":2}}}\n',
+	b'[1,2,3]\n',
+	b'{"id":"123","created_at":"Wed Aug 27 13:08:45 +0000 2008"}\n',
+	b'{"id":18446744073709551616,"created_at":"Wed Aug 27 13:08:45 +0000 2008"}\n',
+	b'{"id":7,"created_at":"yesterday"}\n',
+	b'{"id":8,"created_at":"Wed Aug 27 13:08:45 +0000 2008","entities":{"hashtags":[5]}}\n',
+	b'not json\n',
+]
+
+def test_index_skips_lines_which_cannot_be_indexed( sample_lines, tmp_path ):
+	# the bad lines are spread between the tweets, so that every offset after them must still be right
+	lines = sample_lines[:100] + BAD_LINES[:4] + sample_lines[100:300] + BAD_LINES[4:] + sample_lines[300:]
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), lines )
+	assert build_index( path, postings = True ) == len(sample_lines)
+	index = open_index( path )
+	try:
+		assert len(index) == len(sample_lines)
+		tweets = [ json.loads( l ) for l in sample_lines ]
+		# every tweet can be read back by id
+		positions = index.positions_for_ids( [ tweets[0]["id"], tweets[250]["id"], tweets[-1]["id"], 123 ] )
+		assert sorted( json.loads( l )["id"] for l in index.iter_positions( positions ) ) == sorted( [ tweets[0]["id"], tweets[250]["id"], tweets[-1]["id"] ] )
+		# and by time, with since inclusive and until exclusive
+		times = sorted( twitter_epoch( tweet["created_at"] ) for tweet in tweets )
+		since, until = times[100], times[400]
+		expected = sum( 1 for t in times if since <= t < until )
+		assert len( index.positions_between( since, until ) ) == expected
+		assert len( index.positions_between() ) == len(sample_lines)
+	finally:
+		index.close()
+	postings = load_postings( path )
+	assert set( postings ) == { "hashtags", "users" }
+	assert sum( len(positions) for positions in postings["users"].values() ) == len(sample_lines)
+
+def test_index_of_only_malformed_ids( tmp_path ):
+	path = write_lines( str( tmp_path / "bad.jsonl" ), [ BAD_LINES[2] ] )
+	assert build_index( path ) == 0
+	index = open_index( path )
+	assert len(index) == 0
+	index.close()
+
+def test_out_of_date_index_is_ignored( sample ):
+	build_index( sample )
+	assert os.path.exists( index_path( sample ) )
+	with open( sample, "ab" ) as fout:
+		fout.write( b"\n" )
+	assert open_index( sample ) is None
@@ -0,0 +1,72 @@
+"""
+Line and byte counts, failure tallies and the JSON summary written by Metrics.
+"""
+import os, json
+import pytest
+from jsonltools.engine import process_file
+from jsonltools.metrics import Metrics, STAGES
+from jsonltools.aggregators import TweetCounter
+from jsonltools.dedupe import IdSet
+from conftest import write_lines
+
+# --------------------------------------------------------------
+
+BAD_LINES = [ b'{"id": 1, "created_at": \n', b'not json at all\n', b'{"id":2,"lang":"en"\n' ]
+
+@pytest.mark.parametrize( "workers", [ 1, 2 ] )
+def test_counts_and_failures( sample_lines, tmp_path, workers ):
+	lines = sample_lines[:200] + BAD_LINES + sample_lines[200:]
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), lines )
+	metrics = Metrics( out_path = str( tmp_path / "metrics.json" ) )
+	counter = TweetCounter()
+	process_file( path, [counter], workers, metrics = metrics )
+	summary = metrics.finish()
+	assert summary["lines"] == len(lines)
+	assert summary["bytes"] == os.path.getsize( path )
+	assert summary["num_failed"] == len(BAD_LINES) == counter.num_failed
+	assert sum( summary["failures"].values() ) == len(BAD_LINES)
+	assert summary["num_duplicates"] == 0
+	assert set( STAGES ) <= set( summary["stages_sec"] ) and "other" in summary["stages_sec"]
+	assert [ ( f["path"], f["lines"], f["bytes"] ) for f in summary["files"] ] == [ ( path, len(lines), os.path.getsize( path ) ) ]
+	# the JSON summary holds the same counts
+	with open( str( tmp_path / "metrics.json" ) ) as fin:
+		written = json.load( fin )
+	for key in ( "lines", "bytes", "failures", "num_failed", "num_duplicates" ):
+		assert written[key] == summary[key]
+
+def test_counts_across_files_and_duplicates( sample_lines, tmp_path ):
+	first = write_lines( str( tmp_path / "first.jsonl" ), sample_lines[:300] )
+	second = write_lines( str( tmp_path / "second.jsonl" ), sample_lines[100:] )
+	metrics, dedupe = Metrics(), IdSet()
+	for path in ( first, second ):
+		process_file( path, [TweetCounter()], metrics = metrics, dedupe = dedupe )
+	summary = metrics.finish()
+	assert summary["lines"] == 300 + len(sample_lines) - 100
+	assert summary["bytes"] == os.path.getsize( first ) + os.path.getsize( second )
+	assert summary["num_duplicates"] == 200
+	assert summary["num_failed"] == 0 and summary["failures"] == {}
+	assert [ f["lines"] for f in summary["files"] ] == [ 300, len(sample_lines) - 100 ]
+
+def test_merge_and_failure_tally():
+	metrics, other = Metrics(), Metrics()
+	metrics.failure( ValueError() )
+	other.failure( ValueError() )
+	other.failure( KeyError() )
+	other.num_lines, other.num_bytes, other.num_duplicates = 10, 1000, 3
+	other.stages["decode"] = 1.5
+	metrics.merge( other )
+	summary = metrics.summary()
+	assert summary["failures"] == { "ValueError" : 2, "KeyError" : 1 }
+	assert summary["num_failed"] == 3
+	assert ( summary["lines"], summary["bytes"], summary["num_duplicates"] ) == ( 10, 1000, 3 )
+	assert summary["stages_sec"]["decode"] >= 1.5
+
+def test_profile_is_written( sample, tmp_path ):
+	profile_path = str( tmp_path / "run.prof" )
+	metrics = Metrics( profile_path = profile_path )
+	metrics.start()
+	process_file( sample, [TweetCounter()], metrics = metrics )
+	metrics.finish()
+	assert os.path.getsize( profile_path ) > 0
+	with open( profile_path + ".txt" ) as fin:
+		assert "Functions by cumulative time" in fin.read()
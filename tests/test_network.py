@@ -0,0 +1,118 @@
+"""
+User networks should count the same edges as a direct pass over the tweets, whether the
+counts are spilled, merged from workers, or written in any of the output formats.
+"""
+import csv, json
+import xml.etree.ElementTree as ET
+from collections import Counter
+import pytest
+from jsonltools.network import NetworkCounter, parse_edge_types, typed_path, network_format_for_path
+from jsonltools.engine import process_file
+from jsonltools.pairs import unpack_pair
+from jsonltools.aggregators import top_items
+from conftest import SAMPLE_PATH
+
+# --------------------------------------------------------------
+
+def expected_edges():
+	""" Count the edges of each type by user id directly from the sample tweets. """
+	edges = { edge_type : Counter() for edge_type in ( "mention", "retweet", "reply" ) }
+	with open( SAMPLE_PATH, "rb" ) as fin:
+		for l in fin:
+			tweet = json.loads( l )
+			source = tweet["user"]["id"]
+			if "retweeted_status" in tweet:
+				edges["retweet"][( source, tweet["retweeted_status"]["user"]["id"] )] += 1
+				continue
+			if not tweet.get("in_reply_to_user_id") is None:
+				edges["reply"][( source, tweet["in_reply_to_user_id"] )] += 1
+			for mention in tweet["entities"]["user_mentions"]:
+				edges["mention"][( source, mention["id"] )] += 1
+	return edges
+
+EXPECTED = expected_edges()
+
+def counted_edges( counter, edge_type ):
+	edges = {}
+	for key, count in counter.edges[edge_type].items():
+		a, b = unpack_pair( key )
+		edges[( counter.ids[a], counter.ids[b] )] = count
+	return edges
+
+@pytest.mark.parametrize( "max_pairs, workers", [ ( None, 1 ), ( 30, 1 ), ( None, 2 ), ( 30, 3 ) ] )
+def test_edges_match( sample, tmp_path, max_pairs, workers ):
+	counter = NetworkCounter( max_pairs = max_pairs, spill_dir = str(tmp_path) )
+	process_file( sample, [counter], workers )
+	for edge_type in EXPECTED:
+		assert counted_edges( counter, edge_type ) == dict( EXPECTED[edge_type] )
+		assert counter.num_edges( edge_type ) == len(EXPECTED[edge_type])
+	assert sum( counter.tweet_counts ) == counter.num_tweets == 500
+
+def test_selected_edge_types( sample ):
+	counter = NetworkCounter( [ "reply" ] )
+	process_file( sample, [counter] )
+	assert list( counter.edges ) == [ "reply" ]
+	assert counted_edges( counter, "reply" ) == dict( EXPECTED["reply"] )
+	with pytest.raises( ValueError ):
+		counter.merge( NetworkCounter( [ "mention" ] ) )
+
+def test_tweets_without_users_are_ignored():
+	counter = NetworkCounter()
+	counter.apply( { "id" : 1, "text" : "no user" } )
+	assert counter.num_users() == 0
+	# a later screen name fills in one which was missing
+	counter.apply( { "user" : { "id" : 5 }, "in_reply_to_user_id" : 6 } )
+	counter.apply( { "user" : { "id" : 6, "screen_name" : "six" }, "in_reply_to_user_id" : 5, "in_reply_to_screen_name" : "five" } )
+	assert counter.names == [ "five", "six" ]
+
+def test_parse_edge_types():
+	assert parse_edge_types( "reply, mention,," ) == [ "reply", "mention" ]
+	with pytest.raises( ValueError ):
+		parse_edge_types( "mention,follow" )
+	assert typed_path( "out/network.npz", "reply" ) == "out/network-reply.npz"
+	assert network_format_for_path( "network.GraphML" ) == "graphml"
+	assert network_format_for_path( "network.tsv" ) == "csv"
+
+# --------------------------------------------------------------
+
+def test_write_edge_list( sample, tmp_path ):
+	counter = NetworkCounter()
+	process_file( sample, [counter] )
+	path = str( tmp_path / "network.csv" )
+	counter.write( path )
+	with open( path, encoding = "utf-8", newline = "" ) as fin:
+		rows = list( csv.reader( fin, delimiter = "\t" ) )
+	assert rows[0] == [ "Source_ID", "Source", "Target_ID", "Target", "Type", "Count" ]
+	written = { edge_type : {} for edge_type in EXPECTED }
+	for row in rows[1:]:
+		written[row[4]][( int( row[0].strip('"') ), int( row[2].strip('"') ) )] = int( row[5] )
+	for edge_type in EXPECTED:
+		assert written[edge_type] == dict( EXPECTED[edge_type] )
+
+def test_write_graphml( tmp_path ):
+	counter = NetworkCounter()
+	counter.apply( { "user" : { "id" : 1, "screen_name" : "a<b>&c" }, "entities" : { "user_mentions" : [ { "id" : 2, "screen_name" : "d\"e" } ] * 2 } } )
+	path = str( tmp_path / "network.graphml" )
+	counter.write( path )
+	ns = { "g" : "http://graphml.graphdrawing.org/xmlns" }
+	graph = ET.parse( path ).getroot().find( "g:graph", ns )
+	nodes = { node.get("id") : node.find( "g:data[@key='screen_name']", ns ).text for node in graph.findall( "g:node", ns ) }
+	assert nodes == { "1" : "a<b>&c", "2" : "d\"e" }
+	edges = [ ( edge.get("source"), edge.get("target"), edge.find( "g:data[@key='weight']", ns ).text ) for edge in graph.findall( "g:edge", ns ) ]
+	assert edges == [ ( "1", "2", "2" ) ]
+
+@pytest.mark.parametrize( "fmt", [ "npz", "edges" ] )
+def test_write_graphs( sample, tmp_path, fmt ):
+	pytest.importorskip("numpy")
+	from jsonltools.graph import load_graph
+	counter = NetworkCounter()
+	process_file( sample, [counter] )
+	path = str( tmp_path / ( "network." + fmt ) )
+	graphs = counter.write( path )
+	for edge_type in EXPECTED:
+		graph = graphs[edge_type]
+		assert graph.num_edges() == len(EXPECTED[edge_type])
+		assert list( graph.top_edges( 5 ) ) == [ unpack_pair( key ) + ( count, ) for key, count in top_items( counter.edges[edge_type], 5 ) ]
+		if fmt == "npz":
+			loaded = load_graph( typed_path( path, edge_type ) )
+			assert loaded.num_edges() == graph.num_edges()
@@ -0,0 +1,58 @@
+"""
+Normalisation of hashtags, screen names and fields, and the bounded table of raw strings.
+"""
+import pytest
+from jsonltools.normalise import fold, fold_hashtag, clean_field, Normaliser
+from jsonltools.engine import process_lines
+from jsonltools.aggregators import HashtagCounter
+
+# --------------------------------------------------------------
+
+VARIANTS = [ "Brexit", "BREXIT", " brexit ", "Ｂｒｅｘｉｔ", "ＢＲＥＸＩＴ" ]
+
+def test_fold():
+	assert { fold( s ) for s in VARIANTS } == { "brexit" }
+	assert fold( "Straße" ) == fold( "STRASSE" ) == "strasse"
+	# folding is idempotent, including for characters which change again under NFKC
+	for s in VARIANTS + [ "ǅemal", "ﬁnance", "Ⅻ", "İstanbul", "ΣΑΣ" ]:
+		assert fold( fold( s ) ) == fold( s )
+
+def test_fold_hashtag():
+	assert fold_hashtag( "Brexit" ) == fold_hashtag( "#Brexit" ) == fold_hashtag( "##BREXIT" ) == "#brexit"
+	# the full-width number sign is the same as # under NFKC
+	assert fold_hashtag( "＃Ｂｒｅｘｉｔ" ) == "#brexit"
+
+def test_clean_field():
+	assert clean_field( "a,b", "," ) == "a b"
+	assert clean_field( "tab\there\nand\r\nnew  lines", "," ) == "tab here and new lines"
+	assert clean_field( "plain text", "\t" ) == "plain text"
+	assert clean_field( "a b c", "," ) == "a b c"
+
+# --------------------------------------------------------------
+
+def test_normaliser_shares_canonical_strings():
+	normaliser = Normaliser( fold_hashtag )
+	values = [ normaliser[s] for s in VARIANTS ]
+	assert values == [ "#brexit" ] * len(VARIANTS)
+	assert all( value is values[0] for value in values )
+	assert len(normaliser) == len(VARIANTS) and len(normaliser.canonical) == 1
+
+def test_normaliser_eviction():
+	normaliser = Normaliser( fold, max_size = 8 )
+	for i in range( 100 ):
+		assert normaliser["Tag%d" % ( i % 20 )] == "tag%d" % ( i % 20 )
+		assert len(normaliser) <= 8
+	# only the canonical strings of the raw strings still held are kept
+	assert set( normaliser.canonical ) == set( normaliser.values() )
+	# raw strings added since the last eviction are still held
+	assert "Tag19" in normaliser
+
+def test_hashtag_variants_counted_together():
+	lines = [ ( '{"id": %d, "entities": {"hashtags": [{"text": "%s"}]}}' % ( i, s ) ).encode() for i, s in enumerate( VARIANTS ) ]
+	counter = HashtagCounter()
+	process_lines( iter(lines), [counter] )
+	assert dict( counter.counts ) == { "#brexit" : len(VARIANTS) }
+
+@pytest.mark.parametrize( "s", [ "", "#", "   " ] )
+def test_empty_hashtags( s ):
+	assert fold_hashtag( s ) == "#"
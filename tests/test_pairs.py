@@ -0,0 +1,62 @@
+"""
+Pair counts held in memory, spilled to disk and pickled should all agree with a plain dict.
+"""
+import os, pickle, random
+from collections import Counter
+import pytest
+from jsonltools import pairs
+from jsonltools.pairs import PairCounter, pack_pair, unpack_pair
+
+# --------------------------------------------------------------
+
+def random_pairs( num, seed = 0 ):
+	rng = random.Random( seed )
+	return [ ( pack_pair( rng.randrange( 200 ), rng.randrange( 200 ) ), rng.choice( ( 1, 1, 1, 3 ) ) ) for _ in range( num ) ]
+
+@pytest.fixture( params = [ "numpy", "python" ] )
+def backend( request, monkeypatch ):
+	if request.param == "python":
+		monkeypatch.setattr( pairs, "np", None )
+	# a small buffer, so that it is reduced many times
+	monkeypatch.setattr( pairs, "PENDING_SIZE", 64 )
+	return request.param
+
+@pytest.mark.parametrize( "max_pairs", [ None, 100, 1 ] )
+def test_counts_match_dict( backend, tmp_path, max_pairs ):
+	expected = Counter()
+	counter = PairCounter( max_pairs, str(tmp_path) )
+	for key, count in random_pairs( 5000 ):
+		counter.add( key, count )
+		expected[key] += count
+	items = list( counter.items() )
+	assert items == sorted( expected.items() )
+	assert len(counter) == len(expected)
+	if not max_pairs is None:
+		assert len(os.listdir( str(tmp_path) )) > 0
+	counter.close()
+	assert os.listdir( str(tmp_path) ) == []
+
+def test_memory_is_bounded( backend, tmp_path ):
+	counter = PairCounter( 100, str(tmp_path) )
+	for key, count in random_pairs( 5000 ):
+		counter.add( key, count )
+		# the buffer is reduced and spilled whenever it reaches the budget
+		assert len(counter.keys) <= 100 and len(counter.memory) <= 2 * 200
+	assert len(counter.runs) > 1
+	counter.close()
+
+def test_pickle_round_trip( backend, tmp_path ):
+	counter = PairCounter( 100, str(tmp_path) )
+	for key, count in random_pairs( 2000 ):
+		counter.add( key, count )
+	restored = pickle.loads( pickle.dumps( counter ) )
+	assert list( restored.items() ) == list( counter.items() )
+	# counts added after restoring are merged with the pickled ones
+	restored.add( pack_pair( 1, 2 ), 5 )
+	before = dict( counter.items() ).get( pack_pair( 1, 2 ), 0 )
+	assert dict( restored.items() )[pack_pair( 1, 2 )] == before + 5
+	counter.close()
+	restored.close()
+
+def test_pack_pair():
+	assert unpack_pair( pack_pair( 7, 0xFFFFFFFF ) ) == ( 7, 0xFFFFFFFF )
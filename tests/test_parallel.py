@@ -0,0 +1,69 @@
+"""
+Splitting a file into byte ranges for worker processes should cover every line exactly once,
+and give the same reports, failures and duplicates as a single process.
+"""
+import pytest
+from jsonltools.engine import process_file
+from jsonltools.parallel import find_shards, iter_range, _shard_ids
+from jsonltools.metrics import Metrics
+from jsonltools.dedupe import IdSet
+from conftest import new_reports, report_text, write_lines
+
+# --------------------------------------------------------------
+
+BAD_LINES = [ b'{"id": 1, "created_at": \n', b'42\n', b'"text"\n', b'{"id": "1234"}\n', b'\n' ]
+
+def shard_lines( path, shards ):
+	return [ l for start, end in shards for l in iter_range( path, start, end ) ]
+
+@pytest.mark.parametrize( "num_shards", [ 1, 2, 3, 7, 1000 ] )
+def test_shards_cover_every_line_once( sample_lines, tmp_path, num_shards ):
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), sample_lines[:50] + BAD_LINES )
+	shards = find_shards( path, num_shards )
+	assert 1 <= len(shards) <= min( num_shards, len(sample_lines[:50] + BAD_LINES) )
+	# the ranges are contiguous, and each starts at the beginning of a line
+	assert shards[0][0] == 0
+	for ( _, end ), ( start, _ ) in zip( shards, shards[1:] ):
+		assert end == start
+	assert shard_lines( path, shards ) == sample_lines[:50] + BAD_LINES
+
+def test_shards_of_long_lines( tmp_path ):
+	# far more ranges than lines, so that most split points fall within the same line
+	lines = [ b"x" * 1000 + b"\n", b"y\n", b"z" * 5000 ]
+	path = write_lines( str( tmp_path / "long.jsonl" ), lines )
+	shards = find_shards( path, 50 )
+	assert len(shards) <= len(lines)
+	assert shard_lines( path, shards ) == lines
+
+def test_shards_of_empty_file( tmp_path ):
+	path = write_lines( str( tmp_path / "empty.jsonl" ), [] )
+	assert find_shards( path, 4 ) == []
+
+def test_shard_ids_skip_lines_without_ids( sample_lines, tmp_path ):
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), BAD_LINES + sample_lines[:20] )
+	ids = list( _shard_ids( ( path, 0, find_shards( path, 1 )[0][1] ) ) )
+	assert ids == sorted( set( ids ) ) and len(ids) > 0
+	assert 1234 not in ids and 42 not in ids
+
+@pytest.mark.parametrize( "workers", [ 2, 4 ] )
+def test_parallel_matches_single_process( sample_lines, tmp_path, workers ):
+	lines = sample_lines[:150] + BAD_LINES + sample_lines[150:]
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), lines )
+	runs = []
+	for num_workers in ( 1, workers ):
+		aggregators, metrics = new_reports(), Metrics()
+		process_file( path, aggregators.values(), num_workers, metrics = metrics )
+		runs.append( ( report_text( aggregators ), metrics.summary()["num_failed"], [ agg.num_failed for agg in aggregators.values() ] ) )
+	assert runs[0] == runs[1]
+
+@pytest.mark.parametrize( "workers", [ 1, 3 ] )
+def test_parallel_dedupe_keeps_first_copy( sample_lines, tmp_path, workers ):
+	# the second half of the file repeats tweets from the first, and from itself
+	lines = sample_lines[:200] + sample_lines[100:300] + sample_lines[250:300]
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), lines )
+	expected = new_reports()
+	process_file( write_lines( str( tmp_path / "unique.jsonl" ), sample_lines[:300] ), expected.values() )
+	aggregators, metrics = new_reports(), Metrics()
+	process_file( path, aggregators.values(), workers, metrics = metrics, dedupe = IdSet() )
+	assert metrics.num_duplicates == len(lines) - 300
+	assert report_text( aggregators ) == report_text( expected )
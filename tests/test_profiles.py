@@ -0,0 +1,85 @@
+"""
+The profile store, which keeps the latest snapshot of each user, and its use in the user reports.
+"""
+import os, json
+import pytest
+from jsonltools.profiles import ProfileStore, ProfileWriter, open_store
+from jsonltools.aggregators import MentionCounter, user_table
+from jsonltools.timeparse import twitter_epoch
+
+# --------------------------------------------------------------
+
+@pytest.fixture
+def snapshots( sample_lines ):
+	""" The author of every sample tweet, seen when the tweet was created, in the order of the file. """
+	tweets = [ json.loads( l ) for l in sample_lines ]
+	return [ ( tweet["user"], twitter_epoch( tweet["created_at"] ) ) for tweet in tweets ]
+
+def build_store( path, snapshots, batch_size ):
+	writer = ProfileWriter( path, batch_size )
+	for user, seen in snapshots:
+		writer.add( user, seen )
+	writer.close()
+
+def read_store( path ):
+	with ProfileStore( path ) as store:
+		return { record["id"] : record for record in store }
+
+def test_latest_snapshot_is_kept( snapshots, tmp_path ):
+	path = str( tmp_path / "users.store" )
+	build_store( path, snapshots, 1000 )
+	records = read_store( path )
+	assert len(records) == len( set( user["id"] for user, seen in snapshots ) )
+	for user_id, record in records.items():
+		seen = [ ( t, user ) for user, t in snapshots if user["id"] == user_id ]
+		assert record["snapshots"] == len(seen)
+		assert record["first_seen"] == min( t for t, user in seen )
+		assert record["last_seen"] == max( t for t, user in seen )
+		latest = max( seen, key=lambda s : s[0] )[1]
+		assert record["followers_count"] == latest["followers_count"]
+		assert record["first_followers_count"] == min( seen, key=lambda s : s[0] )[1]["followers_count"]
+
+def test_runs_are_merged_into_the_store( snapshots, tmp_path ):
+	expected = str( tmp_path / "expected.store" )
+	build_store( expected, snapshots, 1000 )
+	# small batches are written to several runs, which are merged when the writer is closed, and
+	# snapshots added by a later run are merged with the existing store
+	path = str( tmp_path / "users.store" )
+	build_store( path, snapshots[:200], 7 )
+	build_store( path, snapshots[200:], 13 )
+	assert read_store( path ) == read_store( expected )
+	assert sorted( os.listdir( str( tmp_path ) ) ) == [ "expected.store", "users.store" ]
+	with ProfileStore( path ) as store:
+		ids = [ user_id for user_id, data in store.iter_raw() ]
+		assert ids == sorted( ids )
+		for user_id in ids[::10]:
+			assert user_id in store and store.get( user_id )["id"] == user_id
+		assert store.get( -1 ) is None and not -1 in store
+
+def test_empty_store( tmp_path ):
+	path = str( tmp_path / "users.store" )
+	assert open_store( path ) is None
+	ProfileWriter( path ).close()
+	with ProfileStore( path ) as store:
+		assert len(store) == 0 and store.get( 1 ) is None
+
+def test_not_a_store( tmp_path ):
+	path = tmp_path / "users.store"
+	path.write_bytes( b"x" * 64 )
+	with pytest.raises( ValueError ):
+		ProfileStore( str( path ) )
+
+def test_names_are_kept_for_users_missing_from_the_store( tmp_path ):
+	path = str( tmp_path / "users.store" )
+	writer = ProfileWriter( path )
+	writer.add( { "id" : 1, "screen_name" : "latest", "name" : "Latest Name", "followers_count" : 10 } )
+	writer.close()
+	counter = MentionCounter()
+	mentions = [ { "id" : 1, "screen_name" : "old", "name" : "Old Name" }, { "id" : 2, "screen_name" : "missing", "name" : "Missing User" } ]
+	counter.apply( { "entities" : { "user_mentions" : mentions } } )
+	with ProfileStore( path ) as store:
+		num_users, tab = user_table( counter.counts, counter.display, 10, store )
+	rows = { row[1] : row for row in tab.rows }
+	assert num_users == 2
+	assert rows["1"] == [ "latest", "1", "Latest Name", 1, 10 ]
+	assert rows["2"] == [ "missing", "2", "Missing User", 1, "" ]
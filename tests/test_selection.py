@@ -0,0 +1,107 @@
+"""
+Selections should never skip a line from its raw bytes which the decoded tweet would match,
+and should give the same tweets with and without an index, and from jsonl-tweet-filter.py.
+"""
+import os, json, subprocess, sys
+import pytest
+from jsonltools.selection import Selection, parse_date, parse_list, parse_ids
+from jsonltools.engine import process_file
+from jsonltools.index import build_index
+from jsonltools.aggregators import TweetCounter
+from conftest import ROOT, SAMPLE_PATH, new_reports, report_text, write_lines
+
+# --------------------------------------------------------------
+
+def sample_tweets():
+	with open( SAMPLE_PATH, "rb" ) as fin:
+		return [ json.loads( l ) for l in fin ]
+
+def selections():
+	tweets = sample_tweets()
+	ids = { tweets[i]["id"] for i in ( 0, 10, 499 ) }
+	users = { tweets[i]["user"]["id"] for i in ( 1, 2, 3 ) }
+	return {
+		"since" : Selection( since = parse_date( "2016-06-01" ) ),
+		"window" : Selection( since = parse_date( "2016-03-01" ), until = parse_date( "2016-07-01 12:00" ) ),
+		"ids" : Selection( ids = ids ),
+		"lang" : Selection( langs = [ "ES", "fr" ] ),
+		"users" : Selection( users = users ),
+		# hashtags are matched ignoring case
+		"hashtags" : Selection( hashtags = [ "#SCOTUS", "gopdebate" ] ),
+		"keywords" : Selection( keywords = [ "Trump", "health care" ] ),
+		# keywords which may be escaped in the raw bytes are only checked after decoding
+		"escaped" : Selection( keywords = [ "’s", "\"" ] ),
+		"many_keywords" : Selection( keywords = [ "word%d" % i for i in range( 20 ) ] + [ "senate" ] ),
+		"combined" : Selection( since = parse_date( "2016-01-01" ), langs = [ "en" ], hashtags = [ "#gop" ] ),
+	}
+
+SELECTIONS = selections()
+
+@pytest.mark.parametrize( "name", sorted( SELECTIONS ) )
+def test_candidate_never_skips_a_match( sample_lines, name ):
+	selection = SELECTIONS[name]
+	num_accepted = num_candidates = 0
+	for l in sample_lines:
+		l = l.strip()
+		accepted = selection.accepts( json.loads( l ) )
+		candidate = selection.candidate( l )
+		assert candidate or not accepted
+		num_accepted += accepted
+		num_candidates += candidate
+	assert num_accepted > 0
+	# the raw checks skip some lines, other than for the time window, which cannot be checked
+	if not name in ( "since", "window", "escaped" ):
+		assert num_candidates < len(sample_lines)
+
+def test_candidate_leaves_malformed_lines_to_fail():
+	selection = SELECTIONS["lang"]
+	assert selection.candidate( b'{"lang": "en", "id": ' )
+	assert selection.candidate( b'not json' )
+	assert not selection.candidate( b'{"lang": "en"}' )
+
+@pytest.mark.parametrize( "name", sorted( SELECTIONS ) )
+@pytest.mark.parametrize( "indexed", [ False, True ] )
+def test_selected_reports_match( sample, sample_lines, tmp_path, name, indexed ):
+	selection = SELECTIONS[name]
+	expected = new_reports()
+	selected = [ l for l in sample_lines if selection.accepts( json.loads( l ) ) ]
+	process_file( write_lines( str( tmp_path / "selected.jsonl" ), selected ), expected.values() )
+	if indexed:
+		build_index( sample, postings = True )
+	aggregators = new_reports()
+	process_file( sample, aggregators.values(), selection = selection )
+	assert report_text( aggregators ) == report_text( expected )
+
+def test_selection_counts_failures( sample_lines, tmp_path ):
+	lines = sample_lines[:10] + [ b'{"lang": "es", "id": 1\n', b'not json\n' ]
+	counter = TweetCounter()
+	process_file( write_lines( str( tmp_path / "tweets.jsonl" ), lines ), [counter], selection = SELECTIONS["lang"] )
+	assert counter.num_failed == 2
+
+# --------------------------------------------------------------
+
+def test_parse_options( tmp_path ):
+	assert parse_date( "1970-01-02" ) == 86400
+	assert parse_date( " 1970-01-01T00:01:05 " ) == 65
+	with pytest.raises( ValueError ):
+		parse_date( "01/02/2016" )
+	path = tmp_path / "values.txt"
+	path.write_text( "a\n\n b \n", encoding = "utf-8" )
+	assert parse_list( "@" + str(path) ) == [ "a", "b" ]
+	assert parse_list( "x, y,,z" ) == [ "x", "y", "z" ]
+	assert parse_ids( "1,2, 3" ) == { 1, 2, 3 }
+	with pytest.raises( ValueError ):
+		parse_ids( "1,two" )
+
+def test_filter_script( sample, sample_lines, tmp_path ):
+	selection = SELECTIONS["combined"]
+	out_path = str( tmp_path / "out.jsonl" )
+	subprocess.run( [ sys.executable, os.path.join( ROOT, "jsonl-tweet-filter.py" ), "--since", "2016-01-01", "--lang", "en",
+		"--hashtags", "#gop", "-o", out_path, sample ], check = True, stderr = subprocess.DEVNULL )
+	with open( out_path, "rb" ) as fin:
+		ids = [ json.loads( l )["id"] for l in fin ]
+	assert ids == [ json.loads( l )["id"] for l in sample_lines if selection.accepts( json.loads( l ) ) ]
+	# a bad option is reported as a command line error
+	result = subprocess.run( [ sys.executable, os.path.join( ROOT, "jsonl-tweet-filter.py" ), "--since", "yesterday", sample ],
+		stdout = subprocess.DEVNULL, stderr = subprocess.PIPE )
+	assert result.returncode == 2 and b"Cannot parse date" in result.stderr
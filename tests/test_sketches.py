@@ -0,0 +1,132 @@
+"""
+The Space-Saving and HyperLogLog sketches should stay within their error bounds, including
+after merging, and the approximate reports should agree with the exact ones within them.
+"""
+import random
+from collections import Counter
+import pytest
+from jsonltools.sketches import SpaceSaving, HyperLogLog, hash64
+from jsonltools.engine import process_file
+from jsonltools.aggregators import HashtagCounter, MentionCounter, CooccurrenceCounter
+
+# --------------------------------------------------------------
+
+def zipf_stream( num, num_keys, seed ):
+	""" A skewed stream of keys, where a few keys are very frequent. """
+	rng = random.Random( seed )
+	weights = [ 1.0 / ( rank + 1 ) for rank in range( num_keys ) ]
+	return rng.choices( range( num_keys ), weights = weights, k = num )
+
+def check_bounds( sketch, stream ):
+	true = Counter( stream )
+	assert sketch.total == len(stream)
+	assert len(sketch) <= sketch.capacity
+	for key, count in sketch.items():
+		# counts overestimate by at most the recorded error, which is at most total/capacity
+		assert count - sketch.error( key ) <= true[key] <= count
+		assert sketch.error( key ) <= len(stream) / sketch.capacity
+	# every key more frequent than total/capacity is tracked
+	for key, count in true.items():
+		if count > len(stream) / sketch.capacity:
+			assert key in sketch.counts
+
+@pytest.mark.parametrize( "capacity", [ 1, 10, 100 ] )
+def test_space_saving_bounds( capacity ):
+	stream = zipf_stream( 20000, 2000, capacity )
+	sketch = SpaceSaving( capacity )
+	for key in stream:
+		sketch.add( key )
+	check_bounds( sketch, stream )
+
+def test_space_saving_weighted_add_and_evictions():
+	sketch = SpaceSaving( 2 )
+	assert sketch.add( "a", 5 ) is None and sketch.add( "b" ) is None
+	# the key with the smallest count makes room for the new one
+	assert sketch.add( "c", 2 ) == "b"
+	assert dict( sketch.items() ) == { "a" : 5, "c" : 3 } and sketch.error( "c" ) == 1
+	assert sketch.error( "b" ) == 0 and sketch.total == 8
+
+def test_space_saving_merge():
+	first, second = zipf_stream( 10000, 1000, 1 ), zipf_stream( 10000, 1000, 2 )
+	sketch, other = SpaceSaving( 50 ), SpaceSaving( 50 )
+	for key in first:
+		sketch.add( key )
+	for key in second:
+		other.add( key )
+	sketch.merge( other )
+	stream = first + second
+	check_bounds( sketch, stream )
+	# the most frequent keys are still tracked
+	for key, _ in Counter( stream ).most_common( 5 ):
+		assert key in sketch.counts
+	# and the merged sketch can still be added to
+	sketch.add( "new", 3 )
+	check_bounds( sketch, stream + [ "new" ] * 3 )
+
+def test_space_saving_for_error():
+	assert SpaceSaving.for_error( 0.001 ).capacity == 1000
+
+# --------------------------------------------------------------
+
+def test_hash64_is_stable():
+	assert hash64( 12345 ) == hash64( 12345 ) and hash64( "#scotus" ) == hash64( "#scotus" )
+	assert hash64( 1 ) != hash64( 2 ) and hash64( "1" ) != hash64( 1 )
+	assert 0 <= hash64( "x" ) < 1 << 64 and 0 <= hash64( -1 ) < 1 << 64
+
+@pytest.mark.parametrize( "num", [ 0, 10, 1000, 100000 ] )
+def test_hyperloglog_estimate( num ):
+	sketch = HyperLogLog( 12 )
+	for key in range( num ):
+		sketch.add( key )
+		# repeated keys do not change the estimate
+		sketch.add( key )
+	# within four standard errors
+	assert abs( sketch.estimate() - num ) <= 4 * 1.04 / 64 * max( num, 1 )
+
+def test_hyperloglog_merge():
+	a, b, union = HyperLogLog( 12 ), HyperLogLog( 12 ), HyperLogLog( 12 )
+	for key in range( 30000 ):
+		( a if key % 3 else b ).add( "key%d" % key )
+		union.add( "key%d" % key )
+	a.merge( b )
+	assert a.registers == union.registers
+	with pytest.raises( ValueError ):
+		a.merge( HyperLogLog( 10 ) )
+
+def test_hyperloglog_precision():
+	with pytest.raises( ValueError ):
+		HyperLogLog( 3 )
+	with pytest.raises( ValueError ):
+		HyperLogLog( 19 )
+	assert HyperLogLog.for_error( 0.01 ).precision == 14
+	assert HyperLogLog.for_error( 1e-9 ).precision == 18
+
+# --------------------------------------------------------------
+
+@pytest.mark.parametrize( "cls", [ HashtagCounter, MentionCounter ] )
+@pytest.mark.parametrize( "workers", [ 1, 2 ] )
+def test_approx_counts_within_error( sample, cls, workers ):
+	exact, approx = cls(), cls( approx = True, error = 0.01 )
+	process_file( sample, [exact] )
+	process_file( sample, [approx], workers )
+	assert approx.num_tweets == exact.num_tweets
+	bound = 0.01 * approx.counts.total
+	assert approx.counts.total == sum( exact.counts.values() )
+	for key, count in approx.counts.items():
+		assert exact.counts[key] <= count <= exact.counts[key] + bound
+	# the estimated number of distinct keys is within four standard errors
+	num_distinct = exact.num_distinct()
+	assert abs( approx.num_distinct() - num_distinct ) <= 4 * 0.01 * num_distinct + 1
+	# display fields are only kept for the tracked keys
+	assert set( approx.display ) <= set( approx.counts.counts )
+
+@pytest.mark.parametrize( "workers", [ 1, 2 ] )
+def test_approx_pairs_within_error( sample, workers ):
+	exact, approx = CooccurrenceCounter(), CooccurrenceCounter( approx = 100 )
+	process_file( sample, [exact] )
+	process_file( sample, [approx], workers )
+	exact_counts = { ( a, b ) : count for a, b, count in exact.iter_pairs( exact.pairs.items() ) }
+	bound = approx.pairs.total / 100
+	assert approx.pairs.total == sum( exact_counts.values() )
+	for a, b, count in approx.iter_pairs( approx.pairs.items() ):
+		assert exact_counts[( a, b )] <= count <= exact_counts[( a, b )] + bound
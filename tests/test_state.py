@@ -0,0 +1,56 @@
+"""
+Saving and merging aggregate state should give the same reports as a single run over all of the tweets.
+"""
+import os, sys, gzip, pickle, subprocess
+import pytest
+from jsonltools.engine import process_file
+from jsonltools.state import save_state, load_state, merge_states
+from conftest import ROOT, new_reports, report_text, write_lines
+
+# --------------------------------------------------------------
+
+def test_state_round_trip( sample, tmp_path ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	state_path = str( tmp_path / "state.pkl.gz" )
+	save_state( state_path, aggregators )
+	assert report_text( load_state( state_path ) ) == report_text( aggregators )
+
+def test_merged_state_matches_single_run( sample, sample_lines, tmp_path ):
+	aggregators = new_reports()
+	process_file( sample, aggregators.values() )
+	# split the tweets into uneven parts, each of which is saved to its own state file
+	state_paths = []
+	for i, ( start, end ) in enumerate( [ ( 0, 100 ), ( 100, 350 ), ( 350, len(sample_lines) ) ] ):
+		part = new_reports()
+		process_file( write_lines( str( tmp_path / ( "part%d.jsonl" % i ) ), sample_lines[start:end] ), part.values() )
+		state_paths.append( str( tmp_path / ( "part%d.pkl.gz" % i ) ) )
+		save_state( state_paths[-1], part )
+	merged = merge_states( state_paths, list(aggregators) )
+	assert report_text( merged ) == report_text( aggregators )
+
+def test_files_which_are_not_state_files( sample, tmp_path ):
+	not_gzip = write_lines( str( tmp_path / "not-gzip.state" ), [ b"not a state file\n" ] )
+	garbage = str( tmp_path / "garbage.state" )
+	with gzip.open( garbage, "wb" ) as fout:
+		fout.write( b"\x80\x04garbage" * 10 )
+	other = str( tmp_path / "other.state" )
+	with gzip.open( other, "wb" ) as fout:
+		pickle.dump( [ 1, 2, 3 ], fout )
+	for path in ( not_gzip, garbage, other ):
+		with pytest.raises( ValueError ):
+			load_state( path )
+	with pytest.raises( FileNotFoundError ):
+		load_state( str( tmp_path / "missing.state" ) )
+	# a state file without the requested report
+	state_path = str( tmp_path / "hashtags.state" )
+	save_state( state_path, { "hashtags" : new_reports()["hashtags"] } )
+	with pytest.raises( ValueError ):
+		merge_states( [ state_path ], [ "authors" ] )
+
+@pytest.mark.parametrize( "script", [ "jsonl-tweet-hashtags.py", "jsonl-tweet-report.py" ] )
+def test_scripts_report_bad_state_files( tmp_path, script ):
+	path = write_lines( str( tmp_path / "bad.state" ), [ b"not a state file\n" ] )
+	result = subprocess.run( [ sys.executable, os.path.join( ROOT, script ), "--merge-state", path ], stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+	assert result.returncode == 2
+	assert b"is not a readable state file" in result.stderr and not b"Traceback" in result.stderr
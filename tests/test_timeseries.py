@@ -0,0 +1,86 @@
+"""
+Time series of tweet counts, including batches in which no tweet has a valid time.
+"""
+import json
+from collections import defaultdict, Counter
+import pytest
+np = pytest.importorskip("numpy")
+from jsonltools.engine import process_file
+from jsonltools.timeseries import TimeSeriesCounter, BATCH_SIZE
+from jsonltools.timeparse import twitter_epoch
+from jsonltools.normalise import fold_hashtag
+from conftest import write_lines
+
+# --------------------------------------------------------------
+
+def without_times( sample_lines ):
+	lines = []
+	for l in sample_lines:
+		tweet = json.loads( l )
+		del tweet["created_at"]
+		lines.append( ( json.dumps( tweet ) + "\n" ).encode() )
+	return lines
+
+def test_empty_batch():
+	counter = TimeSeriesCounter()
+	empty = np.zeros( 0, dtype=np.int64 )
+	counter.add_epochs( empty, None, empty.astype(np.int8), empty, empty, empty )
+	counter.flush()
+	assert counter.start is None and counter.counts.shape == ( 3, 0 )
+	counter.report()
+
+def test_batch_without_valid_times():
+	counter = TimeSeriesCounter( batch_size = 4 )
+	for i in range( 10 ):
+		counter.apply( { "created_at" : "not a time %d" % i, "lang" : "en", "entities" : { "hashtags" : [ { "text" : "tag" } ] } } )
+		counter.num_tweets += 1
+	counter.flush()
+	assert counter.num_tweets == 0 and counter.num_failed == 10
+	assert counter.counts.shape == ( 3, 0 )
+	assert len(counter.tag_bins) == 0
+
+def test_cached_tweets_without_times( sample_lines, tmp_path ):
+	path = write_lines( str( tmp_path / "tweets.jsonl" ), without_times( sample_lines ) )
+	# the first run builds the cache, and the second reads its blocks, none of which has a time
+	for _ in range( 2 ):
+		counter = TimeSeriesCounter()
+		process_file( path, [counter], cache = True )
+		assert counter.num_tweets == 0 and counter.num_failed == len(sample_lines)
+		assert len( counter.times() ) == 0
+
+# --------------------------------------------------------------
+
+def expected_series( sample_lines, interval ):
+	""" Count the tweets, retweets, replies, languages and hashtags in each bin directly. """
+	series = defaultdict( Counter )
+	for l in sample_lines:
+		tweet = json.loads( l )
+		b = twitter_epoch( tweet["created_at"] ) // interval * interval
+		series["total"][b] += 1
+		series["retweets"][b] += "retweeted_status" in tweet
+		series["replies"][b] += not tweet.get("in_reply_to_user_id") is None
+		series["lang:" + tweet["lang"]][b] += 1
+		for tag in { fold_hashtag( tag["text"] ) for tag in tweet["entities"]["hashtags"] }:
+			series[tag][b] += 1
+	return series
+
+@pytest.mark.parametrize( "interval, batch_size, workers", [ ( 3600, BATCH_SIZE, 1 ), ( 86400, 7, 1 ), ( 86400 * 7, 50, 2 ) ] )
+def test_series_match_direct_counts( sample, sample_lines, interval, batch_size, workers ):
+	counter = TimeSeriesCounter( interval, batch_size )
+	process_file( sample, [counter], workers )
+	expected = expected_series( sample_lines, interval )
+	# the last batch is binned by series()
+	columns = counter.series( top_tags = 5 )
+	times = counter.times().tolist()
+	assert times[0] == min( expected["total"] ) and times[-1] == max( expected["total"] )
+	for name, counts in columns:
+		assert { t : c for t, c in zip( times, counts.tolist() ) if c > 0 } == { t : c for t, c in expected[name].items() if c > 0 }
+	names = [ name for name, counts in columns ]
+	assert names[:3] == [ "total", "retweets", "replies" ] and names[3] == "lang:en"
+	# the top hashtags are those in the most tweets
+	totals = sorted( ( sum( expected[name].values() ) for name in expected if name.startswith("#") ), reverse = True )
+	assert [ int( counts.sum() ) for name, counts in columns[-5:] ] == totals[:5]
+
+def test_merge_different_intervals():
+	with pytest.raises( ValueError ):
+		TimeSeriesCounter( 3600 ).merge( TimeSeriesCounter( 60 ) )
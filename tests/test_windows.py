@@ -0,0 +1,111 @@
+"""
+Sliding time windows for --follow, including tweets which arrive out of order.
+"""
+import os, random, time
+from collections import Counter
+import pytest
+from jsonltools.engine import process_lines
+from jsonltools.aggregators import HashtagCounter
+from jsonltools.windows import SlidingWindows, WindowedCounter, parse_span, parse_windows
+from jsonltools.follow import follow_lines, Refresher, ticking
+
+# --------------------------------------------------------------
+
+def tweet_time( t ):
+	return time.strftime( "%a %b %d %H:%M:%S +0000 %Y", time.gmtime( t ) )
+
+def test_parse_windows():
+	assert parse_span( "90s" ) == 90 and parse_span( "5m" ) == 300 and parse_span( "2h" ) == 7200 and parse_span( "7d" ) == 604800
+	assert parse_span( " 45 " ) == 45
+	assert parse_windows( "5m, 1h,,24h" ) == [ ( "5m", 300 ), ( "1h", 3600 ), ( "24h", 86400 ) ]
+	for s in ( "", "0m", "5w", "-5m", "m" ):
+		with pytest.raises( ValueError ):
+			parse_span( s )
+
+def test_windows_match_brute_force_counts():
+	spans = [ ( "10s", 10 ), ( "1m", 60 ), ( "5m", 300 ) ]
+	windows = SlidingWindows( spans )
+	rng = random.Random( 7 )
+	events, now = [], None
+	t = 1000000
+	for step in range( 3000 ):
+		# mostly moving forward, with some tweets which are a little or a long way late
+		t += rng.choice( [ 0, 0, 1, 1, 2, 5 ] )
+		arrival = t - rng.choice( [ 0 ] * 8 + [ 3, 30, 400 ] )
+		keys = [ rng.choice( "abcdefgh" ) for _ in range( rng.randint( 0, 3 ) ) ]
+		windows.advance( arrival )
+		for key in keys:
+			windows.add( key )
+		now = arrival if now is None else max( now, arrival )
+		events += [ ( arrival, key ) for key in keys ]
+		assert windows.now == now
+		if step % 50 == 0:
+			for window in windows.windows:
+				expected = Counter( key for event_time, key in events if event_time > now - window.span )
+				assert dict( window.counts ) == dict( expected )
+				assert window.total == sum( expected.values() )
+	# each bucket only holds its distinct keys, and the buckets of every window are in order of time
+	for window in windows.windows:
+		times = [ bucket[0] for bucket in window.buckets ]
+		assert times == sorted( times ) and len( set( times ) ) == len(times)
+		assert all( len(bucket[1]) <= 8 for bucket in window.buckets )
+	assert set( windows.keys ) == set( windows.longest.counts )
+
+def test_tweets_before_every_window_are_not_counted():
+	windows = SlidingWindows( [ ( "1m", 60 ) ] )
+	windows.advance( 1000 )
+	windows.add( "a", 3 )
+	windows.advance( 900 )
+	windows.add( "b" )
+	assert dict( windows.windows[0].counts ) == { "a" : 3 } and windows.now == 1000
+	windows.advance( 2000 )
+	assert len( windows.windows[0].counts ) == 0 and windows.windows[0].total == 0 and len( windows.keys ) == 0
+
+def test_tweets_without_keys_move_the_windows_forward():
+	counter = HashtagCounter()
+	windowed = WindowedCounter( counter, [ ( "1m", 60 ) ], "hashtags" )
+	assert windowed.prefilter is None
+	lines = [ ( '{"created_at":"%s","entities":{"hashtags":[{"text":"Old"}]}}' % tweet_time( 1000 ) ).encode(),
+		( '{"created_at":"%s","entities":{"hashtags":[]}}' % tweet_time( 1100 ) ).encode() ]
+	process_lines( lines, [windowed] )
+	assert windowed.windows.now == 1100
+	assert len( windowed.windows.windows[0].counts ) == 0
+	assert counter.counts["#old"] == 1 and windowed.num_tweets == 2
+
+# --------------------------------------------------------------
+
+class Stop(Exception):
+	pass
+
+def test_follow_lines( tmp_path ):
+	path = str( tmp_path / "tweets.jsonl" )
+	with open( path, "wb" ) as fout:
+		fout.write( b"a\nb" )
+	def append():
+		with open( path, "ab" ) as fout:
+			fout.write( b"c\nd\n" )
+	def truncate():
+		with open( path, "wb" ) as fout:
+			fout.write( b"e\n" )
+	def replace():
+		with open( path + ".new", "wb" ) as fout:
+			fout.write( b"f\ng\n" )
+		os.replace( path + ".new", path )
+	def stop():
+		raise Stop()
+	actions = [ append, truncate, replace, stop ]
+	lines = []
+	with pytest.raises( Stop ):
+		for l in follow_lines( path, poll = 0, idle = lambda: actions.pop(0)() ):
+			lines.append( l )
+	# a partial line is only yielded once its newline has been written
+	assert lines == [ b"a\n", b"bc\n", b"d\n", b"e\n", b"f\n", b"g\n" ]
+
+def test_refresher():
+	calls = []
+	refresher = Refresher( 0, lambda: calls.append( 1 ) )
+	assert list( ticking( [ b"x", b"y" ], refresher ) ) == [ b"x", b"y" ]
+	assert len(calls) == 2
+	refresher = Refresher( 3600, lambda: calls.append( 1 ) )
+	list( ticking( [ b"x", b"y" ], refresher ) )
+	assert len(calls) == 2